@@ -0,0 +1,286 @@
+import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lib.awsRetry import client_call
+from lib.awsSession import get_client
+from top_cpu_connection import cluster_cache, get_metric_series, _cluster_cache_key
+
+CPU_METRIC = 'CPUUtilization'
+CONNECTIONS_METRIC = 'DatabaseConnections'
+
+def _epochs(timestamps, cache: Dict) -> np.ndarray:
+    # instances fetched together share one time grid : convert it once
+    if not timestamps:
+        return np.empty(0, dtype=np.int64)
+    key = (len(timestamps), timestamps[0], timestamps[-1])
+    cached = cache.get(key)
+    if cached is not None and cached[0] == timestamps:
+        return cached[1]
+    epochs = np.fromiter((int(timestamp.timestamp()) if hasattr(timestamp, 'timestamp') else int(timestamp)
+                          for timestamp in timestamps), dtype=np.int64, count=len(timestamps))
+    cache[key] = (timestamps, epochs)
+    return epochs
+
+def series_to_matrix(series: Dict, metric: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Align one metric of every instance on a common time axis.
+
+    Args:
+        series (Dict): get_metric_series result {instance_id: {metric: {'Timestamps', 'Values'}}}
+        metric (str): Metric name
+
+    Returns:
+        (instance_ids, epochs int64 [T], values float64 [N, T]); missing points are NaN
+    """
+    instance_ids = list(series)
+    cache = {}
+    columns = [_epochs(series[instance_id][metric]['Timestamps'], cache) for instance_id in instance_ids]
+    # union of the distinct grids only, not of every instance's copy
+    distinct = list({id(column): column for column in columns}.values())
+    epochs = np.unique(np.concatenate(distinct)) if distinct else np.empty(0, dtype=np.int64)
+    values = np.full((len(instance_ids), len(epochs)), np.nan)
+    for row, (instance_id, column) in enumerate(zip(instance_ids, columns)):
+        if len(column) == len(epochs):
+            values[row] = series[instance_id][metric]['Values']
+        else:
+            values[row, np.searchsorted(epochs, column)] = series[instance_id][metric]['Values']
+    return instance_ids, epochs, values
+
+def row_percentiles(values: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """
+    NaN-aware percentiles (linear interpolation) of every row at once : [len(percentiles), rows].
+
+    np.nanpercentile falls back to one Python-level call per row when NaNs are
+    present; sorting pushes NaNs to the end of each row so the ranks can be
+    computed from each row's valid count instead. All-NaN rows give NaN.
+    """
+    ordered = np.sort(values, axis=1)
+    n = (~np.isnan(values)).sum(axis=1)
+    positions = np.asarray(percentiles, dtype=np.float64)[:, None] / 100 * np.maximum(n - 1, 0)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(n - 1, 0))
+    rows = np.arange(values.shape[0])
+    low_values = ordered[rows, lower]
+    high_values = ordered[rows, upper]
+    result = low_values + (high_values - low_values) * (positions - lower)
+    result[:, n == 0] = np.nan
+    return result
+
+def rolling_zscore(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    z-score of every point against the mean/std of the window points before it, per row (NaN-aware).
+
+    Points with fewer than 2 valid points in their window, or a flat window, get NaN.
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    def trailing_sums(x):
+        # sum over [max(0, t - window), t) for every t, from one cumulative sum
+        cumulative = np.zeros((x.shape[0], x.shape[1] + 1))
+        np.cumsum(x, axis=1, out=cumulative[:, 1:])
+        sums = cumulative[:, :-1].copy()
+        sums[:, window:] -= cumulative[:, :x.shape[1] - window]
+        return sums
+
+    n = trailing_sums(valid.astype(np.float64))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = trailing_sums(filled) / n
+        var = trailing_sums(filled * filled) / n - mean * mean
+        np.maximum(var, 0.0, out=var)
+        std = np.sqrt(var, out=var)
+        z = (values - mean) / std
+    z[(n < 2) | (std == 0)] = np.nan
+    return z
+
+def row_correlation(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlation of each row of x with the same row of y over the points where both are present.
+    """
+    both = ~np.isnan(x) & ~np.isnan(y)
+    n = both.sum(axis=1)
+    x = np.where(both, x, 0.0)
+    y = np.where(both, y, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(both, x - x_mean[:, None], 0.0)
+        dy = np.where(both, y - y_mean[:, None], 0.0)
+        return (dx * dy).sum(axis=1) / np.sqrt((dx * dx).sum(axis=1) * (dy * dy).sum(axis=1))
+
+def _to_iso(epoch) -> Optional[str]:
+    return datetime.datetime.fromtimestamp(int(epoch), tz=datetime.timezone.utc).isoformat()
+
+def _nan_to_none(value):
+    return None if value is None or np.isnan(value) else float(value)
+
+def analyze_series(series: Dict, roles: Optional[Dict[str, str]] = None, clusters: Optional[Dict[str, str]] = None,
+                   percentiles: Sequence[float] = (50, 95, 99), window: int = 288, z_threshold: float = 4.0) -> Dict:
+    """
+    Fleet-wide statistics over get_metric_series output, computed on [instances x time] arrays.
+
+    Args:
+        series (Dict): {instance_id: {metric: {'Timestamps', 'Values'}}} with CPUUtilization and DatabaseConnections
+        roles (Dict): Optional {instance_id: 'writer' | 'reader'} for the skew section
+        clusters (Dict): Optional {instance_id: cluster_identifier} for the skew section
+        percentiles (Sequence[float]): Percentiles reported per instance and metric
+        window (int): Points in the trailing window of the rolling z-score (288 x 5 minutes = 1 day)
+        z_threshold (float): |z| above which a point is reported as an anomaly
+
+    Returns:
+        Dict with
+        'Instances': {instance_id: {metric: {'p50', ..., 'max', 'mean', 'peak_time'}, 'cpu_connection_correlation'}},
+        'Anomalies': {instance_id: [{'metric', 'timestamp', 'value', 'zscore'}]},
+        'Skew': {cluster_identifier: {'writer', 'readers', 'writer_cpu_mean', 'reader_cpu_mean', 'cpu_ratio',
+                                      'writer_cpu_p95', 'max_reader_cpu_p95'}}
+    """
+    instance_ids = list(series)
+    result = {'Instances': {instance_id: {} for instance_id in instance_ids},
+              'Anomalies': {instance_id: [] for instance_id in instance_ids},
+              'Skew': {}}
+    if not instance_ids:
+        return result
+
+    # per-row statistics are computed for the requested percentiles plus the p95 used by the skew section
+    quantiles = sorted(set(percentiles) | {95})
+    matrices = {}
+    row_stats = {}
+    for metric in (CPU_METRIC, CONNECTIONS_METRIC):
+        _, epochs, values = series_to_matrix(series, metric)
+        matrices[metric] = (epochs, values)
+        if not epochs.size:
+            continue
+        counts = (~np.isnan(values)).sum(axis=1)
+        safe = np.where(np.isnan(values), -np.inf, values)
+        peaks = safe.argmax(axis=1)
+        stats = {
+            'max': np.where(counts > 0, safe.max(axis=1), np.nan),
+            'sum': np.nansum(values, axis=1),
+            'count': counts,
+        }
+        stats['mean'] = np.divide(stats['sum'], counts, out=np.full(len(counts), np.nan), where=counts > 0)
+        for quantile, row in zip(quantiles, row_percentiles(values, quantiles)):
+            stats[f'p{quantile:g}'] = row
+        row_stats[metric] = stats
+
+        # plain lists : one conversion instead of a numpy scalar per value
+        maxima, means = stats['max'].tolist(), stats['mean'].tolist()
+        columns = {percentile: stats[f'p{percentile:g}'].tolist() for percentile in percentiles}
+        peak_times = epochs[peaks].tolist()
+        for row, instance_id in enumerate(instance_ids):
+            if not counts[row]:
+                summary = {'max': None, 'mean': None, 'peak_time': None}
+                summary.update({f'p{percentile:g}': None for percentile in percentiles})
+            else:
+                summary = {'max': maxima[row], 'mean': means[row], 'peak_time': _to_iso(peak_times[row])}
+                summary.update({f'p{percentile:g}': columns[percentile][row] for percentile in percentiles})
+            result['Instances'][instance_id][metric] = summary
+
+        z = rolling_zscore(values, window)
+        with np.errstate(invalid='ignore'):
+            rows, columns_idx = np.nonzero(np.abs(z) > z_threshold)
+        for row, column in zip(rows.tolist(), columns_idx.tolist()):
+            result['Anomalies'][instance_ids[row]].append({
+                'metric': metric,
+                'timestamp': _to_iso(epochs[column]),
+                'value': float(values[row, column]),
+                'zscore': float(z[row, column]),
+            })
+
+    # correlation needs both metrics on the same time axis
+    cpu_epochs, cpu = matrices[CPU_METRIC]
+    connection_epochs, connections = matrices[CONNECTIONS_METRIC]
+    if cpu_epochs.size and connection_epochs.size:
+        if np.array_equal(cpu_epochs, connection_epochs):
+            aligned = [cpu, connections]
+        else:
+            epochs = np.union1d(cpu_epochs, connection_epochs)
+            aligned = []
+            for metric_epochs, values in ((cpu_epochs, cpu), (connection_epochs, connections)):
+                full = np.full((len(instance_ids), len(epochs)), np.nan)
+                full[:, np.searchsorted(epochs, metric_epochs)] = values
+                aligned.append(full)
+        for instance_id, correlation in zip(instance_ids, row_correlation(*aligned).tolist()):
+            result['Instances'][instance_id]['cpu_connection_correlation'] = None if np.isnan(correlation) else correlation
+
+    # skew from the per-row sums and percentiles : no pass over the points
+    if roles and clusters and CPU_METRIC in row_stats:
+        stats = row_stats[CPU_METRIC]
+        rows = {instance_id: row for row, instance_id in enumerate(instance_ids)}
+        members = {}
+        for instance_id, cluster_identifier in clusters.items():
+            if instance_id in rows:
+                members.setdefault(cluster_identifier, []).append(rows[instance_id])
+        for cluster_identifier, cluster_rows in members.items():
+            writers = [row for row in cluster_rows if roles.get(instance_ids[row]) == 'writer']
+            readers = [row for row in cluster_rows if roles.get(instance_ids[row]) != 'writer']
+            if not writers or not readers:
+                continue
+            writer = writers[0]
+            reader_count = stats['count'][readers].sum()
+            writer_mean = _nan_to_none(stats['mean'][writer])
+            reader_mean = float(stats['sum'][readers].sum() / reader_count) if reader_count else None
+            result['Skew'][cluster_identifier] = {
+                'writer': instance_ids[writer],
+                'readers': [instance_ids[row] for row in readers],
+                'writer_cpu_mean': writer_mean,
+                'reader_cpu_mean': reader_mean,
+                'cpu_ratio': writer_mean / reader_mean if writer_mean is not None and reader_mean else None,
+                'writer_cpu_p95': _nan_to_none(stats['p95'][writer]),
+                'max_reader_cpu_p95': _nan_to_none(np.nanmax(stats['p95'][readers]))
+                                      if not np.all(np.isnan(stats['p95'][readers])) else None,
+            }
+
+    return result
+
+def fetch_fleet_series(cluster_identifiers: List[str], period_hours: int = 24 * 30, period: int = 300,
+                       cloudwatch=None, rds=None, use_cache: bool = True) -> Tuple[Dict, Dict, Dict]:
+    """
+    Fetch CPU and connection series for every instance of several clusters with packed GetMetricData calls.
+
+    Returns:
+        (series, roles {instance_id: 'writer' | 'reader'}, clusters {instance_id: cluster_identifier})
+    """
+    cloudwatch = cloudwatch or get_client('cloudwatch')
+    rds = rds or get_client('rds')
+
+    roles = {}
+    clusters = {}
+    for cluster_identifier in cluster_identifiers:
+        load = lambda: client_call(rds, 'describe_db_clusters', DBClusterIdentifier=cluster_identifier)
+        response = cluster_cache.get_or_load(_cluster_cache_key(rds, cluster_identifier), load) if use_cache else load()
+        for cluster in response['DBClusters']:
+            for member in cluster['DBClusterMembers']:
+                roles[member['DBInstanceIdentifier']] = 'writer' if member.get('IsClusterWriter') else 'reader'
+                clusters[member['DBInstanceIdentifier']] = cluster_identifier
+
+    end_time = datetime.datetime.utcnow()
+    start_time = end_time - datetime.timedelta(hours=period_hours)
+    series = get_metric_series(cloudwatch, list(clusters), [CPU_METRIC, CONNECTIONS_METRIC],
+                               start_time, end_time, period=period)
+    return series, roles, clusters
+
+def analyze_fleet(cluster_identifiers: List[str], period_hours: int = 24 * 30, period: int = 300, **kwargs) -> Dict:
+    """
+    fetch_fleet_series + analyze_series. kwargs are passed to analyze_series.
+    """
+    series, roles, clusters = fetch_fleet_series(cluster_identifiers, period_hours, period)
+    return analyze_series(series, roles, clusters, **kwargs)
+
+def main():
+    # Example usage
+    CLUSTER_IDENTIFIERS = ['your-aurora-cluster-identifier']
+
+    analysis = analyze_fleet(CLUSTER_IDENTIFIERS)
+    for instance_id, stats in analysis['Instances'].items():
+        cpu = stats.get(CPU_METRIC, {})
+        print(f"{instance_id}: CPU p95 {cpu.get('p95')}, peak {cpu.get('max')} at {cpu.get('peak_time')}, "
+              f"CPU/connections r={stats.get('cpu_connection_correlation')}, "
+              f"{len(analysis['Anomalies'][instance_id])} anomalies")
+    for cluster_identifier, skew in analysis['Skew'].items():
+        print(f"{cluster_identifier}: writer/reader CPU ratio {skew['cpu_ratio']}")
+
+if __name__ == '__main__':
+    main()
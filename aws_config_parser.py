@@ -1,15 +1,26 @@
 import configparser
 
-configPorfile = configparser.ConfigParser()
-configPorfile.sections()
-configPorfile.read('/root/.aws/config')
-lstConfigProfile = configPorfile.sections()
-lstConfig = []
-for config in lstConfigProfile :
-  try : 
-    if len(config.split()) > 1 :
-      lstConfig.append(config.split()[1])
-    else :
-      lstConfig.append(config)
-  except Exception as e : 
-    print(f"config parser exception : {config}\n{e}"
+AWS_CONFIG_PATH = '/root/.aws/config'
+
+def parse_profiles(config_path=AWS_CONFIG_PATH) :
+  """
+  Parse an AWS config file into {profile name: default region or None}.
+  """
+  configPorfile = configparser.ConfigParser()
+  configPorfile.read(config_path)
+  dictProfile = {}
+  for config in configPorfile.sections() :
+    try :
+      # [sso-session x] / [services x] sections are not profiles
+      if config.split()[0] in ('sso-session', 'services') :
+        continue
+      if len(config.split()) > 1 :
+        profile = config.split()[1]
+      else :
+        profile = config
+      dictProfile[profile] = configPorfile[config].get('region')
+    except Exception as e :
+      print(f"config parser exception : {config}\n{e}")
+  return dictProfile
+
+lstConfig = list(parse_profiles())
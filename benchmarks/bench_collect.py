@@ -0,0 +1,397 @@
+"""
+Benchmarks for the collection hot paths at several fleet sizes.
+
+Every (path, size) case runs in a fresh process so its peak RSS is its own.
+AWS calls never leave the process: CloudWatch, RDS and PI clients get
+synthetic responses from a before-call hook (the mechanism botocore's Stubber
+uses) and S3 runs against moto. Every call sleeps for --latency seconds first
+to stand in for the network. The Postgres paths use the server named by the
+usual PGHOST / PGPORT / PGDATABASE / PGUSER / PGPASSWORD variables and are
+reported as skipped when it cannot be reached.
+
+    python -m benchmarks.bench_collect --output bench.json
+    python -m benchmarks.bench_collect --paths aurora_metrics --sizes 1 10 --latency 0.02
+    python -m benchmarks.bench_collect --compare baseline.json bench.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+DEFAULT_SIZES = [1, 10, 100, 1000]
+DEFAULT_LATENCY = 0.005
+
+class SkipCase(Exception):
+    pass
+
+class apiRecorder():
+    """
+    Counts every API call of the clients it is attached to and delays each one by latency seconds.
+
+    With respond=True the call is answered by synthetic_response instead of being sent.
+    """
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def attach(self, client, respond: bool = True):
+        from botocore.awsrequest import AWSResponse
+
+        service = client.meta.service_model.service_name
+        event_service = client.meta.service_model.service_id.hyphenize()
+
+        def before_parameter_build(params, context, **kwargs):
+            # before-call only sees the serialized request, keep the API parameters for it
+            context['bench_params'] = dict(params)
+
+        def before_call(model, context, **kwargs):
+            with self._lock:
+                self.calls[f'{service}.{model.name}'] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if respond:
+                return AWSResponse(None, 200, {}, None), synthetic_response(model.name, context['bench_params'])
+
+        # first, so a synthetic response is returned before any other handler runs
+        client.meta.events.register_first(f'before-parameter-build.{event_service}', before_parameter_build)
+        client.meta.events.register_first(f'before-call.{event_service}', before_call)
+        return client
+
+def _series(start_time, end_time, period, count=None):
+    count = count or max(1, int((end_time - start_time).total_seconds()) // period)
+    timestamps = [start_time + datetime.timedelta(seconds=period * idx) for idx in range(count)]
+    return timestamps, [random.uniform(0, 100) for _ in timestamps]
+
+def synthetic_response(operation_name: str, params: Dict) -> Dict:
+    """
+    Plausibly sized response bodies for the operations the collectors call.
+    """
+    if operation_name == 'DescribeDBClusters':
+        cluster = params.get('DBClusterIdentifier', 'cluster')
+        return {'DBClusters': [{
+            'DBClusterIdentifier': cluster,
+            'Engine': 'aurora-mysql',
+            'DBClusterMembers': [
+                {'DBInstanceIdentifier': f'{cluster}-{idx}', 'IsClusterWriter': idx == 0} for idx in range(2)
+            ]
+        }]}
+    if operation_name == 'GetMetricData':
+        results = []
+        for query in params['MetricDataQueries']:
+            timestamps, values = _series(params['StartTime'], params['EndTime'], query['MetricStat']['Period'])
+            results.append({'Id': query['Id'], 'Label': query['Id'], 'Timestamps': timestamps,
+                            'Values': values, 'StatusCode': 'Complete'})
+        return {'MetricDataResults': results}
+    if operation_name == 'GetMetricStatistics':
+        timestamps, values = _series(params['StartTime'], params['EndTime'], params['Period'])
+        return {'Label': params['MetricName'],
+                'Datapoints': [{'Timestamp': ts, 'Maximum': value} for ts, value in zip(timestamps, values)]}
+    if operation_name == 'GetResourceMetrics':
+        metric_list = []
+        for query in params['MetricQueries']:
+            timestamps, _ = _series(params['StartTime'], params['EndTime'], params['PeriodInSeconds'])
+            keys = [{'Metric': query['Metric']}]
+            group = query.get('GroupBy', {}).get('Group')
+            if group:
+                keys += [{'Metric': query['Metric'], 'Dimensions': {f'{group}.id': f'{group}-{idx}'}}
+                         for idx in range(query['GroupBy'].get('Limit', 10))]
+            for key in keys:
+                metric_list.append({'Key': key, 'DataPoints': [
+                    {'Timestamp': ts, 'Value': random.uniform(0, 4)} for ts in timestamps]})
+        return {'AlignedStartTime': params['StartTime'], 'AlignedEndTime': params['EndTime'],
+                'Identifier': params['Identifier'], 'MetricList': metric_list}
+    raise ValueError(f'no synthetic response for {operation_name}')
+
+def _aws_client(service: str):
+    import boto3
+    return boto3.client(service, region_name='us-east-1', aws_access_key_id='bench', aws_secret_access_key='bench')
+
+def _timed_map(func: Callable, items: List, max_workers: int) -> Tuple[List[float], float]:
+    """
+    Run func over items concurrently; return the per-item latencies and the wall time of the whole map.
+    """
+    def timed(item):
+        started = time.perf_counter()
+        func(item)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        started = time.perf_counter()
+        latencies = list(executor.map(timed, items))
+        return latencies, time.perf_counter() - started
+
+def bench_aurora_metrics(size: int, recorder: apiRecorder) -> Dict:
+    from top_cpu_connection import get_aurora_metrics
+
+    cloudwatch = recorder.attach(_aws_client('cloudwatch'))
+    rds = recorder.attach(_aws_client('rds'))
+    latencies, elapsed = _timed_map(
+        lambda cluster: get_aurora_metrics(cluster, cloudwatch=cloudwatch, rds=rds, raise_errors=True, use_cache=False),
+        [f'cluster-{idx}' for idx in range(size)], max_workers=16)
+    return {'latencies': latencies, 'elapsed': elapsed, 'units': size, 'unit': 'clusters'}
+
+def bench_performance_insights(size: int, recorder: apiRecorder) -> Dict:
+    from pi_cloudwatch import get_performance_insights
+
+    pi_client = recorder.attach(_aws_client('pi'))
+    cloudwatch = recorder.attach(_aws_client('cloudwatch'))
+    latencies, elapsed = _timed_map(
+        lambda instance: get_performance_insights(instance, pi_client=pi_client, cloudwatch=cloudwatch),
+        [f'instance-{idx}' for idx in range(size)], max_workers=8)
+    return {'latencies': latencies, 'elapsed': elapsed, 'units': size, 'unit': 'instances'}
+
+def bench_s3_transfer(size: int, recorder: apiRecorder, object_size: int = 64 * 1024) -> Dict:
+    from moto import mock_aws
+    from lib.awsS3 import s3Class
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    with mock_aws(), tempfile.TemporaryDirectory() as work_dir, s3Class(profile=None, region='us-east-1') as s3:
+        recorder.attach(s3.s3_client, respond=False)
+        s3.s3_client.create_bucket(Bucket='bench')
+
+        paths = []
+        for idx in range(size):
+            path = os.path.join(work_dir, f'object-{idx}')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(object_size))
+            paths.append(path)
+
+        uploads, upload_elapsed = _timed_map(lambda path: s3.copy_to_s3(path, 'bench', os.path.basename(path)),
+                                             paths, max_workers=8)
+        downloads, download_elapsed = _timed_map(
+            lambda path: s3.download_from_s3('bench', os.path.basename(path), path + '.down'), paths, max_workers=8)
+    return {'latencies': uploads + downloads, 'elapsed': upload_elapsed + download_elapsed,
+            'units': 2 * size * object_size / 1024 / 1024, 'unit': 'MB'}
+
+def _pg_params() -> Dict:
+    return {
+        'host': os.environ.get('PGHOST', '127.0.0.1'),
+        'port': int(os.environ.get('PGPORT', 5432)),
+        'dbname': os.environ.get('PGDATABASE', 'postgres'),
+        'user': os.environ.get('PGUSER', 'postgres'),
+        'password': os.environ.get('PGPASSWORD', ''),
+    }
+
+def _pg_connect():
+    from lib.pgConn import dbConn
+
+    db = dbConn(connect_timeout=5, **_pg_params())
+    if db.conn is None:
+        raise SkipCase(f"no Postgres at {_pg_params()['host']}:{_pg_params()['port']}")
+    return db
+
+def bench_select_execute(size: int, recorder: apiRecorder, rows_per_unit: int = 1000, repeat: int = 5) -> Dict:
+    db = _pg_connect()
+    try:
+        rows = size * rows_per_unit
+        with db.conn.cursor() as cur:
+            cur.execute("""
+                create temp table bench_rows as
+                select g as id, md5(g::text) as name, now() - g * interval '1 second' as created_at, random() as value
+                from generate_series(1, %s) as g
+            """, (rows,))
+        db.conn.commit()
+
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            if db.select_execute('select * from bench_rows') is None:
+                raise RuntimeError('select_execute failed')
+            latencies.append(time.perf_counter() - started)
+        return {'latencies': latencies, 'elapsed': sum(latencies), 'units': rows * repeat, 'unit': 'rows'}
+    finally:
+        db.close()
+
+def bench_activity(size: int, recorder: apiRecorder, repeat: int = 20) -> Dict:
+    import psycopg2
+    from psycopg2.extensions import POLL_OK
+
+    db = _pg_connect()
+    sessions = []
+    try:
+        with db.conn.cursor() as cur:
+            cur.execute("select current_setting('max_connections')::int - current_setting('superuser_reserved_connections')::int"
+                        " - (select count(*) from pg_stat_activity)")
+            room = cur.fetchone()[0]
+        db.conn.rollback()
+
+        # active sessions for pg_stat_activity to report, capped by the server's free slots
+        for _ in range(max(0, min(size, room - 5))):
+            conn = psycopg2.connect(async_=1, **_pg_params())
+            while conn.poll() != POLL_OK:
+                time.sleep(0.001)
+            conn.cursor().execute('select pg_sleep(600)')
+            sessions.append(conn)
+
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            if db.activity() is None:
+                raise RuntimeError('activity query failed')
+            latencies.append(time.perf_counter() - started)
+        return {'latencies': latencies, 'elapsed': sum(latencies), 'units': repeat, 'unit': 'calls',
+                'sessions': len(sessions)}
+    finally:
+        for conn in sessions:
+            conn.cancel()
+            conn.close()
+        db.close()
+
+BENCHMARKS = {
+    'aurora_metrics': bench_aurora_metrics,
+    'performance_insights': bench_performance_insights,
+    's3_transfer': bench_s3_transfer,
+    'select_execute': bench_select_execute,
+    'activity': bench_activity,
+}
+
+def run_case(path: str, size: int, latency: float) -> Dict:
+    """
+    Run one benchmark case in the current process and summarize it.
+    """
+    result = {'path': path, 'size': size, 'latency': latency}
+    recorder = apiRecorder(latency)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        # the collectors print per call
+        with contextlib.redirect_stdout(io.StringIO()):
+            measured = BENCHMARKS[path](size, recorder)
+    except SkipCase as e:
+        result['skipped'] = str(e)
+        return result
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        return result
+    # only the measured calls : fixtures, synthetic data and table / session setup are not timed
+    elapsed = measured.pop('elapsed')
+    latencies = np.array(measured.pop('latencies'))
+    result.update({
+        'elapsed': elapsed,
+        'ops': int(latencies.size),
+        'ops_per_sec': latencies.size / elapsed if elapsed else 0.0,
+        'throughput': measured.pop('units') / elapsed if elapsed else 0.0,
+        'throughput_unit': measured.pop('unit') + '/s',
+        'p50': float(np.percentile(latencies, 50)) if latencies.size else None,
+        'p99': float(np.percentile(latencies, 99)) if latencies.size else None,
+        'max': float(latencies.max()) if latencies.size else None,
+        'api_calls': dict(recorder.calls),
+        'api_calls_total': sum(recorder.calls.values()),
+        # ru_maxrss is in KiB on Linux
+        'baseline_rss_kb': baseline_rss,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+    result.update(measured)
+    return result
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+def run_benchmarks(paths: List[str], sizes: List[int], latency: float = DEFAULT_LATENCY) -> Dict:
+    """
+    Run every (path, size) case, each in its own spawned process.
+
+    Returns:
+        {'meta': {...}, 'results': [one summary per case]}
+    """
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for path in paths:
+        for size in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, path, size, latency).result()
+            results.append(result)
+            _print_result(result)
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'latency': latency,
+        },
+        'results': results,
+    }
+
+def _print_result(result: Dict):
+    label = f"{result['path']:<22} size={result['size']:<5}"
+    if 'skipped' in result or 'error' in result:
+        print(f"{label} {'skipped' if 'skipped' in result else 'error'}: {result.get('skipped') or result.get('error')}")
+        return
+    print(f"{label} p50={result['p50'] * 1000:8.2f}ms p99={result['p99'] * 1000:8.2f}ms "
+          f"{result['throughput']:10.1f} {result['throughput_unit']:<14} api={result['api_calls_total']:<6} "
+          f"rss={result['peak_rss_kb'] / 1024:.0f}MB")
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.2) -> List[str]:
+    """
+    Compare two benchmark outputs and return the regressions beyond tolerance.
+
+    A regression is a p50 or p99 more than tolerance higher, a throughput more
+    than tolerance lower, or more API calls than the baseline for the same case.
+    """
+    baseline_results = {(result['path'], result['size']): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = baseline_results.get((result['path'], result['size']))
+        if old is None or 'p50' not in old or 'p50' not in result:
+            continue
+        label = f"{result['path']} size={result['size']}"
+        for key in ('p50', 'p99'):
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                regressions.append(f'{label} {key} {old[key] * 1000:.2f}ms -> {result[key] * 1000:.2f}ms')
+        if old['throughput'] and result['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append(f"{label} throughput {old['throughput']:.1f} -> {result['throughput']:.1f} "
+                               f"{result['throughput_unit']}")
+        if result['api_calls_total'] > old['api_calls_total']:
+            regressions.append(f"{label} api calls {old['api_calls_total']} -> {result['api_calls_total']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collection hot paths')
+    parser.add_argument('--paths', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help='seconds added to every AWS call')
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'))
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        print(f"{len(regressions)} regressions ({baseline['meta']['revision']} -> {current['meta']['revision']})")
+        raise SystemExit(1 if regressions else 0)
+
+    output = run_benchmarks(args.paths, args.sizes, args.latency)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2, default=str)
+    print(f'results written to {args.output}')
+
+if __name__ == '__main__':
+    main()
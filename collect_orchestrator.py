@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from aws_config_parser import AWS_CONFIG_PATH, parse_profiles
+from fleet_scanner import list_clusters
+from lib.awsRDS import rdsClass
+from lib.awsSession import get_client
+from top_cpu_connection import get_aurora_metrics
+
+class awsContext():
+    """
+    One (profile, region) target. Its clients come from the shared lib.awsSession
+    pool, so every job on the same target reuses one session and one client per service.
+    """
+    def __init__(self, profile: str, region: Optional[str]):
+        self.profile = profile
+        self.region = region
+        self.account = None
+
+    def client(self, service: str):
+        return get_client(service, self.profile, self.region)
+
+def build_contexts(profiles: Dict[str, Optional[str]], regions: Optional[List[str]] = None) -> List[awsContext]:
+    """
+    Build one awsContext per (profile, region).
+
+    Args:
+        profiles (Dict): {profile: default region} as returned by parse_profiles
+        regions (List[str]): Regions to cover for every profile. None uses each profile's own region.
+    """
+    contexts = []
+    for profile, profile_region in profiles.items():
+        for region in (regions or [profile_region]):
+            contexts.append(awsContext(profile, region))
+    return contexts
+
+def _account_id(context: awsContext) -> Optional[str]:
+    try:
+        return context.client('sts').get_caller_identity()['Account']
+    except Exception as e:
+        print(f"Account lookup failed for profile {context.profile}: {e}")
+        return None
+
+def run_collection(job: Callable[[awsContext], List[Dict]],
+                   profiles: Optional[Dict[str, Optional[str]]] = None,
+                   regions: Optional[List[str]] = None,
+                   max_workers: int = 16,
+                   config_path: str = AWS_CONFIG_PATH) -> Dict:
+    """
+    Run a collection job for every (profile, region) in parallel and merge the results.
+
+    Args:
+        job (Callable): awsContext -> list of record dicts
+        profiles (Dict): {profile: default region}. None parses config_path.
+        regions (List[str]): Regions to cover for every profile. None uses each profile's own region.
+        max_workers (int): Size of the thread pool
+        config_path (str): AWS config file used when profiles is None
+
+    Returns:
+        {'Results': [records tagged with Account/Profile/Region], 'Errors': [...]}
+    """
+    if profiles is None:
+        profiles = parse_profiles(config_path)
+    contexts = build_contexts(profiles, regions)
+
+    merged = {'Results': [], 'Errors': []}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # One sts call per profile, shared by all of its regions
+        first_context = {}
+        for context in contexts:
+            first_context.setdefault(context.profile, context)
+        accounts = dict(zip(first_context, executor.map(_account_id, first_context.values())))
+        for context in contexts:
+            context.account = accounts[context.profile]
+
+        futures = {executor.submit(job, context): context for context in contexts}
+        for future in as_completed(futures):
+            context = futures[future]
+            tag = {'Account': context.account, 'Profile': context.profile, 'Region': context.region}
+            try:
+                for record in future.result():
+                    merged['Results'].append({**tag, **record})
+            except Exception as e:
+                merged['Errors'].append({**tag, 'Error': str(e)})
+    return merged
+
+def rds_inventory_job(context: awsContext) -> List[Dict]:
+    """
+    List every DB instance of the context's region.
+    """
+    rds = rdsClass(context.profile, region=context.region)
+    return [instance.as_dict() for instance in rds.iter_instances()]
+
+def aurora_metrics_job(context: awsContext, period_hours: int = 24) -> List[Dict]:
+    """
+    Collect max CPU / connections of every Aurora instance of the context's region.
+    """
+    records = []
+    rds = context.client('rds')
+    cloudwatch = context.client('cloudwatch')
+    for cluster_identifier in list_clusters(rds):
+        metrics = get_aurora_metrics(cluster_identifier, period_hours, cloudwatch=cloudwatch, rds=rds)
+        for instance_id, instance_metrics in metrics.items():
+            records.append({
+                'DBClusterIdentifier': cluster_identifier,
+                'DBInstanceIdentifier': instance_id,
+                **instance_metrics
+            })
+    return records
+
+if __name__ == '__main__':
+    # Example usage : every profile in ~/.aws/config, in its configured region
+    inventory = run_collection(rds_inventory_job)
+    for record in inventory['Results']:
+        print(f"[{record['Account']}/{record['Region']}] {record['identifier']} "
+              f"{record['instance_class']} {record['engine']}")
+    for error in inventory['Errors']:
+        print(f"[{error['Profile']}/{error['Region']}] Error: {error['Error']}")
@@ -0,0 +1,141 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from lib.awsRetry import client_call
+from lib.awsSession import get_client
+from top_cpu_connection import get_aurora_metrics
+
+def default_client_factory(profile: Optional[str], region: Optional[str]) -> Dict:
+    """
+    Build the rds and cloudwatch clients for one (profile, region) target.
+    """
+    return {
+        'rds': get_client('rds', profile, region),
+        'cloudwatch': get_client('cloudwatch', profile, region),
+    }
+
+def list_clusters(rds, engine_prefix: str = 'aurora') -> Iterator[str]:
+    """
+    Yield every cluster identifier in the client's region with a paginated describe_db_clusters.
+
+    Pages are requested one by one (Marker) through lib.awsRetry, so a throttled page is retried on its own.
+    """
+    kwargs = {}
+    while True:
+        page = client_call(rds, 'describe_db_clusters', **kwargs)
+        for cluster in page['DBClusters']:
+            if cluster.get('Engine', '').startswith(engine_prefix):
+                yield cluster['DBClusterIdentifier']
+        if not page.get('Marker'):
+            break
+        kwargs['Marker'] = page['Marker']
+
+def scan_fleet(targets: List[Tuple[Optional[str], Optional[str]]],
+               period_hours: int = 24,
+               max_workers: int = 16,
+               max_per_region: int = 4,
+               max_per_account: int = 8,
+               client_factory: Callable = default_client_factory) -> Iterator[Dict]:
+    """
+    Discover and scan every Aurora cluster of several (profile, region) targets concurrently.
+
+    Clusters are discovered with a paginated describe_db_clusters per target and
+    scanned with get_aurora_metrics on a bounded thread pool. At most
+    max_per_region scans run against one (profile, region) and at most
+    max_per_account against one profile. Every AWS call goes through
+    lib.awsRetry, whose token buckets slow down the whole (account, region, API)
+    on throttling and retry with jittered backoff.
+
+    Args:
+        targets (List[Tuple]): (profile, region) pairs to scan. None uses the default profile/region.
+        period_hours (int): Number of hours to look back for metrics (default: 24)
+        max_workers (int): Size of the thread pool
+        max_per_region (int): Concurrent scans per (profile, region)
+        max_per_account (int): Concurrent scans per profile
+        client_factory (Callable): (profile, region) -> {'rds': client, 'cloudwatch': client}
+
+    Yields:
+        One dict per cluster as soon as it finishes:
+        {'Profile', 'Region', 'ClusterIdentifier', 'Metrics'} or, on failure, 'Error' instead of 'Metrics'
+    """
+    if max_per_region < 1 or max_per_account < 1:
+        # nothing could ever be submitted : the scan would wait forever
+        raise ValueError(f'max_per_region ({max_per_region}) and max_per_account ({max_per_account}) must be >= 1')
+
+    # Resolve every target's clients once, before any worker starts
+    clients = {target: client_factory(*target) for target in targets}
+
+    pending = deque()
+    running_region = {target: 0 for target in targets}
+    running_account = {profile: 0 for profile, _ in targets}
+    futures = {}
+
+    def scan(target, cluster_identifier):
+        target_clients = clients[target]
+        return get_aurora_metrics(
+            cluster_identifier,
+            period_hours=period_hours,
+            cloudwatch=target_clients['cloudwatch'],
+            rds=target_clients['rds'],
+            raise_errors=True
+        )
+
+    def discover(target):
+        return list(list_clusters(clients[target]['rds']))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for target in targets:
+            futures[executor.submit(discover, target)] = ('discover', target, None)
+
+        while futures or pending:
+            # Start queued scans while their region and account have room
+            for _ in range(len(pending)):
+                target, cluster_identifier = pending.popleft()
+                profile = target[0]
+                if (running_region[target] >= max_per_region
+                        or running_account[profile] >= max_per_account):
+                    pending.append((target, cluster_identifier))
+                    continue
+                running_region[target] += 1
+                running_account[profile] += 1
+                futures[executor.submit(scan, target, cluster_identifier)] = ('scan', target, cluster_identifier)
+
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, target, cluster_identifier = futures.pop(future)
+                profile, region = target
+
+                if kind == 'discover':
+                    try:
+                        pending.extend((target, identifier) for identifier in future.result())
+                    except Exception as e:
+                        yield {'Profile': profile, 'Region': region, 'ClusterIdentifier': None, 'Error': str(e)}
+                    continue
+
+                running_region[target] -= 1
+                running_account[profile] -= 1
+                result = {'Profile': profile, 'Region': region, 'ClusterIdentifier': cluster_identifier}
+                try:
+                    result['Metrics'] = future.result()
+                except Exception as e:
+                    result['Error'] = str(e)
+                yield result
+
+def main():
+    # Example usage
+    PROFILE = 'default'
+    REGIONS = ['ap-northeast-2', 'us-east-1']
+
+    targets = [(PROFILE, region) for region in REGIONS]
+    for result in scan_fleet(targets):
+        print(f"\n[{result['Profile']}/{result['Region']}] Cluster: {result['ClusterIdentifier']}")
+        if 'Error' in result:
+            print(f"Error: {result['Error']}")
+            continue
+        for instance_id, instance_metrics in result['Metrics'].items():
+            print(f"  {instance_id}: Max CPU {instance_metrics['max_cpu_utilization']:.2f}%, "
+                  f"Max Connections {int(instance_metrics['max_connections'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+
+try :
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import AioSession
+except ImportError as e :
+    # optional dependency : only the *_async modules need it
+    raise ImportError('the async collectors need aiobotocore : pip install aiobotocore') from e
+
+from lib.awsSession import ENGINE_RETRIED_SERVICES, NO_RETRIES
+from lib.instrument import instrument_client
+
+class asyncClientPool():
+    """
+    aiobotocore sessions and clients shared by every coroutine of one event loop.
+
+    Sessions are kept per profile and clients per (profile, region, service),
+    the same keys as lib.awsSession.clientPool. Each client owns one aiohttp
+    connection pool of max_pool_connections, so concurrent calls to the same
+    service reuse keep-alive connections instead of opening new ones.
+    Clients of lib.awsSession.ENGINE_RETRIED_SERVICES are built without
+    botocore retries : lib.awsRetry retries their calls.
+    aiohttp connections are bound to the loop that created them: build the pool
+    inside the running loop and close it (or use "async with") before the loop ends.
+    """
+    def __init__(self, max_pool_connections=50, config=None) :
+        self.config = config or AioConfig(max_pool_connections=max_pool_connections)
+        # same options without botocore retries (retries set in config win)
+        self.engine_config = AioConfig(connector_args=getattr(self.config, 'connector_args', None),
+                                       **dict({'retries': NO_RETRIES},
+                                              **getattr(self.config, '_user_provided_options', {})))
+        self._stack = AsyncExitStack()
+        self._sessions = {}
+        self._clients = {}
+        self._locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_session(self, profile) :
+        session = self._sessions.get(profile)
+        if session is None :
+            session = AioSession(profile=profile)
+            self._sessions[profile] = session
+        return session
+
+    async def get_client(self, service, profile=None, region=None) :
+        key = (profile, region, service)
+        client = self._clients.get(key)
+        if client is not None :
+            self.hits += 1
+            return client
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock :
+            # another coroutine may have built it while we waited
+            client = self._clients.get(key)
+            if client is not None :
+                self.hits += 1
+                return client
+            client = await self._stack.enter_async_context(
+                self._get_session(profile).create_client(
+                    service, region_name=region,
+                    config=self.engine_config if service in ENGINE_RETRIED_SERVICES else self.config))
+            self._clients[key] = instrument_client(client)
+            self.misses += 1
+            return client
+
+    def stats(self) :
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'sessions': len(self._sessions),
+            'clients': len(self._clients),
+        }
+
+    async def close(self) :
+        await self._stack.aclose()
+        self._stack = AsyncExitStack()
+        self._sessions.clear()
+        self._clients.clear()
+        self._locks.clear()
+
+    async def __aenter__(self) :
+        return self
+
+    async def __aexit__(self, *exc_info) :
+        await self.close()
+
+@asynccontextmanager
+async def client_scope(pool=None) :
+    """
+    Yield pool, or a new asyncClientPool that is closed on exit when pool is None.
+    """
+    if pool is not None :
+        yield pool
+        return
+    async with asyncClientPool() as pool :
+        yield pool
+
+if __name__ == "__main__":
+    async def main() :
+        async with asyncClientPool() as pool :
+            rds = await pool.get_client('rds')
+            rds_again = await pool.get_client('rds')
+            print(f'same client : {rds is rds_again}, stats : {pool.stats()}')
+
+    asyncio.run(main())
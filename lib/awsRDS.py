@@ -1,40 +1,160 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import boto3, botocore, inspect
-from time import sleep
+import botocore
+
+from lib.awsRetry import client_call
+from lib.awsSession import get_client
+from lib.instrument import inc
+from lib.ttlCache import ttlCache
+
+# describe results shared by every rdsClass object (key includes profile and region)
+describe_cache = ttlCache(maxsize=1024, ttl=300)
+
+# describe_* page size used by the inventory iterators (API maximum : 100)
+PAGE_SIZE = 100
+
+class _record():
+    # compact inventory record : only the fields we use, no per-object __dict__
+    __slots__ = ()
+
+    def __init__(self, *values) :
+        for field, value in zip(self.__slots__, values) :
+            setattr(self, field, value)
+
+    def as_dict(self) :
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self) :
+        return '{}({})'.format(type(self).__name__, ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__))
+
+class clusterRecord(_record) :
+    # members : tuple of (instance identifier, is writer)
+    __slots__ = ('identifier', 'engine', 'engine_version', 'status', 'endpoint', 'reader_endpoint', 'port', 'members', 'writer')
+
+class instanceRecord(_record) :
+    __slots__ = ('identifier', 'cluster', 'instance_class', 'engine', 'engine_version', 'status', 'endpoint', 'port')
+
+class subnetGroupRecord(_record) :
+    __slots__ = ('name', 'vpc_id', 'status', 'subnet_ids')
+
+class parameterGroupRecord(_record) :
+    # kind : 'instance' or 'cluster'
+    __slots__ = ('name', 'family', 'kind', 'description')
 
 class rdsClass():
-    def __init__(self, profile, retry=3, delay=2) :
-        # retry : Number of times to retry when session connection fails
-        # delay : Wait time before retrying (sec)
+    def __init__(self, profile, retry=3, delay=2, region=None, cache=None) :
+        # retry / delay : unused, kept for existing callers (credential errors are raised at once,
+        #                 AWS calls are retried by lib.awsRetry)
+        # region : Region of the client (None : profile default)
+        # cache : lib.ttlCache.ttlCache for describe calls (default : shared describe_cache).
+        #         Use ttlCache(persist_path=..., stale_while_revalidate=True) to keep topology between runs
+        #         and serve it instantly while it is refreshed.
         self.profile = profile
+        self.region = region
         self.retry = retry
         self.delay = delay
-        self.rds_client = None
-        
-        cnt = 0
-        while cnt < retry :
+        self.cache = cache if cache is not None else describe_cache
+        self._rds_client = None
+
+    @property
+    def rds_client(self) :
+        # client is taken from the process-wide pool on first use and shared with other objects
+        if self._rds_client is None :
             try :
-                self.rds_client = boto3.Session(profile_name=profile).client('rds')
-                result_log = f'{profile} Get session complete.'
-                print(f'{result_log}')
-                break
-            except botocore.exception.NoCredentialsError as e :
-                cnt += 1
-                exception_log = f'({cnt}/{retry}) rdsClass credential Exception log : {inspect.currentframe().f_code.co_name}, {e}'
-                print(f'{exception_log}')
-                sleep(delay)
+                self._rds_client = get_client('rds', self.profile, self.region)
+            except (botocore.exceptions.NoCredentialsError, botocore.exceptions.PartialCredentialsError) as e :
+                # missing credentials don't appear by waiting : fail at once
+                print(f'rdsClass credential Exception log : {self.profile}, {e}')
+                raise
+            print(f'{self.profile} Get session complete.')
+        return self._rds_client
+
+    def _cache_key(self, operation, name) :
+        # '' and None both mean "all" (describe_db_subnet_groups() caches under '', invalidate() passes None)
+        return (self.profile, self.region, operation, name or '')
 
     def describe_db_cluster(self, ClusterNalme) :
-        clusterInfo = self.rds_client.describe_db_clusters(DBClusterIdentifier=ClusterNalme)
+        clusterInfo = self.cache.get_or_load(
+            self._cache_key('describe_db_clusters', ClusterNalme),
+            lambda : client_call(self.rds_client, 'describe_db_clusters', DBClusterIdentifier=ClusterNalme))
         return clusterInfo
 
     def describe_db_subnet_groups(self, DBSubnetGroupName='') :
         if DBSubnetGroupName :
-            subnetGroup = self.rds_client.describe_db_subnet_groups(DBSubnetGroupName=DBSubnetGroupName)
+            loader = lambda : client_call(self.rds_client, 'describe_db_subnet_groups',
+                                          DBSubnetGroupName=DBSubnetGroupName)
         else:
-            subnetGroup = self.rds_client.describe_db_subnet_groups()
+            loader = lambda : client_call(self.rds_client, 'describe_db_subnet_groups')
+        subnetGroup = self.cache.get_or_load(self._cache_key('describe_db_subnet_groups', DBSubnetGroupName), loader)
+        return subnetGroup
+
+    def invalidate(self, operation=None, name=None) :
+        # operation / name None : drop every cached describe result
+        if operation is None :
+            self.cache.invalidate()
+        else :
+            self.cache.invalidate(self._cache_key(operation, name))
+
+    def _paginate(self, operation, result_key, **kwargs) :
+        # yield one raw item at a time; each page is dropped once its items are converted.
+        # Pages are requested one by one (Marker) so a throttled page is retried on its own.
+        kwargs = dict(kwargs, MaxRecords=PAGE_SIZE)
+        while True :
+            page = client_call(self.rds_client, operation, **kwargs)
+            inc('rds_inventory_items_total', len(page[result_key]), operation=operation)
+            yield from page[result_key]
+            if not page.get('Marker') :
+                break
+            kwargs['Marker'] = page['Marker']
+
+    def iter_clusters(self, engine_prefix='') :
+        for cluster in self._paginate('describe_db_clusters', 'DBClusters') :
+            if not cluster.get('Engine', '').startswith(engine_prefix) :
+                continue
+            members = tuple((member['DBInstanceIdentifier'], member['IsClusterWriter'])
+                            for member in cluster.get('DBClusterMembers', []))
+            yield clusterRecord(
+                cluster['DBClusterIdentifier'],
+                cluster.get('Engine'),
+                cluster.get('EngineVersion'),
+                cluster.get('Status'),
+                cluster.get('Endpoint'),
+                cluster.get('ReaderEndpoint'),
+                cluster.get('Port'),
+                members,
+                next((identifier for identifier, is_writer in members if is_writer), None))
+
+    def iter_instances(self) :
+        for instance in self._paginate('describe_db_instances', 'DBInstances') :
+            endpoint = instance.get('Endpoint', {})
+            yield instanceRecord(
+                instance['DBInstanceIdentifier'],
+                instance.get('DBClusterIdentifier'),
+                instance.get('DBInstanceClass'),
+                instance.get('Engine'),
+                instance.get('EngineVersion'),
+                instance.get('DBInstanceStatus'),
+                endpoint.get('Address'),
+                endpoint.get('Port'))
+
+    def iter_subnet_groups(self) :
+        for subnetGroup in self._paginate('describe_db_subnet_groups', 'DBSubnetGroups') :
+            yield subnetGroupRecord(
+                subnetGroup['DBSubnetGroupName'],
+                subnetGroup.get('VpcId'),
+                subnetGroup.get('SubnetGroupStatus'),
+                tuple(subnet['SubnetIdentifier'] for subnet in subnetGroup.get('Subnets', [])))
+
+    def iter_parameter_groups(self, include_cluster=True) :
+        for group in self._paginate('describe_db_parameter_groups', 'DBParameterGroups') :
+            yield parameterGroupRecord(group['DBParameterGroupName'], group.get('DBParameterGroupFamily'),
+                                       'instance', group.get('Description'))
+        if include_cluster :
+            for group in self._paginate('describe_db_cluster_parameter_groups', 'DBClusterParameterGroups') :
+                yield parameterGroupRecord(group['DBClusterParameterGroupName'], group.get('DBParameterGroupFamily'),
+                                           'cluster', group.get('Description'))
+
 if __name__ == "__main__":
     profile = 'default'
     cluster_name = 'aurora-mysql-louis'
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio, random, threading, time
+import botocore.exceptions
+from botocore.exceptions import ClientError
+
+from lib.awsSession import client_account
+from lib.instrument import inc, observe
+
+# Error codes AWS services return when a caller exceeds its request rate
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'SlowDown',
+}
+
+# Server-side errors worth another attempt
+TRANSIENT_ERROR_CODES = {
+    'InternalError',
+    'InternalFailure',
+    'InternalServerError',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+    'RequestTimeout',
+    'RequestTimeoutException',
+    'PriorRequestNotComplete',
+}
+
+# Published per-account (S3 : per-prefix) request rates; other APIs use retryEngine.rate
+DEFAULT_RATES = {
+    'GetMetricData': 50,
+    'GetMetricStatistics': 400,
+    'HeadObject': 5500,
+    'GetObject': 5500,
+    'ListObjectsV2': 5500,
+    'PutObject': 3500,
+    'UploadPart': 3500,
+}
+
+THROTTLE = 'throttle'
+TRANSIENT = 'transient'
+FATAL = 'fatal'
+
+def classify_error(error) :
+    """
+    'throttle' (rate exceeded), 'transient' (5xx, timeouts, connection drops)
+    or 'fatal' (everything else : bad parameters, missing resources, access denied, missing or bad credentials).
+    """
+    if isinstance(error, ClientError) :
+        code = error.response.get('Error', {}).get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        if code in THROTTLING_ERROR_CODES or status == 429 :
+            return THROTTLE
+        if code in TRANSIENT_ERROR_CODES or status >= 500 :
+            return TRANSIENT
+        return FATAL
+    if isinstance(error, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)) :
+        return TRANSIENT
+    return FATAL
+
+def is_throttling_error(error) :
+    """
+    Return True if error (or an exception it was raised from) is an AWS throttling error.
+    """
+    while error is not None :
+        if classify_error(error) == THROTTLE :
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def backoff_delay(attempt, base_delay=0.2, max_delay=20.0) :
+    """
+    Full jitter : uniform between 0 and min(max_delay, base_delay * 2 ** attempt).
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+class tokenBucket():
+    """
+    Client-side rate limiter for one (account, region, API).
+
+    reserve() takes a token and returns how long the caller must wait for it,
+    so callers queue up at the bucket's rate instead of firing together. The
+    rate is adaptive : halved on every throttle (down to min_rate) and raised
+    by a twentieth of max_rate on every success, so it settles just under the
+    service quota.
+    """
+    def __init__(self, rate=10.0, burst=None, min_rate=0.5) :
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) :
+        with self._lock :
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # a negative balance is the queue of callers already waiting
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self) :
+        with self._lock :
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self) :
+        with self._lock :
+            if self.rate < self.max_rate :
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class retryEngine():
+    """
+    Retries AWS calls with exponential backoff and full jitter behind per-(account, region, API) token buckets.
+
+    Throttles and transient errors are retried up to max_attempts; throttles
+    also slow the bucket down for every caller of the same API. Fatal errors
+    are raised at once.
+    """
+    def __init__(self, max_attempts=6, base_delay=0.2, max_delay=20.0, rate=10.0, rates=None, burst=None) :
+        # rate : default requests per second per (account, region, API)
+        # rates : {api name : requests per second} overrides, e.g. {'GetMetricData': 50}
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate = rate
+        self.rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, account, region, api) :
+        key = (account, region, api)
+        with self._lock :
+            bucket = self._buckets.get(key)
+            if bucket is None :
+                bucket = tokenBucket(self.rates.get(api, self.rate), self.burst)
+                self._buckets[key] = bucket
+            return bucket
+
+    def _client_key(self, client, operation, account) :
+        # account defaults to the client's credentials (lib.awsSession.client_account), so clients of
+        # different accounts never share a bucket even when the caller does not know the account
+        api = client.meta.method_to_api_mapping.get(operation, operation)
+        if account is None :
+            account = client_account(client)
+        return account, client.meta.region_name, api
+
+    def _failed(self, bucket, api, attempt, error) :
+        # returns the delay before the next attempt, or raises
+        kind = classify_error(error)
+        if kind == FATAL or attempt >= self.max_attempts :
+            raise error
+        if kind == THROTTLE :
+            bucket.throttled()
+        inc('aws_client_retries_total', api=api, reason=kind)
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    def call(self, func, *args, account=None, region=None, api=None, **kwargs) :
+        """
+        Call func(*args, **kwargs) under the (account, region, api) bucket, retrying throttles and transient errors.
+        """
+        api = api or getattr(func, '__name__', 'call')
+        bucket = self.bucket(account, region, api)
+        attempt = 0
+        while True :
+            attempt += 1
+            wait = bucket.reserve()
+            if wait :
+                observe('aws_rate_limit_wait_seconds', wait, api=api)
+                time.sleep(wait)
+            try :
+                result = func(*args, **kwargs)
+            except Exception as e :
+                time.sleep(self._failed(bucket, api, attempt, e))
+                continue
+            bucket.succeeded()
+            return result
+
+    def client_call(self, client, operation, account=None, **params) :
+        """
+        client.<operation>(**params) through call(); account (default : credentials), region and API name come from the client.
+        """
+        account, region, api = self._client_key(client, operation, account)
+        return self.call(getattr(client, operation), account=account, region=region, api=api, **params)
+
+    async def async_client_call(self, client, operation, account=None, **params) :
+        """
+        client_call for aiobotocore clients : waits with asyncio.sleep instead of blocking the loop.
+        """
+        account, region, api = self._client_key(client, operation, account)
+        bucket = self.bucket(account, region, api)
+        attempt = 0
+        while True :
+            attempt += 1
+            wait = bucket.reserve()
+            if wait :
+                observe('aws_rate_limit_wait_seconds', wait, api=api)
+                await asyncio.sleep(wait)
+            try :
+                result = await getattr(client, operation)(**params)
+            except Exception as e :
+                await asyncio.sleep(self._failed(bucket, api, attempt, e))
+                continue
+            bucket.succeeded()
+            return result
+
+default_engine = retryEngine()
+
+def client_call(client, operation, account=None, **params) :
+    return default_engine.client_call(client, operation, account, **params)
+
+async def async_client_call(client, operation, account=None, **params) :
+    return await default_engine.async_client_call(client, operation, account, **params)
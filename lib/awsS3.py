@@ -2,30 +2,73 @@
 # -*- coding: utf-8 -*-
 
 import os
-import boto3, botocore, inspect
-from time import sleep
+import hashlib, json, threading, time, zlib
+import botocore
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from lib.awsRetry import client_call
+from lib.awsSession import get_client
+from lib.instrument import inc
+
+# S3 multipart parts must be at least 5 MiB (except the last one), at most 5 GiB, and at most 10,000 per upload
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+MAX_PARTS = 10000
+# upload_stream doubles its part size every PART_GROWTH_PARTS parts
+PART_GROWTH_PARTS = 1000
+READ_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+def local_etag(local_file_path, multipart_threshold, multipart_chunksize):
+    """
+    ETag S3 gives a file uploaded with these transfer settings (md5, or md5 of part md5s + '-N').
+    """
+    with open(local_file_path, 'rb') as f:
+        if os.path.getsize(local_file_path) < multipart_threshold:
+            whole = hashlib.md5()
+            for chunk in iter(partial(f.read, READ_SIZE), b''):
+                whole.update(chunk)
+            return whole.hexdigest()
+        digests = [hashlib.md5(chunk).digest() for chunk in iter(partial(f.read, multipart_chunksize), b'')]
+    return f'{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}'
 
 class s3Class():
-    def __init__(self, profile='default', retry=3, delay=2) :
-        # retry : Number of times to retry when session connection fails
-        # delay : Wait time before retrying (sec)
+    def __init__(self, profile='default', retry=3, delay=2, region=None,
+                 multipart_threshold=8 * MB, multipart_chunksize=8 * MB, max_concurrency=10, max_workers=8) :
+        # retry / delay : unused, kept for existing callers (credential errors are raised at once,
+        #                 AWS calls are retried by lib.awsRetry)
+        # region : Region of the client (None : profile default)
+        # multipart_threshold / multipart_chunksize / max_concurrency : per-file transfer settings
+        # max_workers : files transferred at once by upload_directory / download_prefix
         self.profile = profile
+        self.region = region
         self.retry = retry
         self.delay = delay
-        self.s3_client = None
-        
-        cnt = 0
-        while cnt < retry :
+        self.max_workers = max_workers
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=max_concurrency)
+        # enough HTTP connections for every file's parts at once
+        self.client_config = Config(max_pool_connections=max(10, max_concurrency * max_workers))
+        self._s3_client = None
+        self._transfer_executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def s3_client(self) :
+        # client is taken from the process-wide pool on first use and shared with other objects
+        if self._s3_client is None :
             try :
-                self.s3_client = boto3.Session(profile_name=profile).client('s3')
-                result_log = f'{profile} Get session complete.'
-                print(f'{result_log}')
-                break
-            except botocore.exception.NoCredentialsError as e :
-                cnt += 1
-                exception_log = f'({cnt}/{retry}) rdsClass credential Exception log : {inspect.currentframe().f_code.co_name}, {e}'
-                print(f'{exception_log}')
-                sleep(delay)
+                self._s3_client = get_client('s3', self.profile, self.region, self.client_config)
+            except (botocore.exceptions.NoCredentialsError, botocore.exceptions.PartialCredentialsError) as e :
+                # missing credentials don't appear by waiting : fail at once
+                print(f's3Class credential Exception log : {self.profile}, {e}')
+                raise
+            print(f'{self.profile} Get session complete.')
+        return self._s3_client
 
     def copy_to_s3(self, local_file_path, bucket_name, s3_key=None):
         """
@@ -44,18 +87,131 @@ class s3Class():
         
         try:
             # Upload the file
-            self.s3_client.upload_file(local_file_path, bucket_name, s3_key)
+            self.s3_client.upload_file(local_file_path, bucket_name, s3_key, Config=self.transfer_config)
+            inc('s3_bytes_total', os.path.getsize(local_file_path), direction='upload')
             print(f"Successfully uploaded {local_file_path} to s3://{bucket_name}/{s3_key}")
         except Exception as e:
             print(f"Error uploading file: {e}")
 
-    def download_from_s3(self, bucket_name, s3_key, local_file_path=None):
+    def upload_stream(self, fileobj, bucket_name, s3_key, part_size=MIN_PART_SIZE * 2, max_in_flight=4,
+                      compress=None, before_complete=None, expected_size=None):
+        """
+        Upload a stream of unknown length (e.g. a process stdout) with a multipart upload.
+
+        Memory is bounded by about (max_in_flight + 1) * part_size: reading pauses
+        while max_in_flight parts are being uploaded. The upload is aborted on any error.
+        S3 allows 10,000 parts, so the part size doubles every 1,000 parts
+        (10 MiB parts reach S3's 5 TiB object limit); with expected_size the
+        first parts are already large enough to need no growth.
+        
+        :param fileobj: binary file-like object to read until EOF
+        :param bucket_name: Name of the S3 bucket
+        :param s3_key: S3 key of the object
+        :param part_size: Size of the first parts (at least 5 MiB, S3's minimum)
+        :param max_in_flight: Parts uploaded concurrently
+        :param compress: None or 'gzip' to compress the stream on the fly
+        :param before_complete: Optional callable run at EOF before the upload is completed; raise to abort
+        :param expected_size: Optional estimate of the uploaded size (after compression)
+        :return: dict with bytes_in, bytes_out, parts, elapsed, mb_per_sec
+        """
+        part_size = max(part_size, MIN_PART_SIZE)
+        if expected_size:
+            part_size = max(part_size, -(-expected_size // MAX_PARTS))
+
+        def next_part_size():
+            part_number = len(futures) + 1
+            if part_number > MAX_PARTS:
+                raise ValueError(f'stream exceeds {MAX_PARTS} parts for s3://{bucket_name}/{s3_key}')
+            return min(MAX_PART_SIZE, part_size << ((part_number - 1) // PART_GROWTH_PARTS))
+
+        compressor = zlib.compressobj(wbits=31) if compress == 'gzip' else None
+        started = time.monotonic()
+        bytes_in = bytes_out = 0
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        futures = []
+        slots = threading.BoundedSemaphore(max_in_flight)
+
+        def upload_part(part_number, body):
+            try:
+                response = self.s3_client.upload_part(Bucket=bucket_name, Key=s3_key, UploadId=upload_id,
+                                                      PartNumber=part_number, Body=body)
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            finally:
+                slots.release()
+
+        def flush(body):
+            nonlocal upload_id, bytes_out
+            # stop reading as soon as a part has failed
+            for future in futures:
+                if future.done() and future.exception():
+                    raise future.exception()
+            if upload_id is None:
+                upload_id = self.s3_client.create_multipart_upload(Bucket=bucket_name, Key=s3_key)['UploadId']
+            slots.acquire()
+            futures.append(executor.submit(upload_part, len(futures) + 1, bytes(body)))
+            bytes_out += len(body)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+                try:
+                    while True:
+                        chunk = fileobj.read(READ_SIZE)
+                        if not chunk:
+                            break
+                        bytes_in += len(chunk)
+                        buffer += compressor.compress(chunk) if compressor else chunk
+                        size = next_part_size()
+                        while len(buffer) >= size:
+                            flush(buffer[:size])
+                            del buffer[:size]
+                            size = next_part_size()
+                    if compressor:
+                        buffer += compressor.flush()
+                    if upload_id is not None and buffer:
+                        next_part_size()
+                        flush(buffer)
+                        buffer.clear()
+                    parts = [future.result() for future in futures]
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+            if before_complete:
+                before_complete()
+            if upload_id is None:
+                # smaller than one part : a single put is enough
+                self.s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=bytes(buffer))
+                bytes_out = len(buffer)
+            else:
+                self.s3_client.complete_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id,
+                                                         MultipartUpload={'Parts': parts})
+        except Exception as e:
+            print(f"Error streaming to s3://{bucket_name}/{s3_key}: {e}")
+            if upload_id is not None:
+                self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+            raise
+
+        elapsed = time.monotonic() - started
+        inc('s3_bytes_total', bytes_out, direction='upload')
+        print(f"Successfully streamed {bytes_in} bytes to s3://{bucket_name}/{s3_key}")
+        return {
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'parts': len(parts),
+            'elapsed': elapsed,
+            'mb_per_sec': bytes_in / 1024 / 1024 / elapsed if elapsed else 0.0,
+        }
+
+    def download_from_s3(self, bucket_name, s3_key, local_file_path=None, ranged=False):
         """
         Download a file from S3 to local.
         
         :param bucket_name: Name of the S3 bucket
         :param s3_key: Path/key of the file in the S3 bucket
         :param local_file_path: Optional local file path. If not provided, uses the S3 key filename.
+        :param ranged: Use download_ranged (parallel byte ranges, resumable)
         """
         # Create S3 client
         #s3_client = boto3.client('s3')
@@ -65,15 +221,277 @@ class s3Class():
             local_file_path = os.path.basename(s3_key)
         
         try:
+            if ranged:
+                return self.download_ranged(bucket_name, s3_key, local_file_path)
+
             # Ensure local directory exists
-            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            os.makedirs(os.path.dirname(local_file_path) or '.', exist_ok=True)
             
             # Download the file
-            self.s3_client.download_file(bucket_name, s3_key, local_file_path)
+            self.s3_client.download_file(bucket_name, s3_key, local_file_path, Config=self.transfer_config)
+            inc('s3_bytes_total', os.path.getsize(local_file_path), direction='download')
             print(f"Successfully downloaded s3://{bucket_name}/{s3_key} to {local_file_path}")
         except Exception as e:
             print(f"Error downloading file: {e}")
 
+    def download_ranged(self, bucket_name, s3_key, local_file_path=None, part_size=64 * MB, max_workers=None, verify=True):
+        """
+        Download one object as byte ranges fetched concurrently into a preallocated file.
+
+        Finished ranges are recorded in a <local_file_path>.state sidecar, so an
+        interrupted download resumes with only the missing ranges (as long as the
+        object's ETag has not changed). The file is checked against the size and
+        ETag at the end; SSE-KMS objects have no MD5 ETag and get the size check only.
+        
+        :param bucket_name: Name of the S3 bucket
+        :param s3_key: Path/key of the file in the S3 bucket
+        :param local_file_path: Optional local file path. If not provided, uses the S3 key filename.
+        :param part_size: Size of each range
+        :param max_workers: Ranges fetched at once (default : max_concurrency)
+        :param verify: Compare the file with the object's ETag (skipped for SSE-KMS objects)
+        :return: dict with bytes, resumed_bytes, elapsed, mb_per_sec
+        """
+        if local_file_path is None:
+            local_file_path = os.path.basename(s3_key)
+        os.makedirs(os.path.dirname(local_file_path) or '.', exist_ok=True)
+        started = time.monotonic()
+
+        head = client_call(self.s3_client, 'head_object', Bucket=bucket_name, Key=s3_key)
+        size, etag = head['ContentLength'], head['ETag']
+        ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+        state_path = f'{local_file_path}.state'
+        state = None
+        if os.path.exists(state_path) and os.path.exists(local_file_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if (state.get('etag'), state.get('size'), state.get('part_size')) != (etag, size, part_size):
+                print(f"{s3_key} changed since the interrupted download, starting over")
+                state = None
+        if state is None:
+            state = {'etag': etag, 'size': size, 'part_size': part_size, 'done': []}
+            with open(local_file_path, 'wb') as f:
+                f.truncate(size)
+        done = set(state['done'])
+        resumed_bytes = sum(ranges[index][1] - ranges[index][0] + 1 for index in done)
+        state_lock = threading.Lock()
+
+        def save_state():
+            tmp_path = f'{state_path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(state, done=sorted(done)), f)
+            os.replace(tmp_path, state_path)
+
+        def fetch(fd, index):
+            start, end = ranges[index]
+            body = self.s3_client.get_object(Bucket=bucket_name, Key=s3_key,
+                                             Range=f'bytes={start}-{end}', IfMatch=etag)['Body']
+            offset = start
+            for chunk in body.iter_chunks(READ_SIZE):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+            if offset != end + 1:
+                raise IOError(f'short read for bytes={start}-{end}')
+            os.fsync(fd)
+            inc('s3_bytes_total', end + 1 - start, direction='download')
+            with state_lock:
+                done.add(index)
+                save_state()
+
+        fd = os.open(local_file_path, os.O_RDWR)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or self.transfer_config.max_concurrency) as executor:
+                futures = [executor.submit(fetch, fd, index) for index in range(len(ranges)) if index not in done]
+                for future in futures:
+                    future.result()
+        except Exception as e:
+            print(f"Error downloading s3://{bucket_name}/{s3_key} ({len(done)}/{len(ranges)} ranges kept for resume): {e}")
+            raise
+        finally:
+            os.close(fd)
+
+        if os.path.getsize(local_file_path) != size:
+            raise IOError(f'{local_file_path} size {os.path.getsize(local_file_path)} != {size}')
+        if verify and head.get('ServerSideEncryption', '').startswith('aws:kms'):
+            # the ETag of an SSE-KMS (or DSSE-KMS) object is not an MD5 of its content
+            print(f"s3://{bucket_name}/{s3_key} is KMS-encrypted : checked by size only")
+        elif verify:
+            self._verify_etag(bucket_name, s3_key, local_file_path, etag)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+        elapsed = time.monotonic() - started
+        downloaded = size - resumed_bytes
+        print(f"Successfully downloaded s3://{bucket_name}/{s3_key} to {local_file_path}")
+        return {
+            'bytes': downloaded,
+            'resumed_bytes': resumed_bytes,
+            'elapsed': elapsed,
+            'mb_per_sec': downloaded / MB / elapsed if elapsed else 0.0,
+        }
+
+    def _verify_etag(self, bucket_name, s3_key, local_file_path, etag):
+        etag = etag.strip('"')
+        if '-' in etag:
+            # multipart ETag : rebuild it with the part size the object was uploaded with
+            first_part = client_call(self.s3_client, 'head_object',
+                                     Bucket=bucket_name, Key=s3_key, PartNumber=1)
+            expected = local_etag(local_file_path, 0, first_part['ContentLength'])
+        else:
+            expected = local_etag(local_file_path, os.path.getsize(local_file_path) + 1, MB)
+        if expected != etag:
+            raise IOError(f'{local_file_path} ETag {expected} does not match s3://{bucket_name}/{s3_key} ETag {etag}')
+
+    def _executor(self):
+        # one thread pool per object, shared by every bulk transfer
+        with self._executor_lock:
+            if self._transfer_executor is None:
+                self._transfer_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._transfer_executor
+
+    def close(self):
+        """
+        Shut down the bulk transfer thread pool (a later bulk transfer starts a new one).
+        """
+        with self._executor_lock:
+            executor, self._transfer_executor = self._transfer_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _same_object(self, local_file_path, size, etag, compare, bucket_name, s3_key):
+        if not os.path.exists(local_file_path) or os.path.getsize(local_file_path) != size:
+            return False
+        if compare == 'size':
+            return True
+        etag = etag.strip('"')
+        if '-' not in etag:
+            return local_etag(local_file_path, size + 1, MB) == etag
+        # multipart ETag : the object may come from another tool with another part size.
+        # Try ours when it gives the same part count, otherwise ask S3 for the size of part 1.
+        parts = int(etag.rsplit('-', 1)[1])
+        chunksize = self.transfer_config.multipart_chunksize
+        if -(-size // chunksize) == parts and local_etag(local_file_path, 0, chunksize) == etag:
+            return True
+        first_part = client_call(self.s3_client, 'head_object',
+                                 Bucket=bucket_name, Key=s3_key, PartNumber=1)
+        if first_part['ContentLength'] == chunksize:
+            return False
+        return local_etag(local_file_path, 0, first_part['ContentLength']) == etag
+
+    def _list_objects(self, bucket_name, prefix):
+        objects = {}
+        kwargs = {}
+        while True:
+            page = client_call(self.s3_client, 'list_objects_v2', Bucket=bucket_name, Prefix=prefix, **kwargs)
+            for item in page.get('Contents', []):
+                objects[item['Key']] = (item['Size'], item['ETag'])
+            if not page.get('IsTruncated'):
+                return objects
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+    def _run_bulk(self, transfers, direction):
+        """
+        Run (label, size, callable) transfers on the shared pool and report aggregate throughput.
+        """
+        started = time.monotonic()
+        result = {'files': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+        futures = {self._executor().submit(func): (label, size) for label, size, func in transfers}
+        for future in as_completed(futures):
+            label, size = futures[future]
+            try:
+                future.result()
+                result['files'] += 1
+                result['bytes'] += size
+                inc('s3_bytes_total', size, direction=direction)
+            except Exception as e:
+                result['failed'] += 1
+                inc('s3_transfer_errors_total', direction=direction)
+                print(f"Error transferring {label}: {e}")
+        result['elapsed'] = time.monotonic() - started
+        result['mb_per_sec'] = result['bytes'] / 1024 / 1024 / result['elapsed'] if result['elapsed'] else 0.0
+        return result
+
+    def upload_directory(self, local_dir, bucket_name, prefix='', compare='etag'):
+        """
+        Upload every file under local_dir to s3://bucket_name/prefix/<relative path>, in parallel.
+        
+        :param local_dir: Local directory to upload
+        :param bucket_name: Name of the S3 bucket
+        :param prefix: S3 key prefix (e.g. server-data-backup/20241011)
+        :param compare: 'etag' (size and ETag, whatever part size the object was uploaded with) or 'size' :
+                        files already in S3 are skipped
+        :return: dict with files, skipped, failed, bytes, elapsed, mb_per_sec
+        """
+        prefix = prefix.strip('/')
+        existing = self._list_objects(bucket_name, prefix + '/' if prefix else '')
+        transfers = []
+        skipped = 0
+        for root, _, names in os.walk(local_dir):
+            for name in names:
+                local_file_path = os.path.join(root, name)
+                relative = os.path.relpath(local_file_path, local_dir).replace(os.sep, '/')
+                s3_key = f'{prefix}/{relative}' if prefix else relative
+                if s3_key in existing and self._same_object(local_file_path, *existing[s3_key], compare,
+                                                            bucket_name, s3_key):
+                    skipped += 1
+                    continue
+                transfers.append((local_file_path, os.path.getsize(local_file_path),
+                                  partial(self.s3_client.upload_file, local_file_path, bucket_name, s3_key,
+                                          Config=self.transfer_config)))
+        result = self._run_bulk(transfers, 'upload')
+        result['skipped'] = skipped
+        print(f"Uploaded {result['files']} files ({result['skipped']} skipped, {result['failed']} failed) "
+              f"to s3://{bucket_name}/{prefix} at {result['mb_per_sec']:.1f} MB/s")
+        return result
+
+    def download_prefix(self, bucket_name, prefix, local_dir, compare='etag'):
+        """
+        Download every object under prefix (e.g. server-data-backup/<date>/) into local_dir, in parallel.
+        
+        :param bucket_name: Name of the S3 bucket
+        :param prefix: S3 key prefix, taken as a folder : 'pre' does not match 'prefix2/...'
+        :param local_dir: Local directory; keys keep their path relative to prefix.
+                          Keys that would land outside local_dir ('..' segments) are not downloaded
+                          and count as failed.
+        :param compare: 'etag' (size and ETag, whatever part size the object was uploaded with) or 'size' :
+                        files already present locally are skipped
+        :return: dict with files, skipped, failed, bytes, elapsed, mb_per_sec
+        """
+        prefix = prefix.strip('/')
+        folder = prefix + '/' if prefix else ''
+        root = os.path.abspath(local_dir)
+        transfers = []
+        skipped = unsafe = 0
+        for s3_key, (size, etag) in self._list_objects(bucket_name, folder).items():
+            if s3_key.endswith('/'):
+                continue
+            relative = s3_key[len(folder):]
+            local_file_path = os.path.abspath(os.path.join(root, *relative.split('/')))
+            if local_file_path == root or os.path.commonpath([root, local_file_path]) != root:
+                unsafe += 1
+                inc('s3_transfer_errors_total', direction='download')
+                print(f"Not downloading s3://{bucket_name}/{s3_key}: it would be written outside {root}")
+                continue
+            if self._same_object(local_file_path, size, etag, compare, bucket_name, s3_key):
+                skipped += 1
+                continue
+            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+            transfers.append((s3_key, size,
+                              partial(self.s3_client.download_file, bucket_name, s3_key, local_file_path,
+                                      Config=self.transfer_config)))
+        result = self._run_bulk(transfers, 'download')
+        result['skipped'] = skipped
+        result['failed'] += unsafe
+        print(f"Downloaded {result['files']} files ({result['skipped']} skipped, {result['failed']} failed) "
+              f"from s3://{bucket_name}/{prefix} at {result['mb_per_sec']:.1f} MB/s")
+        return result
+
 # Example usage
 if __name__ == "__main__":
     # Replace with your actual local file path and bucket name
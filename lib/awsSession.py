@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import boto3, threading
+from botocore.config import Config
+
+from lib.instrument import instrument_client
+
+# Services whose every call goes through lib.awsRetry : botocore's own retries are turned off on their
+# clients, so a throttle is retried by the engine alone instead of engine attempts x botocore attempts.
+# S3 keeps botocore retries : the transfer manager calls the client directly.
+ENGINE_RETRIED_SERVICES = frozenset(('rds', 'cloudwatch', 'pi'))
+NO_RETRIES = {'total_max_attempts': 1, 'mode': 'standard'}
+
+class clientPool():
+    """
+    Process-wide cache of boto3 sessions and clients.
+
+    Sessions are kept per profile and clients per (profile, region, service, config).
+    Every client gets the lib.instrument API-call hooks, and clients of
+    ENGINE_RETRIED_SERVICES are built without botocore retries.
+    Both are created lazily on first use. Creating a session reloads botocore's
+    service models, so reusing them saves time and memory in long-running daemons.
+    boto3 clients are thread-safe, sessions are not, so client creation is
+    serialized per profile while lookups of existing clients only take the pool lock.
+    """
+    def __init__(self) :
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._session_locks = {}
+        self._clients = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _profile_lock(self, profile) :
+        with self._lock :
+            if profile not in self._session_locks :
+                self._session_locks[profile] = threading.Lock()
+            return self._session_locks[profile]
+
+    def _get_session(self, profile) :
+        # caller holds the profile lock
+        session = self._sessions.get(profile)
+        if session is None :
+            session = boto3.Session(profile_name=profile)
+            self._sessions[profile] = session
+        return session
+
+    def get_session(self, profile=None) :
+        with self._profile_lock(profile) :
+            return self._get_session(profile)
+
+    def get_client(self, service, profile=None, region=None, config=None) :
+        key = (profile, region, service, _config_key(config))
+        with self._lock :
+            client = self._clients.get(key)
+            if client is not None :
+                self.hits += 1
+                return client
+
+        with self._profile_lock(profile) :
+            # another thread may have built it while we waited
+            with self._lock :
+                client = self._clients.get(key)
+                if client is not None :
+                    self.hits += 1
+                    return client
+            client = instrument_client(self._get_session(profile).client(service, region_name=region,
+                                                                         config=engine_config(service, config)))
+            with self._lock :
+                self._clients[key] = client
+                self.misses += 1
+            return client
+
+    def stats(self) :
+        with self._lock :
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'sessions': len(self._sessions),
+                'clients': len(self._clients),
+            }
+
+    def clear(self) :
+        with self._lock :
+            self._sessions.clear()
+            self._clients.clear()
+            self.hits = 0
+            self.misses = 0
+
+def engine_config(service, config=None, config_class=Config) :
+    """
+    config with botocore retries turned off for ENGINE_RETRIED_SERVICES; retries set in config win.
+    """
+    if service not in ENGINE_RETRIED_SERVICES :
+        return config
+    options = {'retries': NO_RETRIES}
+    if config is not None :
+        options.update(config._user_provided_options)
+    return config_class(**options)
+
+def client_account(client) :
+    """
+    Key of the credentials behind a boto3 / aiobotocore client : their access key id (None if unsigned).
+
+    Stands in for the account in per-account keys (rate limits, caches) without an STS call,
+    and does not keep the client itself alive the way keying on the client object would.
+    """
+    credentials = getattr(getattr(client, '_request_signer', None), '_credentials', None)
+    # refreshable credentials keep the key in _access_key; reading access_key could trigger a refresh
+    return getattr(credentials, '_access_key', None) or getattr(credentials, 'access_key', None)
+
+def _config_key(config) :
+    # botocore Config objects are not hashable, key them by the options the caller set
+    if config is None :
+        return None
+    options = getattr(config, '_user_provided_options', None) or vars(config)
+    return tuple(sorted((name, repr(value)) for name, value in options.items()))
+
+default_pool = clientPool()
+
+def get_session(profile=None) :
+    return default_pool.get_session(profile)
+
+def get_client(service, profile=None, region=None, config=None) :
+    return default_pool.get_client(service, profile, region, config)
+
+def pool_stats() :
+    return default_pool.stats()
+
+if __name__ == "__main__":
+    rds = get_client('rds')
+    rds_again = get_client('rds')
+    print(f'same client : {rds is rds_again}, stats : {pool_stats()}')
@@ -0,0 +1,247 @@
+import bisect
+import functools
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import nullcontext
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+_NULL_TIMER = nullcontext()
+
+class _timer():
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None:
+            self.registry.inc(self.name.rsplit('_seconds', 1)[0] + '_errors_total', **self.labels)
+        return False
+
+class metricRegistry():
+    """
+    In-process counters, gauges and latency histograms with JSON and Prometheus text export.
+
+    Every recording call returns right away while the registry is disabled, and
+    timed() then hands back a shared no-op context manager, so instrumented hot
+    paths cost one attribute check. Series are keyed by name and sorted label pairs.
+    """
+    def __init__(self, enabled=False, buckets=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # per bucket counts, sum, count
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timed(self, name, **labels):
+        """
+        Context manager observing the block's wall time in histogram name (and name_errors_total on exception).
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _timer(self, name, labels)
+
+    def _record_process(self):
+        # ru_maxrss is in KiB on Linux
+        self.set_gauge('process_peak_rss_bytes', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    def snapshot(self):
+        """
+        :return: {'counters': [...], 'gauges': [...], 'histograms': [...]}, each series with name, labels and values
+        """
+        if self.enabled:
+            self._record_process()
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self._counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                           for (name, labels), value in sorted(self._gauges.items())],
+                'histograms': [{
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': count,
+                    'sum': total,
+                    'buckets': dict(zip(('+Inf' if bound == float('inf') else bound for bound in self.buckets), counts))
+                } for (name, labels), (counts, total, count) in sorted(self._histograms.items())],
+            }
+
+    def export_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def export_prometheus(self):
+        """
+        Prometheus text exposition format (histogram buckets are cumulative).
+        """
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def labels_text(labels):
+            if not labels:
+                return ''
+            pairs = ','.join(
+                f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                for key, value in labels.items())
+            return '{' + pairs + '}'
+
+        for kind, metric_type in (('counters', 'counter'), ('gauges', 'gauge')):
+            for series in snapshot[kind]:
+                if series['name'] not in typed:
+                    typed.add(series['name'])
+                    lines.append(f"# TYPE {series['name']} {metric_type}")
+                lines.append(f"{series['name']}{labels_text(series['labels'])} {series['value']}")
+
+        for series in snapshot['histograms']:
+            name = series['name']
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in series['buckets'].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{labels_text({**series['labels'], 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{labels_text(series['labels'])} {series['sum']}")
+            lines.append(f"{name}_count{labels_text(series['labels'])} {series['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+# INSTRUMENT=1 turns recording on from the environment
+registry = metricRegistry(enabled=os.environ.get('INSTRUMENT', '').lower() in ('1', 'true', 'yes'))
+
+def enable():
+    registry.enabled = True
+
+def disable():
+    registry.enabled = False
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+def set_gauge(name, value, **labels):
+    registry.set_gauge(name, value, **labels)
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+def timed(name, **labels):
+    return registry.timed(name, **labels)
+
+def traced(name, **labels):
+    """
+    Decorator version of timed().
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return func(*args, **kwargs)
+            with _timer(registry, name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def export_json(indent=None):
+    return registry.export_json(indent)
+
+def export_prometheus():
+    return registry.export_prometheus()
+
+def instrument_client(client):
+    """
+    Register botocore event hooks that record every API call of client:
+    aws_api_call_seconds, aws_api_calls_total, aws_api_errors_total, aws_retries_total, aws_throttles_total
+    (labels service, operation, plus code for errors). The hooks return at once while recording is disabled.
+    """
+    # lib.awsRetry records its retries here, import it late
+    from lib.awsRetry import THROTTLING_ERROR_CODES
+
+    service = client.meta.service_model.service_name
+    event_service = client.meta.service_model.service_id.hyphenize()
+
+    def before_call(model, context, **kwargs):
+        if registry.enabled:
+            context['instrument_call'] = (model.name, time.perf_counter())
+
+    def finished(context, error_code=None, retries=0):
+        call = context.pop('instrument_call', None)
+        if call is None:
+            return
+        operation, started = call
+        registry.observe('aws_api_call_seconds', time.perf_counter() - started, service=service, operation=operation)
+        registry.inc('aws_api_calls_total', service=service, operation=operation)
+        if retries:
+            registry.inc('aws_retries_total', retries, service=service, operation=operation)
+        if error_code:
+            registry.inc('aws_api_errors_total', service=service, operation=operation, code=error_code)
+
+    def after_call(parsed, context, **kwargs):
+        finished(context, parsed.get('Error', {}).get('Code'), parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0))
+
+    def after_call_error(context, exception, **kwargs):
+        # connection and timeout errors, after botocore's own retries
+        finished(context, type(exception).__name__)
+
+    def needs_retry(operation, response=None, **kwargs):
+        # runs after every attempt, including the ones botocore retries itself
+        if registry.enabled and response is not None:
+            if response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+                registry.inc('aws_throttles_total', service=service, operation=operation.name)
+
+    events = client.meta.events
+    events.register(f'before-call.{event_service}', before_call)
+    events.register(f'after-call.{event_service}', after_call)
+    events.register(f'after-call-error.{event_service}', after_call_error)
+    events.register(f'needs-retry.{event_service}', needs_retry)
+    return client
+
+if __name__ == "__main__":
+    enable()
+    with timed('example_seconds', step='sleep'):
+        time.sleep(0.01)
+    inc('example_rows_total', 10, table='t')
+    print(export_prometheus())
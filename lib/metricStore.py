@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, datetime
+import numpy as np
+
+TS_FILE = 'ts.i8'
+VAL_FILE = 'val.f8'
+
+def _epoch(timestamp) :
+    if isinstance(timestamp, (int, np.integer)) :
+        return int(timestamp)
+    if isinstance(timestamp, str) :
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None :
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return int(timestamp.timestamp())
+
+def downsample(timestamps, values, bucket_seconds, agg='mean') :
+    """
+    Aggregate a sorted series into fixed buckets.
+
+    :param timestamps: int64 epoch seconds, ascending
+    :param values: float64 values
+    :param bucket_seconds: bucket width
+    :param agg: 'mean', 'max', 'min', 'sum' or 'count'
+    :return: (bucket start timestamps, aggregated values)
+    """
+    if not len(timestamps) :
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    buckets = timestamps // bucket_seconds * bucket_seconds
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    counts = np.diff(np.concatenate((starts, [len(values)])))
+    if agg == 'max' :
+        result = np.maximum.reduceat(values, starts)
+    elif agg == 'min' :
+        result = np.minimum.reduceat(values, starts)
+    elif agg == 'sum' :
+        result = np.add.reduceat(values, starts)
+    elif agg == 'mean' :
+        result = np.add.reduceat(values, starts) / counts
+    elif agg == 'count' :
+        result = counts.astype(np.float64)
+    else :
+        raise ValueError(f'unknown aggregation : {agg}')
+    return buckets[starts], result
+
+def rolling(values, window, agg='mean') :
+    """
+    Rolling aggregate over the last window points. The first window-1 points are NaN.
+
+    :param agg: 'mean', 'max', 'min' or 'std'
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) < window :
+        return result
+    if agg == 'mean' :
+        cumsum = np.cumsum(np.concatenate(([0.0], values)))
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    elif agg == 'std' :
+        cumsum = np.cumsum(np.concatenate(([0.0], values)))
+        cumsq = np.cumsum(np.concatenate(([0.0], values * values)))
+        mean = (cumsum[window:] - cumsum[:-window]) / window
+        var = (cumsq[window:] - cumsq[:-window]) / window - mean * mean
+        result[window - 1:] = np.sqrt(np.maximum(var, 0.0))
+    elif agg in ('max', 'min') :
+        view = np.lib.stride_tricks.sliding_window_view(values, window)
+        result[window - 1:] = view.max(axis=1) if agg == 'max' else view.min(axis=1)
+    else :
+        raise ValueError(f'unknown aggregation : {agg}')
+    return result
+
+class metricStore():
+    """
+    Columnar time series store on local disk.
+
+    Each (instance, metric) is a directory with two flat files: int64 epoch
+    seconds (ts.i8) and float64 values (val.f8). Appends go to the end of both
+    files and reads are memory-mapped, so queries over millions of points touch
+    only the pages of the requested range and never build per-point objects.
+    append_points / last_timestamp have the same signature as
+    pi_incremental.jsonlSeriesStore, so this store can be passed to collect_incremental.
+    """
+    def __init__(self, data_dir='metric_store') :
+        self.data_dir = data_dir
+
+    def _dir(self, instance, metric) :
+        return os.path.join(self.data_dir, instance, metric)
+
+    def _count(self, instance, metric) :
+        # a crash between the two writes leaves the files with different lengths: keep the common prefix
+        path = self._dir(instance, metric)
+        ts_path = os.path.join(path, TS_FILE)
+        val_path = os.path.join(path, VAL_FILE)
+        if not os.path.exists(ts_path) or not os.path.exists(val_path) :
+            return 0
+        count = min(os.path.getsize(ts_path) // 8, os.path.getsize(val_path) // 8)
+        for file_path in (ts_path, val_path) :
+            if os.path.getsize(file_path) != count * 8 :
+                os.truncate(file_path, count * 8)
+        return count
+
+    def append(self, instance, metric, timestamps, values) :
+        """
+        Append points newer than the last stored one. Returns the number appended.
+
+        :param timestamps: epoch seconds (any int array-like)
+        :param values: float values, same length
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+
+        last = self.last_epoch(instance, metric)
+        if last is not None :
+            keep = timestamps > last
+            timestamps, values = timestamps[keep], values[keep]
+        if not len(timestamps) :
+            return 0
+
+        path = self._dir(instance, metric)
+        os.makedirs(path, exist_ok=True)
+        # values first : the timestamp file decides what is committed
+        for file_name, data in ((VAL_FILE, values), (TS_FILE, timestamps)) :
+            with open(os.path.join(path, file_name), 'ab') as f :
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        return len(timestamps)
+
+    def append_points(self, instance, metric, points) :
+        """
+        Append [{'Timestamp': ISO string or datetime, 'Value': float}, ...] as returned by pi_cloudwatch.
+        """
+        points = list(points)
+        return self.append(instance, metric,
+                           [_epoch(point['Timestamp']) for point in points],
+                           [point['Value'] for point in points])
+
+    def append_results(self, results) :
+        """
+        Append every series of a get_performance_insights result.
+        """
+        instance = results['DatabaseInfo']['DBInstanceIdentifier']
+        appended = {}
+        for metric, metric_data in results['MetricsData'].items() :
+            appended[metric] = self.append_points(instance, metric, metric_data['TimeSeries'])
+        for metric, datapoints in results['SystemMetrics'].items() :
+            appended[metric] = self.append_points(instance, metric, datapoints)
+        return appended
+
+    def last_epoch(self, instance, metric) :
+        count = self._count(instance, metric)
+        if not count :
+            return None
+        with open(os.path.join(self._dir(instance, metric), TS_FILE), 'rb') as f :
+            f.seek((count - 1) * 8)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    def last_timestamp(self, instance, metric) :
+        last = self.last_epoch(instance, metric)
+        if last is None :
+            return None
+        return datetime.datetime.fromtimestamp(last, tz=datetime.timezone.utc)
+
+    def read(self, instance, metric, start=None, end=None) :
+        """
+        Memory-mapped (timestamps, values) for start <= ts < end (epoch seconds or datetime).
+        """
+        count = self._count(instance, metric)
+        if not count :
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        path = self._dir(instance, metric)
+        timestamps = np.memmap(os.path.join(path, TS_FILE), dtype=np.int64, mode='r', shape=(count,))
+        values = np.memmap(os.path.join(path, VAL_FILE), dtype=np.float64, mode='r', shape=(count,))
+        lo = 0 if start is None else np.searchsorted(timestamps, _epoch(start), 'left')
+        hi = count if end is None else np.searchsorted(timestamps, _epoch(end), 'left')
+        return timestamps[lo:hi], values[lo:hi]
+
+    def max(self, instance, metric, start=None, end=None) :
+        _, values = self.read(instance, metric, start, end)
+        return float(np.nanmax(values)) if len(values) else None
+
+    def percentile(self, instance, metric, q, start=None, end=None) :
+        _, values = self.read(instance, metric, start, end)
+        return np.nanpercentile(values, q) if len(values) else None
+
+    def downsample(self, instance, metric, bucket_seconds, agg='mean', start=None, end=None) :
+        timestamps, values = self.read(instance, metric, start, end)
+        return downsample(timestamps, values, bucket_seconds, agg)
+
+    def rolling(self, instance, metric, window, agg='mean', start=None, end=None) :
+        timestamps, values = self.read(instance, metric, start, end)
+        return timestamps, rolling(np.asarray(values), window, agg)
+
+if __name__ == "__main__":
+    store = metricStore('/tmp/metric_store')
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) // 60 * 60
+    timestamps = np.arange(now - 7 * 86400, now, 60, dtype=np.int64)
+    store.append('sample-instance', 'CPUUtilization', timestamps, np.random.rand(len(timestamps)) * 100)
+    print(f"max : {store.max('sample-instance', 'CPUUtilization')}")
+    print(f"p99 : {store.percentile('sample-instance', 'CPUUtilization', 99)}")
+    print(f"hourly max : {store.downsample('sample-instance', 'CPUUtilization', 3600, 'max')[1][:5]}")
@@ -0,0 +1,240 @@
+import threading
+import time
+from array import array
+from collections import Counter, deque
+
+import psycopg2
+
+SAMPLE_QUERY = """
+    select extract(epoch from clock_timestamp())::float8
+        ,pid
+        ,usename
+        ,coalesce(wait_event_type, 'CPU')
+        ,coalesce(wait_event, 'CPU')
+        ,extract(epoch from query_start)::float8
+        ,left(query, {query_length})
+    from pg_stat_activity
+    Where
+        usename not in ('rdsrepladmin')
+        and state = 'active'
+        and backend_type = 'client backend'
+        and pid <> pg_backend_pid()
+"""
+
+class activitySampler():
+    """
+    Active Session History for self-hosted Postgres.
+
+    Polls pg_stat_activity every interval seconds on one dedicated autocommit
+    connection with a prepared statement. Each active session of each sample is
+    one row of a fixed-size ring buffer made of compact arrays; strings (user,
+    wait event, query) are interned to reference-counted integer ids that are
+    freed when the last row using them is overwritten, so memory stays bounded
+    however many distinct query texts go by. Aggregates are updated as
+    rows enter and leave the buffer, so reading them costs nothing on the server
+    and no scan of the buffer:
+    - wait_event_summary : average active sessions by wait_event_type
+    - top_queries : queries by sampled time
+    - longest_running : longest runners of the latest sample
+    """
+    def __init__(self, db, interval=0.5, capacity=200000, query_length=1000):
+        # db : lib.pgConn.dbConn whose host/port/dbname/user/password are used
+        # capacity : rows (session samples) kept in the ring buffer
+        self.interval = interval
+        self.capacity = capacity
+        self.conn = psycopg2.connect(host=db.host, port=db.port, dbname=db.dbname, user=db.user, password=db.password,
+                                     application_name='pg_activity_sampler')
+        self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute('PREPARE ash_sample AS ' + SAMPLE_QUERY.format(query_length=int(query_length)))
+
+        self._lock = threading.Lock()
+        self._ts = array('d', bytes(8 * capacity))
+        self._pid = array('i', bytes(4 * capacity))
+        self._user = array('i', bytes(4 * capacity))
+        self._wait_type = array('i', bytes(4 * capacity))
+        self._wait_event = array('i', bytes(4 * capacity))
+        self._query = array('i', bytes(4 * capacity))
+        self._query_start = array('d', bytes(8 * capacity))
+        self._pos = 0
+        self._rows = 0
+
+        self._strings = []
+        self._string_ids = {}
+        self._refs = []
+        self._free_ids = []
+        self._samples = deque(maxlen=capacity)
+        self._by_wait_type = Counter()
+        self._by_wait_event = Counter()
+        self._by_query = Counter()
+        self._latest = []
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _intern(self, value):
+        # one reference per ring buffer row using the string
+        value = value or ''
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            if self._free_ids:
+                string_id = self._free_ids.pop()
+                self._strings[string_id] = value
+            else:
+                string_id = len(self._strings)
+                self._strings.append(value)
+                self._refs.append(0)
+            self._string_ids[value] = string_id
+        self._refs[string_id] += 1
+        return string_id
+
+    def _release(self, string_id):
+        self._refs[string_id] -= 1
+        if not self._refs[string_id]:
+            del self._string_ids[self._strings[string_id]]
+            self._strings[string_id] = None
+            self._free_ids.append(string_id)
+
+    def _decrement(self, counter, key):
+        counter[key] -= 1
+        if not counter[key]:
+            del counter[key]
+
+    def _evict(self, pos):
+        self._decrement(self._by_wait_type, self._wait_type[pos])
+        self._decrement(self._by_wait_event, (self._wait_type[pos], self._wait_event[pos]))
+        self._decrement(self._by_query, self._query[pos])
+        for string_id in (self._user[pos], self._wait_type[pos], self._wait_event[pos], self._query[pos]):
+            self._release(string_id)
+
+    def sample(self):
+        """
+        Take one sample and add its rows to the ring buffer.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute('EXECUTE ash_sample')
+            rows = cur.fetchall()
+        now = rows[0][0] if rows else time.time()
+
+        with self._lock:
+            latest = []
+            for _, pid, usename, wait_type, wait_event, query_start, query in rows:
+                pos = self._pos
+                if self._rows == self.capacity:
+                    self._evict(pos)
+                else:
+                    self._rows += 1
+                wait_type_id = self._intern(wait_type)
+                wait_event_id = self._intern(wait_event)
+                query_id = self._intern(query)
+                self._ts[pos] = now
+                self._pid[pos] = pid
+                self._user[pos] = self._intern(usename)
+                self._wait_type[pos] = wait_type_id
+                self._wait_event[pos] = wait_event_id
+                self._query[pos] = query_id
+                self._query_start[pos] = query_start or now
+                self._by_wait_type[wait_type_id] += 1
+                self._by_wait_event[(wait_type_id, wait_event_id)] += 1
+                self._by_query[query_id] += 1
+                latest.append(pos)
+                self._pos = (pos + 1) % self.capacity
+
+            self._samples.append(now)
+            # forget samples whose rows have all been overwritten
+            if self._rows == self.capacity:
+                oldest = self._ts[self._pos]
+                while self._samples and self._samples[0] < oldest:
+                    self._samples.popleft()
+            self._latest = latest
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                print(f'activity sample error : {e}')
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='pg-activity-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.conn.close()
+
+    def wait_event_summary(self, detail=False):
+        """
+        Average active sessions over the buffered window by wait_event_type (or (type, event) with detail).
+        """
+        with self._lock:
+            samples = max(len(self._samples), 1)
+            if detail:
+                counter = self._by_wait_event
+                return {(self._strings[wait_type], self._strings[wait_event]): count / samples
+                        for (wait_type, wait_event), count in counter.items() if count}
+            return {self._strings[wait_type]: count / samples
+                    for wait_type, count in self._by_wait_type.items() if count}
+
+    def top_queries(self, limit=10):
+        """
+        Queries by sampled time (rows x interval) over the buffered window.
+        """
+        with self._lock:
+            total = sum(self._by_query.values()) or 1
+            return [{
+                'query': self._strings[query_id],
+                'sampled_seconds': count * self.interval,
+                'share': count / total
+            } for query_id, count in self._by_query.most_common(limit) if count]
+
+    def longest_running(self, limit=10):
+        """
+        Longest running active queries of the latest sample.
+        """
+        with self._lock:
+            runners = [{
+                'pid': self._pid[pos],
+                'usename': self._strings[self._user[pos]],
+                'wait_event_type': self._strings[self._wait_type[pos]],
+                'wait_event': self._strings[self._wait_event[pos]],
+                'query': self._strings[self._query[pos]],
+                'runtime': self._ts[pos] - self._query_start[pos]
+            } for pos in self._latest]
+        runners.sort(key=lambda runner: runner['runtime'], reverse=True)
+        return runners[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'samples': len(self._samples),
+                'rows': self._rows,
+                'window_seconds': (self._samples[-1] - self._samples[0]) if self._samples else 0.0,
+                'strings': len(self._string_ids)
+            }
+
+if __name__ == "__main__":
+    from lib.pgConn import dbConn
+
+    db = dbConn(host='127.0.0.1', port=5432, dbname='postgres', user='postgres', password='')
+    sampler = activitySampler(db, interval=0.5).start()
+    try:
+        while True:
+            time.sleep(10)
+            print(f'wait events : {sampler.wait_event_summary()}')
+            print(f'top queries : {sampler.top_queries(5)}')
+            print(f'longest running : {sampler.longest_running(3)}')
+    except KeyboardInterrupt:
+        sampler.close()
+        db.close()
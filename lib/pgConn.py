@@ -1,12 +1,110 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
+from psycopg2 import sql
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import Json, RealDictCursor, execute_values
 import io 
+import os
 import subprocess
+import time
+import uuid
+from itertools import islice
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 
+from lib.instrument import inc, observe, timed
+from lib.pgPool import get_pool
+
+def _slots_row_class(columns) :
+    """
+    Build a small row class with __slots__ for the given column names.
+    """
+    # reuse namedtuple's renaming of invalid / duplicate column names
+    fields = namedtuple('Row', columns, rename=True)._fields
+
+    def __init__(self, *values) :
+        for field, value in zip(fields, values) :
+            setattr(self, field, value)
+
+    def __repr__(self) :
+        return 'Row({})'.format(', '.join(f'{field}={getattr(self, field)!r}' for field in fields))
+
+    return type('Row', (), {'__slots__': fields, '__init__': __init__, '__repr__': __repr__})
+
+def _row_factory(row_type, columns) :
+    if row_type == 'tuple' :
+        return lambda row : row
+    if row_type == 'dict' :
+        return lambda row : dict(zip(columns, row))
+    if row_type == 'namedtuple' :
+        return namedtuple('Row', columns, rename=True)._make
+    if row_type == 'slots' :
+        row_class = _slots_row_class(columns)
+        return lambda row : row_class(*row)
+    raise ValueError(f'unknown row_type : {row_type}')
+
+def _copy_text(value) :
+    if isinstance(value, Json) :
+        # json / jsonb : wrapped in Json exactly as execute_values requires
+        return value.dumps(value.adapted)
+    if isinstance(value, dict) :
+        raise TypeError('wrap json values in psycopg2.extras.Json')
+    if isinstance(value, (bytes, bytearray, memoryview)) :
+        # bytea hex format
+        return '\\x' + bytes(value).hex()
+    return str(value)
+
+def _copy_array_literal(values) :
+    # postgres array literal : {"a","b"}, NULL unquoted, nested lists = multidimensional
+    elements = []
+    for value in values :
+        if value is None :
+            elements.append('NULL')
+        elif isinstance(value, list) :
+            elements.append(_copy_array_literal(value))
+        else :
+            elements.append('"{}"'.format(_copy_text(value).replace('\\', '\\\\').replace('"', '\\"')))
+    return '{' + ','.join(elements) + '}'
+
+def _copy_csv_line(row) :
+    # COPY csv : unquoted empty field = NULL, quoted "" = empty string
+    fields = []
+    for value in row :
+        if value is None :
+            fields.append('')
+        elif isinstance(value, (int, float)) :
+            fields.append(str(value))
+        else :
+            # lists are arrays, as execute_values adapts them
+            value = _copy_array_literal(value) if isinstance(value, list) else _copy_text(value)
+            fields.append('"{}"'.format(value.replace('"', '""')))
+    return ','.join(fields) + '\n'
+
+def default_jobs() :
+    # parallel dump/restore workers : one per CPU
+    return max(1, os.cpu_count() or 1)
+
+def _path_size(path) :
+    if os.path.isdir(path) :
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _throughput(result) :
+    result['mb_per_sec'] = result['bytes'] / 1024 / 1024 / result['elapsed'] if result['elapsed'] else 0.0
+    return result
+
+def _print_progress(label, line) :
+    print(f'[{label}] {line}')
+
 class dbConn():
-    def __init__(self, host='127.0.0.1', port=5432, dbname='postgres', user='postgres', password=''):
+    def __init__(self, host='127.0.0.1', port=5432, dbname='postgres', user='postgres', password='',
+                 pooled=False, minconn=1, maxconn=10, connect_timeout=None, statement_timeout=None, **pool_kwargs):
+        # pooled : borrow a connection from the shared (host, port, dbname, user) pool for every call.
+        #          The object can then be used from several threads.
+        # minconn / maxconn / pool_kwargs : pool sizing, see lib.pgPool.connPool
+        # connect_timeout : seconds to wait for the connection
+        # statement_timeout : seconds after which the server cancels a query
         self.host = host
         self.port = port
         self.dbname = dbname
@@ -15,13 +113,41 @@ class dbConn():
         self.now = ''
         self.folder_name=datetime.now().strftime("%Y%m%d")
         self.pre_export_file=''
+        self.conn = None
+        self.cur = None
+        self.pool = None
+        # exception of a failed connection attempt (the constructor does not raise)
+        self.connect_error = None
+        # exception of the last failed select_execute (which returns None instead of raising)
+        self.query_error = None
+        connect_kwargs = {}
+        if connect_timeout :
+            connect_kwargs['connect_timeout'] = int(connect_timeout)
+        if statement_timeout :
+            connect_kwargs['options'] = f'-c statement_timeout={int(statement_timeout * 1000)}'
+        self.connect_kwargs = connect_kwargs
         try :
             print('Connection')
-            self.conn = psycopg2.connect(host=self.host, port=self.port, dbname=self.dbname, user=self.user, password=self.password)
-            self.cur = self.conn.cursor()
+            if pooled :
+                self.pool = get_pool(host=self.host, port=self.port, dbname=self.dbname, user=self.user, password=self.password,
+                                     minconn=minconn, maxconn=maxconn, **connect_kwargs, **pool_kwargs)
+            else :
+                self.conn = psycopg2.connect(host=self.host, port=self.port, dbname=self.dbname, user=self.user, password=self.password,
+                                             **connect_kwargs)
+                self.cur = self.conn.cursor()
         except Exception as e:
             print(f'Connection error : {e}')
+            self.connect_error = e
             return None
+
+    @contextmanager
+    def _connection(self) :
+        # pooled : a connection borrowed for the duration of one call, otherwise the object's own connection
+        if self.pool is None :
+            yield self.conn
+        else :
+            with self.pool.borrow() as conn :
+                yield conn
         
     def get_now(self) :
         self.now = datetime.now().strftime("%Y%m%d%H%M%S_%f")
@@ -29,24 +155,158 @@ class dbConn():
     
     def dml_execute(self, query) :
         try :
-            self.cur.execute(query)
-            self.conn.commit()
+            with timed('pg_query_seconds', operation='dml'), self._connection() as conn :
+                with conn.cursor() as cur :
+                    cur.execute(query)
+                    rowcount = cur.rowcount
+                conn.commit()
+            inc('pg_rows_total', max(rowcount, 0), operation='dml')
         except Exception as e :
             print(f'DML Execute Error : {e}')
     def select_execute(self, query) :
+        self.query_error = None
         try :
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            with timed('pg_query_seconds', operation='select'), self._connection() as conn, \
+                    conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(query)
                 results = cursor.fetchall()
             dict_results = [dict(row) for row in results]
+            inc('pg_rows_total', len(dict_results), operation='select')
 
             return dict_results
         except Exception as e :
             print(f'Select Exception {e}')
+            self.query_error = e
+
+    def select_stream(self, query, params=None, itersize=2000, batch_size=None, row_type='dict') :
+        """
+        Stream a query through a named (server-side) cursor.
+
+        Rows are pulled from the server itersize (or batch_size) at a time, so
+        memory stays flat whatever the size of the result set.
+
+        :param query: select query
+        :param params: optional query parameters
+        :param itersize: rows fetched per round trip when yielding single rows
+        :param batch_size: if set, yield lists of up to batch_size rows (one round trip each)
+        :param row_type: 'dict', 'tuple', 'namedtuple' or 'slots' (__slots__ row class)
+        """
+        started = time.perf_counter()
+        fetched = 0
+        with self._connection() as conn :
+            # named cursors need a transaction : close it afterwards if we opened it
+            was_idle = conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+            cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+            cursor.itersize = itersize
+            try :
+                cursor.execute(query, params)
+                make_row = None
+                if batch_size :
+                    while True :
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows :
+                            break
+                        if make_row is None :
+                            make_row = _row_factory(row_type, [column.name for column in cursor.description])
+                        fetched += len(rows)
+                        yield [make_row(row) for row in rows]
+                else :
+                    for row in cursor :
+                        if make_row is None :
+                            make_row = _row_factory(row_type, [column.name for column in cursor.description])
+                        fetched += 1
+                        yield make_row(row)
+            except Exception as e :
+                print(f'Select Stream Exception {e}')
+                inc('pg_query_errors_total', operation='stream')
+                raise
+            finally :
+                # the whole stream, including the time the caller spent between rows
+                observe('pg_query_seconds', time.perf_counter() - started, operation='stream')
+                inc('pg_rows_total', fetched, operation='stream')
+                try :
+                    cursor.close()
+                    if was_idle :
+                        conn.rollback()
+                except Exception as e :
+                    print(f'Select Stream close Exception {e}')
     
+    def bulk_insert(self, table_name, columns, rows, batch_size=5000, method='values',
+                    conflict_columns=None, update_columns=None) :
+        """
+        Write many rows in batches, one transaction per batch.
+
+        :param table_name: target table ('schema.table' allowed)
+        :param columns: column names, in the order of each row
+        :param rows: iterable of row tuples (consumed lazily, batch_size at a time);
+                     lists are written as arrays, json values must be wrapped in psycopg2.extras.Json
+        :param method: 'values' (execute_values multi-row INSERT) or 'copy' (COPY FROM STDIN)
+        :param conflict_columns: upsert on these columns (ON CONFLICT)
+        :param update_columns: columns updated on conflict (default : every other column, [] : DO NOTHING)
+        :return: number of rows written
+        """
+        table = sql.Identifier(*table_name.split('.'))
+        column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+        on_conflict = sql.SQL('')
+        if conflict_columns :
+            if update_columns is None :
+                update_columns = [column for column in columns if column not in conflict_columns]
+            if update_columns :
+                action = sql.SQL('DO UPDATE SET {}').format(sql.SQL(', ').join(
+                    sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(column)) for column in update_columns))
+            else :
+                action = sql.SQL('DO NOTHING')
+            on_conflict = sql.SQL(' ON CONFLICT ({}) {}').format(
+                sql.SQL(', ').join(map(sql.Identifier, conflict_columns)), action)
+
+        if method == 'values' :
+            insert_query = sql.SQL('INSERT INTO {} ({}) VALUES %s').format(table, column_list) + on_conflict
+        elif method == 'copy' :
+            # COPY can't upsert : load a temp table and insert from it
+            staging = sql.Identifier(f'bulk_{uuid.uuid4().hex}') if conflict_columns else table
+            copy_query = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT csv)').format(staging, column_list)
+        else :
+            raise ValueError(f'unknown method : {method}')
+
+        written = 0
+        rows = iter(rows)
+        with self._connection() as conn :
+            while True :
+                batch = list(islice(rows, batch_size))
+                if not batch :
+                    break
+                try :
+                    with timed('pg_query_seconds', operation=f'bulk_{method}'), conn.cursor() as cur :
+                        if method == 'values' :
+                            execute_values(cur, insert_query.as_string(conn), batch, page_size=len(batch))
+                        else :
+                            buffer = io.StringIO(''.join(_copy_csv_line(row) for row in batch))
+                            if conflict_columns :
+                                # only the loaded columns, without the target's constraints / identity / generated columns
+                                cur.execute(sql.SQL('CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA').format(
+                                    staging, column_list, table))
+                            cur.copy_expert(copy_query.as_string(conn), buffer)
+                            if conflict_columns :
+                                cur.execute(sql.SQL('INSERT INTO {0} ({1}) SELECT {1} FROM {2}').format(table, column_list, staging) + on_conflict)
+                    conn.commit()
+                    written += len(batch)
+                    inc('pg_rows_total', len(batch), operation=f'bulk_{method}')
+                except Exception as e :
+                    conn.rollback()
+                    print(f'Bulk Insert Error : {e}\nrows written before failure : {written}')
+                    raise
+        return written
+
     def ddl_index(self, query) :
         try :
-            self.cur.execute(query)
+            if self.pool is None :
+                self.cur.execute(query)
+            else :
+                # a borrowed connection is rolled back on return : commit here
+                with self._connection() as conn :
+                    with conn.cursor() as cur :
+                        cur.execute(query)
+                    conn.commit()
         except Exception as e : 
             print(f'index fail: {e}\nQuery info : {query}')
     
@@ -157,6 +417,171 @@ class dbConn():
             print(e)
             exit(1)
     
+    def _pg_command(self, binary, database) :
+        # password goes through PGPASSWORD : pg_dump/pg_restore have no option taking it
+        command = [binary,
+                   '--host={}'.format(self.host),
+                   '--port={}'.format(self.port),
+                   '--username={}'.format(self.user),
+                   '--dbname={}'.format(database),
+                   '--no-password']
+        env = dict(os.environ)
+        if self.password :
+            env['PGPASSWORD'] = self.password
+        return command, env
+
+    def _run_pg_job(self, label, command, env, progress) :
+        """
+        Run one pg_dump/pg_restore command, passing its verbose (-v) lines to progress(label, line).
+        """
+        print(f'command : {command}')
+        started = time.monotonic()
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+        for line in process.stderr :
+            progress(label, line.rstrip())
+        process.wait()
+        elapsed = time.monotonic() - started
+        if process.returncode != 0 :
+            print('Command failed. Return code : {}'.format(process.returncode))
+            raise RuntimeError(f'{label} failed with return code {process.returncode}')
+        return elapsed
+
+    def export_parallel(self, database, dest_file='/backup', jobs=None, export_type='', progress=_print_progress) :
+        """
+        Dump one database with pg_dump -Fd -j N (one worker per table at a time).
+
+        :param database: database to dump
+        :param dest_file: parent directory; the dump is a directory inside it
+        :param jobs: pg_dump workers (default : CPU count)
+        :param export_type: '', 'schema-only' or 'data-only'
+        :param progress: progress(label, line) called for every verbose pg_dump line
+        :return: {'path', 'jobs', 'elapsed', 'bytes', 'mb_per_sec'}
+        """
+        jobs = jobs or default_jobs()
+        dest_dir = f'{dest_file}/{self.get_now()}_{self.host}_{database}_backup.dir'
+        self.pre_export_file = dest_dir
+        command, env = self._pg_command('pg_dump', database)
+        command.extend(['-Fd', '-j', str(jobs), '-f', dest_dir, '-v'])
+        if export_type == 'schema-only' :
+            command.append('--schema-only')
+        elif export_type == 'data-only' :
+            command.append('--data-only')
+
+        elapsed = self._run_pg_job(database, command, env, progress)
+        return _throughput({'path': dest_dir, 'jobs': jobs, 'elapsed': elapsed, 'bytes': _path_size(dest_dir)})
+
+    @contextmanager
+    def _exported_snapshot(self, database) :
+        """
+        Export a snapshot of database with pg_export_snapshot() and yield its id.
+
+        The exporting transaction stays open until the block exits, so pg_dump
+        --snapshot=<id> can import the snapshot for that long.
+        """
+        conn = psycopg2.connect(host=self.host, port=self.port, dbname=database, user=self.user, password=self.password,
+                                **self.connect_kwargs)
+        try :
+            conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            with conn.cursor() as cur :
+                cur.execute('select pg_export_snapshot()')
+                yield cur.fetchone()[0]
+        finally :
+            conn.close()
+
+    def export_tables_parallel(self, database, table_name, dest_file='/backup', jobs=None, progress=_print_progress) :
+        """
+        Fan out one pg_dump -Fc --table=<table> per table, jobs at a time.
+
+        Every pg_dump imports the same exported snapshot (--snapshot), so the
+        tables are dumped consistently with each other, as one pg_dump would.
+
+        :return: {'jobs', 'snapshot', 'elapsed', 'bytes', 'mb_per_sec', 'tables': {table: {'path', 'elapsed', 'bytes', 'mb_per_sec'} or {'error'}}}
+        """
+        jobs = jobs or default_jobs()
+        now = self.get_now()
+
+        def dump_table(table, snapshot) :
+            dest = f'{dest_file}/{now}_{self.host}_{database}_{table}_backup.sql'
+            command, env = self._pg_command('pg_dump', database)
+            command.extend(['-Fc', '--table', table, '--snapshot', snapshot, '-f', dest, '-v'])
+            elapsed = self._run_pg_job(table, command, env, progress)
+            return _throughput({'path': dest, 'elapsed': elapsed, 'bytes': _path_size(dest)})
+
+        started = time.monotonic()
+        results = {}
+        with self._exported_snapshot(database) as snapshot, ThreadPoolExecutor(max_workers=jobs) as executor :
+            futures = {executor.submit(dump_table, table, snapshot): table for table in table_name}
+            for future in as_completed(futures) :
+                table = futures[future]
+                try :
+                    results[table] = future.result()
+                    print(f"{table} : {results[table]['bytes']} bytes, {results[table]['mb_per_sec']:.1f} MB/s")
+                except Exception as e :
+                    results[table] = {'error': str(e)}
+                    print(f'{table} export fail : {e}')
+        total = sum(result.get('bytes', 0) for result in results.values())
+        return _throughput({'jobs': jobs, 'snapshot': snapshot, 'elapsed': time.monotonic() - started,
+                            'bytes': total, 'tables': results})
+
+    def export_to_s3(self, s3, bucket_name, s3_key=None, database='', table_name=[], export_type='',
+                     dump_format='c', compress=None, part_size=16 * 1024 * 1024, max_in_flight=4) :
+        """
+        Stream pg_dump stdout straight into an S3 multipart upload, without a local dump file.
+
+        Dump and upload overlap, and memory stays bounded by s3.upload_stream's part buffers.
+        If pg_dump fails, the multipart upload is aborted so no partial object is left.
+
+        :param s3: lib.awsS3.s3Class instance
+        :param bucket_name: Name of the S3 bucket
+        :param s3_key: S3 key (default : same name export would use, under server-data-backup/<date>/)
+        :param dump_format: pg_dump format, 'c' (custom, already compressed) or 'p' (plain SQL)
+        :param compress: None or 'gzip' (useful with dump_format='p')
+        :return: s3.upload_stream result
+        """
+        if s3_key is None :
+            suffix = '.sql.gz' if compress == 'gzip' else '.sql'
+            name = f'{self.get_now()}_{self.host}_{database}_backup' if database else f'{self.get_now()}_{self.host}_backup'
+            s3_key = f'server-data-backup/{self.folder_name}/{name}{suffix}'
+
+        command, env = self._pg_command('pg_dump', database or self.dbname)
+        command.extend([f'-F{dump_format}', '-v'])
+        for table in table_name :
+            command.extend(['--table', table])
+        if export_type == 'schema-only' :
+            command.append('--schema-only')
+        elif export_type == 'data-only' :
+            command.append('--data-only')
+
+        print(f'command : {command}')
+        process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE)
+
+        def check_dump() :
+            if process.wait() != 0 :
+                print('Command failed. Return code : {}'.format(process.returncode))
+                raise RuntimeError(f'pg_dump failed with return code {process.returncode}')
+
+        try :
+            return s3.upload_stream(process.stdout, bucket_name, s3_key, part_size=part_size,
+                                    max_in_flight=max_in_flight, compress=compress, before_complete=check_dump)
+        finally :
+            if process.poll() is None :
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+    def pg_import_parallel(self, import_fullpath, database='postgres', jobs=None, progress=_print_progress) :
+        """
+        Restore a directory (-Fd) or custom (-Fc) dump with pg_restore -j N.
+
+        :return: {'path', 'jobs', 'elapsed', 'bytes', 'mb_per_sec'}
+        """
+        jobs = jobs or default_jobs()
+        command, env = self._pg_command('pg_restore', database)
+        command.extend(['-j', str(jobs), '-v', import_fullpath])
+        elapsed = self._run_pg_job(database, command, env, progress)
+        return _throughput({'path': import_fullpath, 'jobs': jobs, 'elapsed': elapsed, 'bytes': _path_size(import_fullpath)})
+
     def activity (self) :
         query = """
             select usename
@@ -182,10 +607,34 @@ class dbConn():
         """
         return self.select_execute(query)
 
+    def table_sizes (self) :
+        """
+        Table, index and total size (bytes) of every user table and materialized view.
+        """
+        query = """
+            select n.nspname as schema_name
+                ,c.relname as table_name
+                ,c.relkind
+                ,pg_table_size(c.oid) as table_size
+                ,pg_indexes_size(c.oid) as index_size
+                ,pg_total_relation_size(c.oid) as total_size
+            from pg_class c
+                join pg_namespace n on n.oid = c.relnamespace
+            Where
+                c.relkind in ('r', 'm', 'p')
+                and n.nspname not in ('pg_catalog', 'information_schema')
+                and n.nspname not like 'pg_toast%'
+            order by total_size desc ;
+        """
+        return self.select_execute(query)
+
     def close(self):
         """_summary_
             close
+            pooled : connections stay in the shared pool (lib.pgPool.close_pools closes them)
         """
+        if self.pool is not None :
+            return
         self.cur.close()
         self.conn.close()
 
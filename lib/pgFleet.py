@@ -0,0 +1,88 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.pgConn import dbConn
+
+# collector name -> dbConn method
+COLLECTORS = {
+    'activity': 'activity',
+    'sizes': 'table_sizes',
+}
+
+def _collect_host(host, collectors, timeout):
+    """
+    Connect to one host and run every collector on it (runs in a worker thread).
+    """
+    params = dict(host)
+    params.pop('name', None)
+    # the timeouts are enforced here, by libpq and the server : a thread cannot be cancelled from outside
+    db = dbConn(connect_timeout=timeout, statement_timeout=timeout, **params)
+    if db.conn is None :
+        raise ConnectionError(f"connection to {host.get('host')}:{host.get('port', 5432)} failed : "
+                              f"{str(db.connect_error).strip()}") from db.connect_error
+    try :
+        results = {}
+        for collector in collectors :
+            rows = getattr(db, COLLECTORS[collector])()
+            if rows is None :
+                raise RuntimeError(f'{collector} query failed : {str(db.query_error).strip()}') from db.query_error
+            results[collector] = rows
+        return results
+    finally :
+        db.close()
+
+async def collect_fleet_async(hosts, collectors=('activity', 'sizes'), max_concurrency=20, timeout=30) :
+    """
+    Run activity() and table_sizes() on every host concurrently.
+
+    :param hosts: list of dicts with dbConn arguments (host, port, dbname, user, password) and an optional name
+    :param collectors: any of 'activity', 'sizes'
+    :param max_concurrency: hosts collected at once
+    :param timeout: connect timeout and per-query statement timeout in seconds
+    :return: {'activity': [rows], 'sizes': [rows], 'errors': [{'host', 'error'}], 'hosts', 'succeeded', 'elapsed'}
+             every row is tagged with host, port, dbname
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    merged = {collector: [] for collector in collectors}
+    merged['errors'] = []
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor :
+        async def run(host) :
+            tag = {
+                'host': host.get('name', host.get('host')),
+                'port': host.get('port', 5432),
+                'dbname': host.get('dbname', 'postgres')
+            }
+            async with semaphore :
+                # no outer wait_for : it would only stop waiting while the worker thread kept running
+                try :
+                    results = await loop.run_in_executor(executor, _collect_host, host, collectors, timeout)
+                except Exception as e :
+                    merged['errors'].append({**tag, 'error': str(e)})
+                    return
+            for collector, rows in results.items() :
+                merged[collector].extend({**tag, **row} for row in rows)
+
+        await asyncio.gather(*(run(host) for host in hosts))
+
+    merged['hosts'] = len(hosts)
+    merged['succeeded'] = len(hosts) - len(merged['errors'])
+    merged['elapsed'] = time.monotonic() - started
+    return merged
+
+def collect_fleet(hosts, collectors=('activity', 'sizes'), max_concurrency=20, timeout=30) :
+    return asyncio.run(collect_fleet_async(hosts, collectors, max_concurrency, timeout))
+
+if __name__ == "__main__":
+    hosts = [
+        {'host': '127.0.0.1', 'port': 5432, 'dbname': 'postgres', 'user': 'postgres', 'password': ''},
+    ]
+    result = collect_fleet(hosts)
+    print(f"{result['succeeded']}/{result['hosts']} hosts in {result['elapsed']:.2f}s")
+    for row in result['sizes'][:10] :
+        print(f"{row['host']} {row['schema_name']}.{row['table_name']} : {row['total_size']}")
+    for error in result['errors'] :
+        print(f"{error['host']} : {error['error']}")
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+class PoolTimeout(Exception):
+    pass
+
+class connPool():
+    """
+    Thread-safe psycopg2 connection pool for one (host, port, dbname, user).
+
+    - keeps between minconn and maxconn connections
+    - checks a connection with "select 1" on checkout if it sat idle longer than check_after seconds
+    - closes connections idle longer than idle_timeout (never below minconn),
+      on every checkout/return and from a background reaper thread
+    - borrow() is a context manager that always returns the connection
+    """
+    def __init__(self, host='127.0.0.1', port=5432, dbname='postgres', user='postgres', password='',
+                 minconn=1, maxconn=10, idle_timeout=300, check_after=30, reap_interval=60, **connect_kwargs):
+        self.host = host
+        self.port = port
+        self.dbname = dbname
+        self.user = user
+        self.password = password
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, last_used), most recently used on the right
+        self._in_use = 0
+        self._closed = False
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+        self._stop = threading.Event()
+        self._reaper = None
+        if reap_interval:
+            self._reaper = threading.Thread(target=self._reap_loop, args=(reap_interval,), daemon=True)
+            self._reaper.start()
+
+    def _connect(self):
+        return psycopg2.connect(host=self.host, port=self.port, dbname=self.dbname,
+                                user=self.user, password=self.password, **self.connect_kwargs)
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('select 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reap_locked(self):
+        now = time.monotonic()
+        while (len(self._idle) + self._in_use > self.minconn and self._idle
+               and now - self._idle[0][1] > self.idle_timeout):
+            conn, _ = self._idle.popleft()
+            self._close(conn)
+
+    def _reap_loop(self, interval):
+        while not self._stop.wait(interval):
+            with self._cond:
+                self._reap_locked()
+
+    def reap(self):
+        with self._cond:
+            self._reap_locked()
+
+    def getconn(self, timeout=None):
+        """
+        Check out a healthy connection, waiting up to timeout seconds when maxconn are in use.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError('connection pool is closed')
+                self._reap_locked()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._in_use < self.maxconn:
+                    conn, last_used = None, None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout(f'no connection available for {self.host}:{self.port}/{self.dbname}')
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        # connect / health check outside the lock
+        try:
+            if conn is not None and not self._healthy(conn, time.monotonic() - last_used):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, close=False):
+        """
+        Return a connection. An open transaction is rolled back; a broken connection is discarded.
+        """
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                close = True
+        with self._cond:
+            self._in_use -= 1
+            if close or conn.closed or self._closed:
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._reap_locked()
+            self._cond.notify()
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def stats(self):
+        with self._cond:
+            return {'idle': len(self._idle), 'in_use': self._in_use,
+                    'minconn': self.minconn, 'maxconn': self.maxconn}
+
+    def closeall(self):
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close(conn)
+            self._cond.notify_all()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _pool_key(host, port, dbname, user, password, pool_kwargs):
+    # every argument that changes the pool : callers asking for other credentials,
+    # connection options or sizing get their own pool
+    return (host, port, dbname, user, password, tuple(sorted(pool_kwargs.items())))
+
+def get_pool(host='127.0.0.1', port=5432, dbname='postgres', user='postgres', password='', **pool_kwargs):
+    """
+    Return the process-wide pool for these arguments, creating it on first use.
+
+    Pools are keyed by every argument (password, minconn / maxconn, connect
+    options included), so two callers only share a pool they both asked for.
+    A new pool opens its minconn connections outside the registry lock; if
+    another thread registered the same pool meanwhile, that one is returned
+    and the new one closed.
+    """
+    key = _pool_key(host, port, dbname, user, password, pool_kwargs)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and not pool._closed:
+            return pool
+        _pools.pop(key, None)
+
+    created = connPool(host, port, dbname, user, password, **pool_kwargs)
+    with _pools_lock:
+        pool = _pools.setdefault(key, created)
+    if pool is not created:
+        created.closeall()
+    return pool
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
@@ -0,0 +1,146 @@
+import json
+import os
+import tempfile
+import time
+
+# Catalog-only query : no relation file is touched
+SIGNATURE_QUERY = """
+    select c.oid
+        ,n.nspname as schema_name
+        ,c.relname
+        ,c.relkind
+        ,c.relfilenode
+        ,c.reltuples
+        ,coalesce(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0) as writes
+        ,coalesce(s.vacuum_count + s.autovacuum_count, 0) as vacuums
+    from pg_class c
+        join pg_namespace n on n.oid = c.relnamespace
+        left join pg_index i on i.indexrelid = c.oid
+        left join pg_stat_all_tables s on s.relid = coalesce(i.indrelid, c.oid)
+    Where
+        c.relkind in ('r', 'm', 'i')
+        and n.nspname not in ('pg_catalog', 'information_schema')
+        and n.nspname not like 'pg_toast%'
+"""
+
+SIZE_QUERY = """
+    select oid
+        ,pg_relation_size(oid) as relation_size
+        ,pg_total_relation_size(oid) as total_size
+    from unnest(%s::oid[]) as oid
+"""
+
+class sizeCollector():
+    """
+    Table/index size collection that re-measures only relations that changed.
+
+    Every run reads a cheap catalog signature per relation (relfilenode,
+    reltuples, the table's insert/update/delete and vacuum counters; indexes
+    use their table's counters) and calls pg_relation_size /
+    pg_total_relation_size only for new relations and relations whose
+    signature changed. Every full_every runs all relations are measured again.
+    Results and a size history per relation are kept in a local JSON cache,
+    from which growth rates are computed.
+    """
+    def __init__(self, db, cache_path=None, history_length=200, full_every=24, batch_size=1000):
+        # db : lib.pgConn.dbConn
+        self.db = db
+        self.cache_path = cache_path or f'size_cache_{db.host}_{db.port}_{db.dbname}.json'
+        self.history_length = history_length
+        self.full_every = full_every
+        self.batch_size = batch_size
+        self.cache = {'runs': 0, 'relations': {}}
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path) as f:
+                self.cache = json.load(f)
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.size_cache-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def _measure(self, oids):
+        sizes = {}
+        for offset in range(0, len(oids), self.batch_size):
+            batch = [int(oid) for oid in oids[offset:offset + self.batch_size]]
+            for oid, relation_size, total_size in self.db.select_stream(SIZE_QUERY, (batch,), row_type='tuple'):
+                # NULL : the relation was dropped after the signature query
+                if total_size is not None:
+                    sizes[str(oid)] = (relation_size, total_size)
+        return sizes
+
+    def collect(self):
+        """
+        Refresh the cache and return one dict per relation:
+        schema_name, relname, relkind, relation_size, total_size, growth_per_day, measured
+        """
+        now = time.time()
+        full = self.full_every and self.cache['runs'] % self.full_every == 0
+        cached = self.cache['relations']
+
+        current = {}
+        changed = []
+        for oid, schema_name, relname, relkind, relfilenode, reltuples, writes, vacuums in \
+                self.db.select_stream(SIGNATURE_QUERY, row_type='tuple'):
+            oid = str(oid)
+            signature = [relfilenode, float(reltuples), int(writes), int(vacuums)]
+            entry = cached.get(oid)
+            if entry is None or full or entry['signature'] != signature:
+                changed.append(oid)
+                entry = {'history': [] if entry is None else entry['history']}
+            entry.update({'schema_name': schema_name, 'relname': relname, 'relkind': relkind,
+                          'signature': signature})
+            current[oid] = entry
+
+        sizes = self._measure(changed) if changed else {}
+        for oid in changed:
+            if oid not in sizes:
+                del current[oid]
+
+        for oid, (relation_size, total_size) in sizes.items():
+            entry = current[oid]
+            entry['relation_size'] = relation_size
+            entry['total_size'] = total_size
+            if not entry['history'] or entry['history'][-1][1] != total_size:
+                entry['history'].append([now, total_size])
+                del entry['history'][:-self.history_length]
+
+        # relations dropped since the last run disappear with the rebuild
+        self.cache = {'runs': self.cache['runs'] + 1, 'relations': current}
+        self._save()
+        print(f'size collect : {len(sizes)}/{len(current)} relations measured{" (full)" if full else ""}')
+
+        return [{
+            'schema_name': entry['schema_name'],
+            'relname': entry['relname'],
+            'relkind': entry['relkind'],
+            'relation_size': entry.get('relation_size'),
+            'total_size': entry.get('total_size'),
+            'growth_per_day': self.growth_rate(oid),
+            'measured': oid in sizes
+        } for oid, entry in current.items()]
+
+    def growth_rate(self, oid):
+        """
+        Bytes per day between the first and last recorded size of a relation.
+        """
+        history = self.cache['relations'].get(str(oid), {}).get('history', [])
+        if len(history) < 2 or history[-1][0] == history[0][0]:
+            return 0.0
+        return (history[-1][1] - history[0][1]) / (history[-1][0] - history[0][0]) * 86400
+
+if __name__ == "__main__":
+    from lib.pgConn import dbConn
+
+    db = dbConn(host='127.0.0.1', port=5432, dbname='postgres', user='postgres', password='')
+    sizes = sizeCollector(db).collect()
+    for relation in sorted(sizes, key=lambda relation: relation['total_size'] or 0, reverse=True)[:10]:
+        print(f"{relation['schema_name']}.{relation['relname']} ({relation['relkind']}) : "
+              f"{relation['total_size']} bytes, {relation['growth_per_day']:.0f} bytes/day")
+    db.close()
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio, os, pickle, tempfile, threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class ttlCache():
+    """
+    Thread-safe TTL cache with LRU eviction, optionally persisted to disk.
+
+    get_or_load(key, loader) returns the cached value while it is younger than
+    ttl and calls loader() otherwise; concurrent misses on the same key wait
+    for a single loader() call and share its result (or error);
+    get_or_load_async does the same for a coroutine loader. With
+    stale_while_revalidate an expired value is returned immediately and
+    refreshed in a background thread (one refresh per key at a time). ttl=None keeps entries until they are evicted.
+    With persist_path the cache is pickled to disk after every load and read
+    back on start, so cached values survive between runs.
+    """
+    def __init__(self, maxsize=256, ttl=300, persist_path=None, stale_while_revalidate=False) :
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.stale_while_revalidate = stale_while_revalidate
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._refreshing = set()
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        if persist_path and os.path.exists(persist_path) :
+            try :
+                with open(persist_path, 'rb') as f :
+                    self._data = pickle.load(f)
+            except Exception as e :
+                print(f'cache load fail : {persist_path}, {e}')
+
+    def _fresh(self, stored_at) :
+        return self.ttl is None or time.time() - stored_at < self.ttl
+
+    def _save(self) :
+        # caller holds the lock
+        if not self.persist_path :
+            return
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cache-')
+        try :
+            with os.fdopen(fd, 'wb') as f :
+                pickle.dump(self._data, f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e :
+            os.unlink(tmp_path)
+            print(f'cache save fail : {self.persist_path}, {e}')
+
+    def get(self, key, default=None) :
+        with self._lock :
+            entry = self._data.get(key)
+            if entry is None or not self._fresh(entry[1]) :
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value) :
+        with self._lock :
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize :
+                self._data.popitem(last=False)
+            self._save()
+
+    def set_many(self, items) :
+        """
+        set() for every (key, value) of items with a single save to disk.
+        """
+        with self._lock :
+            now = time.time()
+            for key, value in items :
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize :
+                self._data.popitem(last=False)
+            self._save()
+
+    def _refresh(self, key, loader) :
+        try :
+            self.set(key, loader())
+        except Exception as e :
+            print(f'cache refresh fail : {key}, {e}')
+        finally :
+            with self._lock :
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, loader) :
+        try :
+            self.set(key, await loader())
+        except Exception as e :
+            print(f'cache refresh fail : {key}, {e}')
+        finally :
+            with self._lock :
+                self._refreshing.discard(key)
+
+    def _lookup(self, key, start_refresh) :
+        """
+        (True, value) on a hit, otherwise (False, (loading future, waiting)).
+        """
+        with self._lock :
+            entry = self._data.get(key)
+            if entry is not None :
+                self._data.move_to_end(key)
+                if self._fresh(entry[1]) :
+                    self.hits += 1
+                    return True, entry[0]
+                if self.stale_while_revalidate :
+                    self.stale_hits += 1
+                    if key not in self._refreshing :
+                        self._refreshing.add(key)
+                        start_refresh()
+                    return True, entry[0]
+            self.misses += 1
+            # single flight : the first caller loads, the others wait for its result
+            loading = self._loading.get(key)
+            if loading is not None :
+                return False, (loading, True)
+            loading = self._loading[key] = Future()
+            return False, (loading, False)
+
+    def _loaded(self, key, loading, value=None, error=None) :
+        try :
+            if error is None :
+                self.set(key, value)
+                loading.set_result(value)
+            else :
+                loading.set_exception(error)
+        finally :
+            with self._lock :
+                del self._loading[key]
+
+    def get_or_load(self, key, loader) :
+        hit, found = self._lookup(
+            key, lambda : threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start())
+        if hit :
+            return found
+        loading, waiting = found
+        if waiting :
+            return loading.result()
+        try :
+            value = loader()
+        except BaseException as e :
+            self._loaded(key, loading, error=e)
+            raise
+        self._loaded(key, loading, value)
+        return value
+
+    async def get_or_load_async(self, key, loader) :
+        """
+        get_or_load for a coroutine loader : waiters await instead of blocking the loop.
+
+        Shares the single flight of get_or_load, so sync and async callers of a key load it once.
+        """
+        hit, found = self._lookup(key, lambda : asyncio.ensure_future(self._refresh_async(key, loader)))
+        if hit :
+            return found
+        loading, waiting = found
+        if waiting :
+            return await asyncio.wrap_future(loading)
+        try :
+            value = await loader()
+        except BaseException as e :
+            # cancelled loads release their waiters too
+            self._loaded(key, loading, error=e)
+            raise
+        self._loaded(key, loading, value)
+        return value
+
+    def invalidate(self, key=None) :
+        """
+        Drop one key, or every key when key is None.
+        """
+        with self._lock :
+            if key is None :
+                self._data.clear()
+            else :
+                self._data.pop(key, None)
+            self._save()
+
+    def stats(self) :
+        with self._lock :
+            return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses, 'stale_hits': self.stale_hits}
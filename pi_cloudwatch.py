@@ -1,125 +1,282 @@
-import boto3
 import datetime
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 
-def get_rds_metrics(db_instance_identifier, start_time=None, end_time=None):
+from lib.awsRetry import client_call
+from lib.awsSession import get_client
+from lib.instrument import traced
+
+# CloudWatch metrics returned in SystemMetrics
+RDS_METRICS = ['CPUUtilization', 'DatabaseConnections']
+
+# get_metric_statistics returns at most 1,440 datapoints per request
+MAX_METRIC_DATAPOINTS = 1440
+RDS_METRIC_PERIOD = 60
+
+def _format_datapoints(responses):
+    # CloudWatch returns datapoints unordered : merge the windows in time order
+    datapoints = sorted((datapoint for response in responses for datapoint in response['Datapoints']),
+                        key=lambda datapoint: datapoint['Timestamp'])
+    return [{
+        'Timestamp': datapoint['Timestamp'].isoformat(),
+        'Value': datapoint['Maximum']
+    } for datapoint in datapoints]
+
+def _rds_metric_windows(start_time, end_time, chunk):
+    """
+    CloudWatch windows of at most chunk, each short enough to stay under MAX_METRIC_DATAPOINTS.
+    """
+    chunk = min(chunk, datetime.timedelta(seconds=MAX_METRIC_DATAPOINTS * RDS_METRIC_PERIOD))
+    return _split_time_range(start_time, end_time, chunk, RDS_METRIC_PERIOD)
+
+@traced('collect_seconds', collector='get_rds_metrics')
+def get_rds_metrics(db_instance_identifier, start_time=None, end_time=None, cloudwatch=None,
+                    chunk=datetime.timedelta(hours=1)):
     """
     Get RDS CPU and connection metrics using CloudWatch
+
+    The range is requested in chunk-sized windows (at most 1,440 one-minute
+    datapoints each) and the datapoints are merged in time order.
     """
     try:
-        cloudwatch = boto3.client('cloudwatch')
+        cloudwatch = cloudwatch or get_client('cloudwatch')
         
         if not end_time:
             end_time = datetime.datetime.utcnow()
         if not start_time:
             start_time = end_time - datetime.timedelta(hours=1)
 
-        metrics = [
-            'CPUUtilization',
-            'DatabaseConnections'
-        ]
-        
+        windows = _rds_metric_windows(start_time, end_time, chunk)
         results = {}
-        for metric in metrics:
-            response = cloudwatch.get_metric_statistics(
+        for metric in RDS_METRICS:
+            responses = [client_call(
+                cloudwatch,
+                'get_metric_statistics',
                 Namespace='AWS/RDS',
                 MetricName=metric,
                 Dimensions=[{'Name': 'DBInstanceIdentifier', 
                            'Value': db_instance_identifier}],
-                StartTime=start_time,
-                EndTime=end_time,
-                Period=60,
+                StartTime=window_start,
+                EndTime=window_end,
+                Period=RDS_METRIC_PERIOD,
                 Statistics=['Maximum']
-            )
+            ) for window_start, window_end in windows]
             
-            results[metric] = [{
-                'Timestamp': datapoint['Timestamp'].isoformat(),
-                'Value': datapoint['Maximum']
-            } for datapoint in response['Datapoints']]
+            results[metric] = _format_datapoints(responses)
             
         return results
     except ClientError as e:
         print(f"Error accessing CloudWatch metrics: {e}")
         raise
 
+# Dimension that identifies one member of each supported GroupBy group
+GROUP_DIMENSIONS = {
+    'db.sql_tokenized': 'db.sql_tokenized.id',
+    'db.sql': 'db.sql.id',
+    'db.wait_event': 'db.wait_event.name',
+    'db.user': 'db.user.name',
+    'db.host': 'db.host.name',
+}
+
+# get_resource_metrics accepts at most 15 MetricQueries per request
+MAX_METRIC_QUERIES = 15
+
+def _split_time_range(start_time, end_time, chunk, period_in_seconds):
+    """
+    Split [start_time, end_time) into consecutive windows of about chunk, aligned to the period.
+    """
+    chunk_seconds = max(period_in_seconds, int(chunk.total_seconds()) // period_in_seconds * period_in_seconds)
+    windows = []
+    window_start = start_time
+    while window_start < end_time:
+        window_end = min(end_time, window_start + datetime.timedelta(seconds=chunk_seconds))
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+def _build_metric_queries(metrics, group_by, limit):
+    # One query per (metric, group); each one also returns the metric's total series
+    if not group_by:
+        return [{'Metric': metric} for metric in metrics]
+    return [
+        {
+            'Metric': metric,
+            'GroupBy': {
+                'Group': group,
+                'Limit': limit
+            }
+        } for metric in metrics for group in group_by
+    ]
+
+def _fetch_resource_metrics(pi_client, db_instance_identifier, start_time, end_time,
+                            metric_queries, period_in_seconds):
+    """
+    Return every MetricList entry for one window, following NextToken.
+    """
+    metric_list = []
+    for offset in range(0, len(metric_queries), MAX_METRIC_QUERIES):
+        kwargs = {}
+        while True:
+            response = client_call(
+                pi_client,
+                'get_resource_metrics',
+                ServiceType='RDS',
+                Identifier=db_instance_identifier,
+                StartTime=start_time,
+                EndTime=end_time,
+                MetricQueries=metric_queries[offset:offset + MAX_METRIC_QUERIES],
+                PeriodInSeconds=period_in_seconds,
+                **kwargs
+            )
+            metric_list.extend(response.get('MetricList', []))
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+    return metric_list
+
+def _merge_metric_lists(metric_lists):
+    """
+    Merge the MetricLists of consecutive windows into {(metric, dimensions): {timestamp: value}}.
+
+    The same total series comes back once per group query, so datapoints are
+    keyed by timestamp to drop the duplicates.
+    """
+    merged = {}
+    for metric_list in metric_lists:
+        for entry in metric_list:
+            key = (entry['Key']['Metric'], tuple(sorted(entry['Key'].get('Dimensions', {}).items())))
+            datapoints = merged.setdefault(key, {})
+            for datapoint in entry.get('DataPoints', []):
+                if datapoint.get('Value') is not None:
+                    datapoints[datapoint['Timestamp']] = datapoint['Value']
+    return merged
+
+def _format_metrics_data(merged, group_by, limit, window_periods):
+    """
+    Build the MetricsData section of get_performance_insights from merged series.
+
+    Group members are ranked by their average value over the whole window
+    (periods where a member fell out of the top list count as zero).
+    """
+    metrics_data = {}
+    for (metric_name, dimensions), datapoints in merged.items():
+        metric_data = metrics_data.setdefault(metric_name, {
+            'TimeSeries': [],
+            'TopQueries': [],
+            'Groups': {}
+        })
+
+        if not dimensions:
+            metric_data['TimeSeries'] = [{
+                'Timestamp': timestamp.isoformat(),
+                'Value': datapoints[timestamp]
+            } for timestamp in sorted(datapoints)]
+            continue
+
+        dimensions = dict(dimensions)
+        group = next((group for group in group_by
+                      if any(name.startswith(group + '.') for name in dimensions)), None)
+        if group is None:
+            continue
+        metric_data['Groups'].setdefault(group, []).append({
+            'Id': dimensions.get(GROUP_DIMENSIONS.get(group), next(iter(dimensions.values()))),
+            'Dimensions': dimensions,
+            'Value': sum(datapoints.values()) / max(window_periods, 1)
+        })
+
+    for metric_data in metrics_data.values():
+        for group, members in metric_data['Groups'].items():
+            members.sort(key=lambda member: member['Value'], reverse=True)
+            del members[limit:]
+        sql_group = metric_data['Groups'].get('db.sql_tokenized', metric_data['Groups'].get('db.sql', []))
+        metric_data['TopQueries'] = [{
+            'QueryID': member['Id'],
+            'Metrics': member['Value']
+        } for member in sql_group]
+    return metrics_data
+
+def _format_results(db_instance_identifier, start_time, end_time, metric_lists,
+                    cloudwatch_metrics, group_by, limit, period_in_seconds):
+    window_periods = int((end_time - start_time).total_seconds()) // period_in_seconds
+
+    # Format all results
+    return {
+        'DatabaseInfo': {
+            'DBInstanceIdentifier': db_instance_identifier,
+            'TimeRange': {
+                'StartTime': start_time.isoformat(),
+                'EndTime': end_time.isoformat()
+            }
+        },
+        'MetricsData': _format_metrics_data(
+            _merge_metric_lists(metric_lists),
+            group_by or [],
+            limit,
+            window_periods
+        ),
+        'SystemMetrics': cloudwatch_metrics
+    }
+
+@traced('collect_seconds', collector='get_performance_insights')
 def get_performance_insights(
     db_instance_identifier,
     start_time=None,
     end_time=None,
-    metrics=['db.load.avg', 'db.sampledload.avg']
+    metrics=['db.load.avg', 'db.sampledload.avg'],
+    group_by=['db.sql_tokenized'],
+    limit=10,
+    period_in_seconds=60,
+    chunk=datetime.timedelta(hours=1),
+    max_workers=8,
+    pi_client=None,
+    cloudwatch=None
 ):
     """
     Retrieve RDS Performance Insights metrics for a specified DB instance.
+
+    The time range is split into chunk-sized windows that are fetched
+    concurrently (every page of each) and merged back in time order. Each
+    metric is grouped by every group in group_by (db.sql_tokenized, db.sql,
+    db.wait_event, db.user, db.host); the top members per group are in
+    MetricsData[metric]['Groups'][group] and the SQL ones also in 'TopQueries'.
     """
     try:
-        pi_client = boto3.client('pi')
+        pi_client = pi_client or get_client('pi')
         
         if not end_time:
             end_time = datetime.datetime.utcnow()
         if not start_time:
             start_time = end_time - datetime.timedelta(hours=1)
 
-        response = pi_client.get_resource_metrics(
-            ServiceType='RDS',
-            Identifier=db_instance_identifier,
-            StartTime=start_time,
-            EndTime=end_time,
-            MetricQueries=[
-                {
-                    'Metric': metric,
-                    'GroupBy': {
-                        'Group': 'db',
-                        'Dimensions': ['db.sql_tokenized'],
-                        'Limit': 10
-                    }
-                } for metric in metrics
-            ],
-            PeriodInSeconds=60
-        )
-        
-        # Get additional CloudWatch metrics
-        cloudwatch_metrics = get_rds_metrics(
-            db_instance_identifier,
-            start_time,
-            end_time
-        )
-        
-        # Format all results
-        formatted_results = {
-            'DatabaseInfo': {
-                'DBInstanceIdentifier': db_instance_identifier,
-                'TimeRange': {
-                    'StartTime': start_time.isoformat(),
-                    'EndTime': end_time.isoformat()
-                }
-            },
-            'MetricsData': {},
-            'SystemMetrics': cloudwatch_metrics
-        }
-        
-        for metric_result in response['MetricList']:
-            metric_name = metric_result['Metric']
-            formatted_results['MetricsData'][metric_name] = {
-                'TimeSeries': [],
-                'TopQueries': []
-            }
-            
-            # Process time series data
-            for datapoint in metric_result.get('DataPoints', []):
-                formatted_results['MetricsData'][metric_name]['TimeSeries'].append({
-                    'Timestamp': datapoint['Timestamp'].isoformat(),
-                    'Value': datapoint['Value']
-                })
-            
-            # Process top queries
-            for group in metric_result.get('Groups', []):
-                query_info = {
-                    'QueryID': group['Group']['Value'],
-                    'Metrics': group['Value']
-                }
-                formatted_results['MetricsData'][metric_name]['TopQueries'].append(query_info)
-        
-        return formatted_results
+        metric_queries = _build_metric_queries(metrics, group_by, limit)
+        windows = _split_time_range(start_time, end_time, chunk, period_in_seconds)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Get additional CloudWatch metrics while PI windows are fetched
+            cloudwatch_future = executor.submit(
+                get_rds_metrics,
+                db_instance_identifier,
+                start_time,
+                end_time,
+                cloudwatch,
+                chunk
+            )
+            metric_lists = list(executor.map(
+                lambda window: _fetch_resource_metrics(
+                    pi_client,
+                    db_instance_identifier,
+                    window[0],
+                    window[1],
+                    metric_queries,
+                    period_in_seconds
+                ),
+                windows
+            ))
+            cloudwatch_metrics = cloudwatch_future.result()
+
+        return _format_results(db_instance_identifier, start_time, end_time, metric_lists,
+                               cloudwatch_metrics, group_by, limit, period_in_seconds)
         
     except ClientError as e:
         print(f"Error accessing Performance Insights: {e}")
@@ -154,7 +311,7 @@ if __name__ == "__main__":
         print("\nSystem Metrics:")
         for metric_name, datapoints in results['SystemMetrics'].items():
             print(f"\n{metric_name}:")
-            for dp in sorted(datapoints, key=lambda x: x['Timestamp'])[:5]:  # Show first 5 points
+            for dp in heapq.nsmallest(5, datapoints, key=lambda x: x['Timestamp']):  # Show first 5 points
                 print(f"  {dp['Timestamp']}: {dp['Value']:.2f}")
         
         # Print Performance Insights metrics
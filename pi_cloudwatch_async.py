@@ -0,0 +1,178 @@
+import asyncio
+import datetime
+from botocore.exceptions import ClientError
+
+from lib.awsAsync import client_scope
+from lib.awsRetry import async_client_call
+from pi_cloudwatch import (
+    RDS_METRICS, MAX_METRIC_QUERIES,
+    RDS_METRIC_PERIOD,
+    _format_datapoints, _rds_metric_windows, _split_time_range, _build_metric_queries, _format_results
+)
+
+async def get_rds_metrics(db_instance_identifier, start_time=None, end_time=None, cloudwatch=None, pool=None,
+                          chunk=datetime.timedelta(hours=1)):
+    """
+    Async get_rds_metrics: every (metric, window) is requested concurrently
+    """
+    try:
+        async with client_scope(pool) as pool:
+            cloudwatch = cloudwatch or await pool.get_client('cloudwatch')
+
+            if not end_time:
+                end_time = datetime.datetime.utcnow()
+            if not start_time:
+                start_time = end_time - datetime.timedelta(hours=1)
+
+            windows = _rds_metric_windows(start_time, end_time, chunk)
+            responses = await asyncio.gather(*(
+                async_client_call(
+                    cloudwatch,
+                    'get_metric_statistics',
+                    Namespace='AWS/RDS',
+                    MetricName=metric,
+                    Dimensions=[{'Name': 'DBInstanceIdentifier',
+                               'Value': db_instance_identifier}],
+                    StartTime=window_start,
+                    EndTime=window_end,
+                    Period=RDS_METRIC_PERIOD,
+                    Statistics=['Maximum']
+                ) for metric in RDS_METRICS for window_start, window_end in windows
+            ))
+
+        return {metric: _format_datapoints(responses[index * len(windows):(index + 1) * len(windows)])
+                for index, metric in enumerate(RDS_METRICS)}
+    except ClientError as e:
+        print(f"Error accessing CloudWatch metrics: {e}")
+        raise
+
+async def _fetch_resource_metrics(pi_client, db_instance_identifier, start_time, end_time,
+                                  metric_queries, period_in_seconds, semaphore):
+    """
+    Return every MetricList entry for one window; query batches run concurrently, pages in order.
+    """
+    async def fetch_batch(offset):
+        metric_list = []
+        kwargs = {}
+        while True:
+            async with semaphore:
+                response = await async_client_call(
+                    pi_client,
+                    'get_resource_metrics',
+                    ServiceType='RDS',
+                    Identifier=db_instance_identifier,
+                    StartTime=start_time,
+                    EndTime=end_time,
+                    MetricQueries=metric_queries[offset:offset + MAX_METRIC_QUERIES],
+                    PeriodInSeconds=period_in_seconds,
+                    **kwargs
+                )
+            metric_list.extend(response.get('MetricList', []))
+            if not response.get('NextToken'):
+                return metric_list
+            kwargs['NextToken'] = response['NextToken']
+
+    batches = await asyncio.gather(*(
+        fetch_batch(offset) for offset in range(0, len(metric_queries), MAX_METRIC_QUERIES)))
+    return [entry for batch in batches for entry in batch]
+
+async def get_performance_insights(
+    db_instance_identifier,
+    start_time=None,
+    end_time=None,
+    metrics=['db.load.avg', 'db.sampledload.avg'],
+    group_by=['db.sql_tokenized'],
+    limit=10,
+    period_in_seconds=60,
+    chunk=datetime.timedelta(hours=1),
+    max_concurrency=8,
+    pi_client=None,
+    cloudwatch=None,
+    pool=None
+):
+    """
+    Async get_performance_insights, same result.
+
+    Every PI window and the CloudWatch metrics are awaited together on the
+    running loop; max_concurrency bounds the PI requests in flight for this
+    instance. Pass one lib.awsAsync.asyncClientPool to share clients and
+    connections between calls.
+    """
+    try:
+        async with client_scope(pool) as pool:
+            pi_client = pi_client or await pool.get_client('pi')
+            cloudwatch = cloudwatch or await pool.get_client('cloudwatch')
+
+            if not end_time:
+                end_time = datetime.datetime.utcnow()
+            if not start_time:
+                start_time = end_time - datetime.timedelta(hours=1)
+
+            metric_queries = _build_metric_queries(metrics, group_by, limit)
+            windows = _split_time_range(start_time, end_time, chunk, period_in_seconds)
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            cloudwatch_metrics, *metric_lists = await asyncio.gather(
+                get_rds_metrics(db_instance_identifier, start_time, end_time, cloudwatch, pool, chunk),
+                *(_fetch_resource_metrics(
+                    pi_client,
+                    db_instance_identifier,
+                    window_start,
+                    window_end,
+                    metric_queries,
+                    period_in_seconds,
+                    semaphore
+                ) for window_start, window_end in windows)
+            )
+
+        return _format_results(db_instance_identifier, start_time, end_time, metric_lists,
+                               cloudwatch_metrics, group_by, limit, period_in_seconds)
+
+    except ClientError as e:
+        print(f"Error accessing Performance Insights: {e}")
+        raise
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        raise
+
+async def get_performance_insights_many(db_instance_identifiers, start_time=None, end_time=None,
+                                        max_instances=16, pool=None, **kwargs):
+    """
+    get_performance_insights for many instances at once, max_instances at a time.
+
+    Returns {db_instance_identifier: result}; a failed instance maps to {'Error': message}.
+    """
+    if not end_time:
+        end_time = datetime.datetime.utcnow()
+    if not start_time:
+        start_time = end_time - datetime.timedelta(hours=1)
+    semaphore = asyncio.Semaphore(max_instances)
+
+    async with client_scope(pool) as pool:
+        async def collect(db_instance_identifier):
+            async with semaphore:
+                try:
+                    return await get_performance_insights(db_instance_identifier, start_time, end_time,
+                                                          pool=pool, **kwargs)
+                except Exception as e:
+                    return {'Error': str(e)}
+
+        results = await asyncio.gather(*(collect(identifier) for identifier in db_instance_identifiers))
+
+    return dict(zip(db_instance_identifiers, results))
+
+# Example usage
+if __name__ == "__main__":
+    # Replace with your DB instance identifiers
+    DB_INSTANCES = ["your-db-instance-identifier"]
+
+    results = asyncio.run(get_performance_insights_many(DB_INSTANCES))
+    for db_instance, result in results.items():
+        print(f"\nDatabase: {db_instance}")
+        if 'Error' in result:
+            print(f"Error: {result['Error']}")
+            continue
+        for metric_name, metric_data in result['MetricsData'].items():
+            print(f"Metric: {metric_name}")
+            for query in metric_data['TopQueries']:
+                print(f"  Query ID: {query['QueryID']}, Value: {query['Metrics']}")
@@ -0,0 +1,168 @@
+import datetime
+import json
+import os
+import tempfile
+
+from pi_cloudwatch import get_performance_insights
+
+def _to_utc(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.datetime.fromisoformat(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(datetime.timezone.utc)
+
+class checkpointStore():
+    """
+    High-water-mark timestamp per DB instance, kept in a local JSON file.
+
+    The file is rewritten atomically (temp file + fsync + rename), so a crash
+    leaves either the previous or the new checkpoint on disk, never a torn one.
+    """
+    def __init__(self, path='pi_checkpoint.json'):
+        self.path = path
+        self.checkpoints = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.checkpoints = json.load(f)
+
+    def get(self, db_instance_identifier):
+        timestamp = self.checkpoints.get(db_instance_identifier)
+        return _to_utc(timestamp) if timestamp else None
+
+    def set(self, db_instance_identifier, timestamp):
+        self.checkpoints[db_instance_identifier] = _to_utc(timestamp).isoformat()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.checkpoints, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+class jsonlSeriesStore():
+    """
+    Append-only time series store: one JSON Lines file per (instance, metric).
+
+    Each line is {"Timestamp": <ISO-8601>, "Value": <float>}. Points at or before
+    the last stored timestamp are skipped, so re-fetching an overlapping window
+    after a crash never duplicates data.
+    """
+    def __init__(self, data_dir='pi_data'):
+        self.data_dir = data_dir
+
+    def _path(self, db_instance_identifier, metric):
+        return os.path.join(self.data_dir, db_instance_identifier, f'{metric}.jsonl')
+
+    def _repair_tail(self, path):
+        # drop a line left half-written by a crash
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if not size:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            block = min(size, 65536)
+            f.seek(size - block)
+            tail = f.read(block)
+            f.truncate(size - block + tail.rfind(b'\n') + 1 if b'\n' in tail else 0)
+
+    def last_timestamp(self, db_instance_identifier, metric):
+        path = self._path(db_instance_identifier, metric)
+        if not os.path.exists(path):
+            return None
+        self._repair_tail(path)
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if not size:
+                return None
+            block = min(size, 65536)
+            f.seek(size - block)
+            last_line = f.read(block).rstrip(b'\n').rsplit(b'\n', 1)[-1]
+        return _to_utc(json.loads(last_line)['Timestamp'])
+
+    def append_points(self, db_instance_identifier, metric, points):
+        """
+        Append [{'Timestamp', 'Value'}, ...] newer than the last stored point. Returns the number appended.
+        """
+        last = self.last_timestamp(db_instance_identifier, metric)
+        new_points = sorted(
+            ((_to_utc(point['Timestamp']), point['Value']) for point in points),
+            key=lambda point: point[0]
+        )
+        if last is not None:
+            new_points = [point for point in new_points if point[0] > last]
+        if not new_points:
+            return 0
+
+        path = self._path(db_instance_identifier, metric)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            for timestamp, value in new_points:
+                f.write(json.dumps({'Timestamp': timestamp.isoformat(), 'Value': value}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return len(new_points)
+
+def collect_incremental(db_instance_identifier, checkpoints, store,
+                        period_seconds=60,
+                        initial_window=datetime.timedelta(hours=1),
+                        lag=datetime.timedelta(minutes=2),
+                        now=None):
+    """
+    Fetch only the interval since the instance's last checkpoint and append it to the store.
+
+    The window ends at now - lag (Performance Insights and CloudWatch publish with
+    a small delay), aligned down to period_seconds. The checkpoint is advanced only
+    after the data is on disk; if the process dies in between, the next run
+    re-fetches the same interval and the store drops the points it already has.
+
+    Returns:
+        Dict of {metric: number of points appended}
+    """
+    now = _to_utc(now or datetime.datetime.now(datetime.timezone.utc))
+    end_time = now - lag
+    end_time -= datetime.timedelta(seconds=end_time.timestamp() % period_seconds)
+
+    start_time = checkpoints.get(db_instance_identifier)
+    if start_time is None:
+        start_time = end_time - initial_window
+    if end_time <= start_time:
+        return {}
+
+    results = get_performance_insights(
+        db_instance_identifier=db_instance_identifier,
+        start_time=start_time,
+        end_time=end_time,
+        # only the totals are stored : skip the per-group series
+        group_by=[]
+    )
+
+    appended = {}
+    for metric_name, metric_data in results['MetricsData'].items():
+        appended[metric_name] = store.append_points(db_instance_identifier, metric_name, metric_data['TimeSeries'])
+    for metric_name, datapoints in results['SystemMetrics'].items():
+        appended[metric_name] = store.append_points(db_instance_identifier, metric_name, datapoints)
+
+    checkpoints.set(db_instance_identifier, end_time)
+    return appended
+
+# Example usage : run every minute from cron
+if __name__ == "__main__":
+    DB_INSTANCES = ["your-db-instance-identifier"]
+
+    checkpoints = checkpointStore('pi_checkpoint.json')
+    store = jsonlSeriesStore('pi_data')
+    for db_instance in DB_INSTANCES:
+        try:
+            appended = collect_incremental(db_instance, checkpoints, store)
+            print(f"{db_instance}: {appended}")
+        except Exception as e:
+            print(f"Error collecting {db_instance}: {e}")
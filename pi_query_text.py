@@ -0,0 +1,173 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+from lib.awsRetry import client_call
+from lib.awsSession import get_client
+from lib.instrument import inc
+from lib.ttlCache import ttlCache
+
+# get_dimension_key_details only accepts db.sql, db.query, db.execution_plan and db.lock_snapshot groups
+QUERY_GROUP = 'db.sql'
+STATEMENT_DIMENSION = 'db.sql.statement'
+
+class queryTextCache():
+    """
+    Full SQL text of Performance Insights db.sql ids, kept in a local file.
+
+    db.sql groups only carry the statement id and a truncated statement; the
+    full text takes one get_dimension_key_details call per statement. Texts
+    are keyed by (instance, id), never expire (an id always maps to the same
+    statement) and are evicted least-recently-used beyond maxsize. resolve()
+    looks every id up first and fetches only the misses, concurrently, saving
+    the new texts to disk in one write.
+    """
+    def __init__(self, path='pi_query_text.cache', maxsize=10000, max_workers=8):
+        self.cache = ttlCache(maxsize=maxsize, ttl=None, persist_path=path)
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+
+    def _fetch_statement(self, pi_client, db_instance_identifier, query_id):
+        """
+        Full statement text, or None while PI is still processing it (or it is unavailable).
+        """
+        response = client_call(
+            pi_client,
+            'get_dimension_key_details',
+            ServiceType='RDS',
+            Identifier=db_instance_identifier,
+            Group=QUERY_GROUP,
+            GroupIdentifier=query_id,
+            RequestedDimensions=[STATEMENT_DIMENSION]
+        )
+        for dimension in response.get('Dimensions', []):
+            if dimension.get('Dimension') == STATEMENT_DIMENSION and dimension.get('Status') == 'AVAILABLE':
+                return dimension.get('Value')
+        return None
+
+    def resolve(self, keys, pi_client=None):
+        """
+        Full SQL text of every (db_instance_identifier, query_id) in keys.
+
+        Returns {(db_instance_identifier, query_id): text}; text is None when PI
+        has no full text yet or the call failed. Only available texts are
+        cached, so the others are asked for again on the next run. If every
+        lookup fails (bad request, no access) the first error is raised.
+        """
+        texts = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            text = self.cache.get(key)
+            if text is None:
+                missing.append(key)
+            else:
+                texts[key] = text
+        self.hits += len(texts)
+        self.misses += len(missing)
+        inc('pi_query_text_lookups_total', len(texts), result='hit')
+        inc('pi_query_text_lookups_total', len(missing), result='miss')
+        if not missing:
+            return texts
+
+        pi_client = pi_client or get_client('pi')
+
+        errors = []
+
+        def fetch(key):
+            try:
+                return self._fetch_statement(pi_client, *key)
+            except ClientError as e:
+                print(f"Error resolving query text {key[1]} on {key[0]}: {e}")
+                inc('pi_query_text_errors_total')
+                errors.append(e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fetched = dict(zip(missing, executor.map(fetch, missing)))
+        if len(errors) == len(missing):
+            raise errors[0]
+
+        self.cache.set_many((key, text) for key, text in fetched.items() if text is not None)
+        texts.update(fetched)
+        return texts
+
+    def stats(self):
+        return dict(self.cache.stats(), hits=self.hits, misses=self.misses)
+
+def _window_seconds(result):
+    time_range = result['DatabaseInfo']['TimeRange']
+    start_time = datetime.datetime.fromisoformat(time_range['StartTime'])
+    end_time = datetime.datetime.fromisoformat(time_range['EndTime'])
+    return (end_time - start_time).total_seconds()
+
+def aggregate_statement_load(results, cache=None, metric='db.load.avg', pi_client=None):
+    """
+    Total DB load per SQL statement over many get_performance_insights results.
+
+    Args:
+        results: get_performance_insights results collected with 'db.sql' in group_by,
+                 any mix of instances and time windows
+        cache (queryTextCache): Resolves the db.sql ids to full SQL text (default: a new queryTextCache)
+        metric (str): Load metric grouped by db.sql (default: db.load.avg)
+        pi_client: Optional boto3 Performance Insights client for the cache misses
+
+    Returns:
+        List of {'Statement', 'DBLoadSeconds', 'Instances': {instance: load seconds}, 'QueryIDs'},
+        highest load first. A member's load is its average active sessions times
+        the length of its window, so windows of different lengths add up.
+        Statements without full text fall back to the truncated PI statement.
+    """
+    cache = cache or queryTextCache()
+    members = []
+    for result in results:
+        db_instance_identifier = result['DatabaseInfo']['DBInstanceIdentifier']
+        seconds = _window_seconds(result)
+        groups = result['MetricsData'].get(metric, {}).get('Groups', {})
+        for member in groups.get(QUERY_GROUP, []):
+            members.append((db_instance_identifier, member, member['Value'] * seconds))
+
+    texts = cache.resolve(((db_instance_identifier, member['Id'])
+                           for db_instance_identifier, member, _ in members), pi_client)
+
+    statements = {}
+    for db_instance_identifier, member, load in members:
+        text = (texts.get((db_instance_identifier, member['Id']))
+                or member['Dimensions'].get(STATEMENT_DIMENSION)
+                or member['Id'])
+        statement = statements.setdefault(text, {
+            'Statement': text,
+            'DBLoadSeconds': 0.0,
+            'Instances': {},
+            'QueryIDs': []
+        })
+        statement['DBLoadSeconds'] += load
+        statement['Instances'][db_instance_identifier] = statement['Instances'].get(db_instance_identifier, 0.0) + load
+        if member['Id'] not in statement['QueryIDs']:
+            statement['QueryIDs'].append(member['Id'])
+
+    return sorted(statements.values(), key=lambda statement: statement['DBLoadSeconds'], reverse=True)
+
+# Example usage
+if __name__ == "__main__":
+    from pi_cloudwatch import get_performance_insights
+
+    try:
+        # Replace with your DB instance identifiers
+        DB_INSTANCES = ["your-db-instance-identifier"]
+
+        end = datetime.datetime.utcnow()
+        start = end - datetime.timedelta(hours=1)
+
+        results = [get_performance_insights(db_instance_identifier=db_instance, start_time=start, end_time=end,
+                                            group_by=[QUERY_GROUP])
+                   for db_instance in DB_INSTANCES]
+
+        cache = queryTextCache()
+        for statement in aggregate_statement_load(results, cache)[:10]:
+            print(f"\nLoad: {statement['DBLoadSeconds']:.1f} session-seconds on {', '.join(statement['Instances'])}")
+            print(f"  {statement['Statement']}")
+        print(f"\nQuery text cache: {cache.stats()}")
+
+    except Exception as e:
+        print(f"Error running script: {e}")
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+# the scripts and lib/ are imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.awsSession import default_pool
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    """
+    Name of an empty bucket in a moto-mocked S3; pooled clients are rebuilt inside the mock.
+    """
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    default_pool.clear()
+    with mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='backup-bucket')
+        yield 'backup-bucket'
+    default_pool.clear()
+
+class asyncStub():
+    """
+    aiobotocore-like view of a boto3 client (stubbed with botocore.stub.Stubber) : every operation is a coroutine.
+    """
+    def __init__(self, client):
+        self._client = client
+        self.meta = client.meta
+        self._request_signer = client._request_signer
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        async def call(**params):
+            # let concurrent calls interleave, as real requests would
+            await asyncio.sleep(0)
+            return method(**params)
+        return call
+
+class stubPool():
+    """
+    asyncClientPool stand-in handing out fixed clients by service.
+    """
+    def __init__(self, clients):
+        self.clients = clients
+
+    async def get_client(self, service, profile=None, region=None):
+        return self.clients[service]
+
+@pytest.fixture
+def async_stub():
+    return asyncStub
+
+@pytest.fixture
+def stub_pool():
+    return stubPool
@@ -0,0 +1,34 @@
+import boto3
+import botocore
+import pytest
+from botocore.stub import Stubber
+
+from lib import awsRDS
+from lib.awsRDS import rdsClass
+from lib.ttlCache import ttlCache
+
+def test_invalidate_drops_the_unfiltered_subnet_group_listing():
+    rds = rdsClass(None, region='us-east-1', cache=ttlCache())
+    rds._rds_client = boto3.client('rds', region_name='us-east-1')
+
+    with Stubber(rds._rds_client) as stubber:
+        stubber.add_response('describe_db_subnet_groups', {'DBSubnetGroups': [{'DBSubnetGroupName': 'old'}]}, {})
+        stubber.add_response('describe_db_subnet_groups', {'DBSubnetGroups': [{'DBSubnetGroupName': 'new'}]}, {})
+
+        assert rds.describe_db_subnet_groups()['DBSubnetGroups'][0]['DBSubnetGroupName'] == 'old'
+        rds.invalidate('describe_db_subnet_groups')
+        assert rds.describe_db_subnet_groups()['DBSubnetGroups'][0]['DBSubnetGroupName'] == 'new'
+        stubber.assert_no_pending_responses()
+
+def test_missing_credentials_are_raised_at_once(monkeypatch):
+    calls = []
+
+    def no_credentials(*args):
+        calls.append(args)
+        raise botocore.exceptions.NoCredentialsError()
+
+    monkeypatch.setattr(awsRDS, 'get_client', no_credentials)
+
+    with pytest.raises(botocore.exceptions.NoCredentialsError):
+        rdsClass('missing', retry=3, delay=60).rds_client
+    assert len(calls) == 1
@@ -0,0 +1,73 @@
+import boto3
+import botocore.exceptions
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from lib.awsRetry import FATAL, THROTTLE, TRANSIENT, classify_error, retryEngine
+from lib.awsSession import NO_RETRIES, default_pool, get_client
+
+def _client_error(code, status=400):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'DescribeDBClusters')
+
+def test_classify_error():
+    assert classify_error(_client_error('Throttling')) == THROTTLE
+    assert classify_error(_client_error('InternalFailure', 500)) == TRANSIENT
+    assert classify_error(botocore.exceptions.EndpointConnectionError(endpoint_url='https://rds')) == TRANSIENT
+    assert classify_error(_client_error('DBClusterNotFoundFault', 404)) == FATAL
+    assert classify_error(botocore.exceptions.NoCredentialsError()) == FATAL
+    assert classify_error(botocore.exceptions.PartialCredentialsError(provider='env', cred_var='key')) == FATAL
+
+def test_missing_credentials_fail_on_the_first_attempt():
+    calls = []
+
+    def describe():
+        calls.append(1)
+        raise botocore.exceptions.NoCredentialsError()
+
+    with pytest.raises(botocore.exceptions.NoCredentialsError):
+        retryEngine(base_delay=0.01).call(describe)
+    assert len(calls) == 1
+
+class _raw():
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+THROTTLED = (b'<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>'
+             b'<Message>Rate exceeded</Message></Error><RequestId>1</RequestId></ErrorResponse>')
+
+def test_throttled_call_is_sent_once_per_engine_attempt(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    default_pool.clear()
+    rds = get_client('rds', region='us-east-1')
+    sent = []
+
+    def throttle(request, **kwargs):
+        sent.append(request.url)
+        return AWSResponse(request.url, 400, {}, _raw(THROTTLED))
+
+    rds.meta.events.register('before-send.rds.DescribeDBClusters', throttle)
+    with pytest.raises(ClientError):
+        retryEngine(max_attempts=3, base_delay=0.001).client_call(rds, 'describe_db_clusters')
+
+    # botocore retries are off : no engine attempt x botocore attempt multiplication
+    assert len(sent) == 3
+    assert get_client('s3', region='us-east-1').meta.config.retries != NO_RETRIES
+    default_pool.clear()
+
+def test_clients_of_different_accounts_get_their_own_bucket():
+    engine = retryEngine()
+    clients = [boto3.Session(aws_access_key_id=key, aws_secret_access_key='secret').client('rds', region_name='us-east-1')
+               for key in ('AKIAACCOUNTA', 'AKIAACCOUNTA', 'AKIAACCOUNTB')]
+    for client in clients:
+        with Stubber(client) as stubber:
+            stubber.add_response('describe_db_clusters', {'DBClusters': []}, {})
+            engine.client_call(client, 'describe_db_clusters')
+
+    assert sorted(engine._buckets) == [('AKIAACCOUNTA', 'us-east-1', 'DescribeDBClusters'),
+                                       ('AKIAACCOUNTB', 'us-east-1', 'DescribeDBClusters')]
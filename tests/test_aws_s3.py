@@ -0,0 +1,176 @@
+import gzip
+import io
+import os
+import sys
+
+import boto3
+import pytest
+from boto3.s3.transfer import TransferConfig
+
+from lib import awsS3
+from lib.awsS3 import MIN_PART_SIZE, s3Class
+from lib.pgConn import dbConn
+
+def _get(bucket, key):
+    return boto3.client('s3', region_name='us-east-1').get_object(Bucket=bucket, Key=key)['Body'].read()
+
+def _uploads(bucket):
+    return boto3.client('s3', region_name='us-east-1').list_multipart_uploads(Bucket=bucket).get('Uploads', [])
+
+def test_upload_stream_multipart_round_trip(s3_bucket):
+    body = os.urandom(2 * MIN_PART_SIZE + 12345)
+
+    result = s3Class(profile=None, region='us-east-1').upload_stream(
+        io.BytesIO(body), s3_bucket, 'dump.bin', part_size=MIN_PART_SIZE)
+
+    assert _get(s3_bucket, 'dump.bin') == body
+    assert result['parts'] == 3
+    assert result['bytes_in'] == result['bytes_out'] == len(body)
+
+def test_upload_stream_gzip_round_trip(s3_bucket):
+    body = os.urandom(MIN_PART_SIZE) + b'select 1;\n' * 500000
+
+    result = s3Class(profile=None, region='us-east-1').upload_stream(
+        io.BytesIO(body), s3_bucket, 'dump.sql.gz', part_size=MIN_PART_SIZE, compress='gzip')
+
+    assert gzip.decompress(_get(s3_bucket, 'dump.sql.gz')) == body
+    assert result['parts'] == 2
+    assert result['bytes_out'] < result['bytes_in']
+
+def test_upload_stream_small_body_uses_single_put(s3_bucket):
+    result = s3Class(profile=None, region='us-east-1').upload_stream(io.BytesIO(b'tiny'), s3_bucket, 'tiny.bin')
+
+    assert _get(s3_bucket, 'tiny.bin') == b'tiny'
+    assert result['parts'] == 0
+    assert _uploads(s3_bucket) == []
+
+def test_upload_stream_aborts_when_before_complete_fails(s3_bucket):
+    def fail():
+        raise RuntimeError('dump failed')
+
+    with pytest.raises(RuntimeError):
+        s3Class(profile=None, region='us-east-1').upload_stream(
+            io.BytesIO(os.urandom(MIN_PART_SIZE + 1)), s3_bucket, 'partial.bin', before_complete=fail)
+
+    assert _uploads(s3_bucket) == []
+    assert 'Contents' not in boto3.client('s3', region_name='us-east-1').list_objects_v2(Bucket=s3_bucket)
+
+def _part_sizes(bucket, key):
+    client = boto3.client('s3', region_name='us-east-1')
+    parts = client.head_object(Bucket=bucket, Key=key)['ETag'].strip('"').rsplit('-', 1)[1]
+    return [client.head_object(Bucket=bucket, Key=key, PartNumber=number)['ContentLength']
+            for number in range(1, int(parts) + 1)]
+
+def test_upload_stream_grows_its_parts_to_stay_under_the_part_limit(s3_bucket, monkeypatch):
+    monkeypatch.setattr(awsS3, 'PART_GROWTH_PARTS', 2)
+    body = os.urandom(4 * MIN_PART_SIZE + 12345)
+
+    result = s3Class(profile=None, region='us-east-1').upload_stream(
+        io.BytesIO(body), s3_bucket, 'growing.bin', part_size=MIN_PART_SIZE)
+
+    assert _get(s3_bucket, 'growing.bin') == body
+    assert _part_sizes(s3_bucket, 'growing.bin') == [MIN_PART_SIZE, MIN_PART_SIZE, 2 * MIN_PART_SIZE, 12345]
+    assert result['parts'] == 4
+
+def test_upload_stream_sizes_parts_from_the_expected_size(s3_bucket, monkeypatch):
+    monkeypatch.setattr(awsS3, 'MAX_PARTS', 2)
+    body = os.urandom(3 * MIN_PART_SIZE + 12345)
+
+    s3Class(profile=None, region='us-east-1').upload_stream(
+        io.BytesIO(body), s3_bucket, 'sized.bin', part_size=MIN_PART_SIZE, expected_size=4 * MIN_PART_SIZE)
+
+    assert _part_sizes(s3_bucket, 'sized.bin') == [2 * MIN_PART_SIZE, MIN_PART_SIZE + 12345]
+
+def test_upload_stream_aborts_past_the_part_limit(s3_bucket, monkeypatch):
+    monkeypatch.setattr(awsS3, 'MAX_PARTS', 2)
+
+    with pytest.raises(ValueError, match='2 parts'):
+        s3Class(profile=None, region='us-east-1').upload_stream(
+            io.BytesIO(os.urandom(2 * MIN_PART_SIZE + 1)), s3_bucket, 'too-long.bin', part_size=MIN_PART_SIZE)
+
+    assert _uploads(s3_bucket) == []
+
+def _fake_pg_dump(monkeypatch, script):
+    # no server here : export_to_s3 runs a python script in place of pg_dump
+    db = dbConn(host='127.0.0.1', port=1, connect_timeout=1)
+    monkeypatch.setattr(db, '_pg_command', lambda binary, database: ([sys.executable, '-c', script], dict(os.environ)))
+    return db
+
+def test_export_to_s3_streams_dump_output(s3_bucket, monkeypatch):
+    db = _fake_pg_dump(monkeypatch, "import sys; sys.stdout.buffer.write(b'-- dump\\n' * 1000000)")
+
+    db.export_to_s3(s3Class(profile=None, region='us-east-1'), s3_bucket, 'db.sql.gz',
+                    dump_format='p', compress='gzip', part_size=MIN_PART_SIZE)
+
+    assert gzip.decompress(_get(s3_bucket, 'db.sql.gz')) == b'-- dump\n' * 1000000
+
+def test_export_to_s3_aborts_when_dump_fails(s3_bucket, monkeypatch):
+    db = _fake_pg_dump(monkeypatch, "import os, sys; sys.stdout.buffer.write(os.urandom(6 * 1024 * 1024)); sys.exit(1)")
+
+    with pytest.raises(RuntimeError):
+        db.export_to_s3(s3Class(profile=None, region='us-east-1'), s3_bucket, 'db.dump', part_size=MIN_PART_SIZE)
+
+    assert _uploads(s3_bucket) == []
+
+def _write(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+
+def test_sync_skips_objects_uploaded_with_another_part_size(s3_bucket, tmp_path):
+    body = os.urandom(2 * MIN_PART_SIZE + 1)
+    _write(str(tmp_path / 'src' / 'base.dump'), body)
+    # another tool : 5 MiB parts, 3 parts where s3Class would use 8 MiB parts
+    boto3.client('s3', region_name='us-east-1').upload_file(
+        str(tmp_path / 'src' / 'base.dump'), s3_bucket, 'backup/base.dump',
+        Config=TransferConfig(multipart_threshold=MIN_PART_SIZE, multipart_chunksize=MIN_PART_SIZE))
+    s3 = s3Class(profile=None, region='us-east-1')
+
+    assert s3.upload_directory(str(tmp_path / 'src'), s3_bucket, 'backup')['skipped'] == 1
+    _write(str(tmp_path / 'dst' / 'base.dump'), body)
+    assert s3.download_prefix(s3_bucket, 'backup', str(tmp_path / 'dst'))['skipped'] == 1
+
+    _write(str(tmp_path / 'dst' / 'base.dump'), os.urandom(len(body)))
+    result = s3.download_prefix(s3_bucket, 'backup', str(tmp_path / 'dst'))
+    assert (result['files'], result['skipped']) == (1, 0)
+    assert open(tmp_path / 'dst' / 'base.dump', 'rb').read() == body
+
+def test_download_prefix_does_not_match_sibling_prefixes(s3_bucket, tmp_path):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.put_object(Bucket=s3_bucket, Key='pre/a.txt', Body=b'a')
+    client.put_object(Bucket=s3_bucket, Key='prefix2/b.txt', Body=b'b')
+
+    result = s3Class(profile=None, region='us-east-1').download_prefix(s3_bucket, 'pre', str(tmp_path))
+
+    assert result['files'] == 1
+    assert sorted(os.listdir(tmp_path)) == ['a.txt']
+
+def test_download_prefix_skips_keys_outside_local_dir(s3_bucket, tmp_path):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.put_object(Bucket=s3_bucket, Key='pre/a.txt', Body=b'a')
+    client.put_object(Bucket=s3_bucket, Key='pre/../../escaped.txt', Body=b'x')
+    client.put_object(Bucket=s3_bucket, Key='pre/sub/../b.txt', Body=b'b')
+    local_dir = tmp_path / 'restore'
+
+    with s3Class(profile=None, region='us-east-1') as s3:
+        result = s3.download_prefix(s3_bucket, 'pre', str(local_dir))
+        executor = s3._transfer_executor
+
+    assert (result['files'], result['failed']) == (2, 1)
+    assert sorted(os.listdir(local_dir)) == ['a.txt', 'b.txt']
+    assert os.listdir(tmp_path) == ['restore']
+    assert s3._transfer_executor is None and executor._shutdown
+
+def test_download_ranged_checks_kms_objects_by_size_only(s3_bucket, tmp_path, monkeypatch):
+    client = boto3.client('s3', region_name='us-east-1')
+    client.put_object(Bucket=s3_bucket, Key='plain.bin', Body=b'p' * 100)
+    client.put_object(Bucket=s3_bucket, Key='kms.bin', Body=b'k' * 100, ServerSideEncryption='aws:kms')
+    s3 = s3Class(profile=None, region='us-east-1')
+    verified = []
+    monkeypatch.setattr(s3, '_verify_etag', lambda bucket_name, s3_key, *args: verified.append(s3_key))
+
+    s3.download_ranged(s3_bucket, 'plain.bin', str(tmp_path / 'plain.bin'), part_size=30)
+    s3.download_ranged(s3_bucket, 'kms.bin', str(tmp_path / 'kms.bin'), part_size=30)
+
+    assert verified == ['plain.bin']
+    assert (tmp_path / 'kms.bin').read_bytes() == b'k' * 100
@@ -0,0 +1,28 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from fleet_scanner import scan_fleet
+
+def test_throttled_discovery_page_is_retried_through_client_call():
+    rds = boto3.client('rds', region_name='us-east-1')
+    cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+    cluster = {'DBClusterIdentifier': 'aurora-1', 'Engine': 'aurora-mysql', 'DBClusterMembers': []}
+
+    with Stubber(rds) as stubber:
+        stubber.add_client_error('describe_db_clusters', service_error_code='Throttling', http_status_code=400)
+        stubber.add_response('describe_db_clusters', {'DBClusters': [cluster]}, {})
+        # the scan of the discovered cluster
+        stubber.add_response('describe_db_clusters', {'DBClusters': [cluster]},
+                             {'DBClusterIdentifier': 'aurora-1'})
+
+        results = list(scan_fleet([(None, 'us-east-1')],
+                                  client_factory=lambda profile, region: {'rds': rds, 'cloudwatch': cloudwatch}))
+        stubber.assert_no_pending_responses()
+
+    assert results == [{'Profile': None, 'Region': 'us-east-1', 'ClusterIdentifier': 'aurora-1', 'Metrics': {}}]
+
+@pytest.mark.parametrize('limits', [{'max_per_region': 0}, {'max_per_account': 0}])
+def test_concurrency_limits_must_allow_a_scan(limits):
+    with pytest.raises(ValueError):
+        next(scan_fleet([(None, 'us-east-1')], client_factory=lambda profile, region: {}, **limits))
@@ -0,0 +1,51 @@
+import lib.pgActivity
+from lib.pgActivity import activitySampler
+
+class fakeCursor():
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        pass
+
+    def fetchall(self):
+        self.conn.calls += 1
+        # every sample runs a query text never seen before
+        return [(float(self.conn.calls), 100 + index, 'app', 'Lock', 'relation', float(self.conn.calls),
+                 f'select {self.conn.calls} -- {index}') for index in range(3)]
+
+class fakeConnection():
+    autocommit = False
+
+    def __init__(self):
+        self.calls = 0
+
+    def cursor(self):
+        return fakeCursor(self)
+
+class fakeDb():
+    host, port, dbname, user, password = '127.0.0.1', 5432, 'postgres', 'postgres', ''
+
+def test_interned_strings_are_freed_with_their_rows(monkeypatch):
+    monkeypatch.setattr(lib.pgActivity.psycopg2, 'connect', lambda **kwargs: fakeConnection())
+    sampler = activitySampler(fakeDb(), capacity=30)
+
+    for _ in range(1000):
+        sampler.sample()
+
+    # 30 rows : 30 query texts + user + wait type + wait event
+    assert sampler.stats()['strings'] == 33
+    assert len(sampler._strings) <= 34
+    assert len(sampler._by_query) == 30
+    assert sum(sampler._by_query.values()) == 30
+    assert sampler.wait_event_summary() == {'Lock': 3.0}
+    # the last 10 samples are left in the buffer
+    assert {query['query'] for query in sampler.top_queries(30)} == {
+        f'select {call} -- {index}' for call in range(991, 1001) for index in range(3)}
+    assert sampler.longest_running(1)[0]['usename'] == 'app'
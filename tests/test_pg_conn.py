@@ -0,0 +1,53 @@
+import csv
+import json
+from unittest import mock
+
+import pytest
+from psycopg2.extras import Json
+
+from lib import pgConn
+from lib.pgConn import _copy_csv_line
+
+def test_copy_csv_line_writes_json_bytea_and_array_literals():
+    line = _copy_csv_line([1, None, 'say "hi"', Json({'a': [1, 'x"']}), b'\x00\xff', [1, 2]])
+    fields = next(csv.reader([line]))
+
+    assert line.startswith('1,,')
+    assert fields[2] == 'say "hi"'
+    assert json.loads(fields[3]) == {'a': [1, 'x"']}
+    assert fields[4] == '\\x00ff'
+    assert fields[5] == '{"1","2"}'
+
+def test_copy_array_literals_escape_elements_and_nest():
+    fields = next(csv.reader([_copy_csv_line([['a"b', 'c\\d', None, ''], [[1, 2], [3, 4]]])]))
+
+    assert fields[0] == '{"a\\"b","c\\\\d",NULL,""}'
+    assert fields[1] == '{{"1","2"},{"3","4"}}'
+
+def test_bare_dicts_must_be_wrapped_in_json():
+    with pytest.raises(TypeError, match='psycopg2.extras.Json'):
+        _copy_csv_line([{'a': 1}])
+
+def test_table_exports_share_one_exported_snapshot(tmp_path, monkeypatch):
+    connections = []
+
+    def connect(**kwargs):
+        conn = mock.MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = ('00000003-0000001B-1',)
+        connections.append((kwargs, conn))
+        return conn
+
+    monkeypatch.setattr(pgConn.psycopg2, 'connect', connect)
+    db = pgConn.dbConn(host='db-host', dbname='postgres', connect_timeout=5)
+    commands = []
+    monkeypatch.setattr(db, '_run_pg_job', lambda label, command, env, progress: commands.append(command) or 1.0)
+
+    result = db.export_tables_parallel('app', ['orders', 'customers'], dest_file=str(tmp_path), jobs=2)
+
+    exporting_kwargs, exporting = connections[-1]
+    assert exporting_kwargs['dbname'] == 'app' and exporting_kwargs['connect_timeout'] == 5
+    exporting.cursor.return_value.__enter__.return_value.execute.assert_called_once_with('select pg_export_snapshot()')
+    assert exporting.close.called
+    assert result['snapshot'] == '00000003-0000001B-1'
+    assert len(commands) == 2
+    assert all(command[command.index('--snapshot') + 1] == '00000003-0000001B-1' for command in commands)
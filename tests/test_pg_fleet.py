@@ -0,0 +1,31 @@
+from unittest import mock
+
+import psycopg2
+
+from lib import pgConn
+from lib.pgFleet import collect_fleet
+
+def test_unreachable_hosts_report_the_connect_error():
+    hosts = [{'host': '127.0.0.1', 'port': 1, 'user': 'postgres', 'name': f'db{index}'} for index in range(4)]
+
+    result = collect_fleet(hosts, max_concurrency=2, timeout=2)
+
+    assert (result['hosts'], result['succeeded']) == (4, 0)
+    assert sorted(error['host'] for error in result['errors']) == ['db0', 'db1', 'db2', 'db3']
+    for error in result['errors']:
+        assert error['error'].startswith('connection to 127.0.0.1:1 failed : ')
+        assert 'refused' in error['error']
+
+def test_failed_collectors_report_the_database_error(monkeypatch):
+    def connect(**kwargs):
+        conn = mock.MagicMock()
+        conn.cursor.return_value.__enter__.return_value.execute.side_effect = \
+            psycopg2.OperationalError('canceling statement due to statement timeout\n')
+        return conn
+
+    monkeypatch.setattr(pgConn.psycopg2, 'connect', connect)
+
+    result = collect_fleet([{'host': 'db-host', 'name': 'db0'}], collectors=('sizes',), timeout=2)
+
+    assert result['succeeded'] == 0
+    assert result['errors'][0]['error'] == 'sizes query failed : canceling statement due to statement timeout'
@@ -0,0 +1,45 @@
+from lib import pgPool
+from lib.pgPool import close_pools, get_pool
+
+def _pool(**kwargs):
+    # minconn=0 and no reaper : nothing connects until a checkout
+    return get_pool('db-host', 5432, 'app', 'app', minconn=0, reap_interval=None, **kwargs)
+
+def test_pools_are_shared_only_for_identical_arguments():
+    try:
+        pool = _pool(password='secret', maxconn=4)
+
+        assert _pool(password='secret', maxconn=4) is pool
+        assert _pool(password='other', maxconn=4) is not pool
+        assert _pool(password='secret', maxconn=8).maxconn == 8
+        assert _pool(password='secret', maxconn=4, options='-c statement_timeout=5000') is not pool
+    finally:
+        close_pools()
+
+def test_closed_pools_are_replaced():
+    try:
+        pool = _pool()
+        pool.closeall()
+
+        assert _pool() is not pool
+    finally:
+        close_pools()
+
+def test_a_pool_registered_during_construction_wins(monkeypatch):
+    connPool = pgPool.connPool
+    registered = connPool('db-host', 5432, 'app', 'app', minconn=0, reap_interval=None)
+    built = []
+
+    def racing_pool(*args, **kwargs):
+        # another thread registers the same pool while this one is being built
+        key = pgPool._pool_key(*args, kwargs)
+        pgPool._pools[key] = registered
+        built.append(connPool(*args, **kwargs))
+        return built[0]
+
+    monkeypatch.setattr(pgPool, 'connPool', racing_pool)
+    try:
+        assert _pool() is registered
+        assert built[0]._closed
+    finally:
+        close_pools()
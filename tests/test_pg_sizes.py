@@ -0,0 +1,31 @@
+from lib.pgSizes import SIGNATURE_QUERY, sizeCollector
+
+class fakeDb():
+    host, port, dbname = '127.0.0.1', 5432, 'postgres'
+
+    def __init__(self):
+        self.relations = {}
+        self.dropped = set()
+
+    def select_stream(self, query, params=None, row_type='dict'):
+        if query == SIGNATURE_QUERY:
+            return [(oid, 'public', name, 'r', oid, 10.0, writes, 0)
+                    for oid, (name, writes, _) in self.relations.items()]
+        return [(oid, None, None) if oid in self.dropped else (oid, size, size)
+                for oid in params[0] for size in [self.relations[oid][2]]]
+
+def test_relation_dropped_during_collect_is_skipped(tmp_path):
+    db = fakeDb()
+    db.relations = {1: ('orders', 5, 8192), 2: ('events', 5, 16384)}
+    collector = sizeCollector(db, cache_path=str(tmp_path / 'sizes.json'), full_every=0)
+    collector.collect()
+
+    # events changes, then is dropped between the signature and the size query
+    db.relations = {1: ('orders', 6, 24576), 2: ('events', 6, 32768)}
+    db.dropped = {2}
+    relations = collector.collect()
+
+    assert [relation['relname'] for relation in relations] == ['orders']
+    assert relations[0]['total_size'] == 24576
+    assert relations[0]['growth_per_day'] > 0
+    assert '2' not in collector.cache['relations']
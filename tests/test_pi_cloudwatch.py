@@ -0,0 +1,34 @@
+import datetime
+
+import boto3
+from botocore.stub import Stubber
+
+from pi_cloudwatch import get_rds_metrics
+
+def _statistics(metric, start, end):
+    return {'Namespace': 'AWS/RDS', 'MetricName': metric,
+            'Dimensions': [{'Name': 'DBInstanceIdentifier', 'Value': 'db-1'}],
+            'StartTime': start, 'EndTime': end, 'Period': 60, 'Statistics': ['Maximum']}
+
+def test_long_ranges_are_requested_in_windows_under_the_datapoint_limit():
+    cloudwatch = boto3.client('cloudwatch', region_name='us-east-1',
+                              aws_access_key_id='testing', aws_secret_access_key='testing')
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    middle = start + datetime.timedelta(days=1)
+    end = start + datetime.timedelta(days=2)
+
+    with Stubber(cloudwatch) as stubber:
+        for metric in ('CPUUtilization', 'DatabaseConnections'):
+            # datapoints come back unordered and are merged in time order
+            stubber.add_response('get_metric_statistics',
+                                 {'Datapoints': [{'Timestamp': middle - datetime.timedelta(minutes=1), 'Maximum': 2.0},
+                                                 {'Timestamp': start, 'Maximum': 1.0}]},
+                                 _statistics(metric, start, middle))
+            stubber.add_response('get_metric_statistics',
+                                 {'Datapoints': [{'Timestamp': middle, 'Maximum': 3.0}]},
+                                 _statistics(metric, middle, end))
+        metrics = get_rds_metrics('db-1', start, end, cloudwatch, chunk=datetime.timedelta(days=7))
+        stubber.assert_no_pending_responses()
+
+    assert [datapoint['Value'] for datapoint in metrics['CPUUtilization']] == [1.0, 2.0, 3.0]
+    assert metrics['DatabaseConnections'][0]['Timestamp'] == start.isoformat()
@@ -0,0 +1,37 @@
+import asyncio
+import datetime
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+pytest.importorskip('aiobotocore')
+
+from pi_cloudwatch_async import get_performance_insights
+
+def _client(service):
+    return boto3.client(service, region_name='us-east-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+
+def test_performance_insights_merges_pi_and_cloudwatch(async_stub, stub_pool):
+    pi, cloudwatch = _client('pi'), _client('cloudwatch')
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(hours=2)
+
+    with Stubber(pi) as pi_stubber, Stubber(cloudwatch) as cloudwatch_stubber:
+        for window_start in (start, start + datetime.timedelta(hours=1)):
+            pi_stubber.add_response('get_resource_metrics', {'MetricList': [{
+                'Key': {'Metric': 'db.load.avg'},
+                'DataPoints': [{'Timestamp': window_start, 'Value': 1.5}]}]})
+        # one request per (metric, hour) : CPUUtilization windows first
+        for datapoints in ([{'Timestamp': start, 'Maximum': 40.0}],
+                           [{'Timestamp': start + datetime.timedelta(hours=1), 'Maximum': 55.0}], [], []):
+            cloudwatch_stubber.add_response('get_metric_statistics', {'Datapoints': datapoints})
+
+        result = asyncio.run(get_performance_insights(
+            'db-1', start, end, metrics=['db.load.avg'], group_by=[],
+            pool=stub_pool({'pi': async_stub(pi), 'cloudwatch': async_stub(cloudwatch)})))
+        pi_stubber.assert_no_pending_responses()
+        cloudwatch_stubber.assert_no_pending_responses()
+
+    assert [point['Value'] for point in result['MetricsData']['db.load.avg']['TimeSeries']] == [1.5, 1.5]
+    assert [point['Value'] for point in result['SystemMetrics']['CPUUtilization']] == [40.0, 55.0]
@@ -0,0 +1,25 @@
+import datetime
+
+import pi_incremental
+from pi_incremental import checkpointStore, collect_incremental, jsonlSeriesStore
+
+def test_incremental_run_fetches_only_the_totals(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_performance_insights(**kwargs):
+        calls.append(kwargs)
+        return {
+            'MetricsData': {'db.load.avg': {'TimeSeries': [
+                {'Timestamp': '2024-01-01T00:58:00+00:00', 'Value': 1.5}], 'TopQueries': [], 'Groups': {}}},
+            'SystemMetrics': {'CPUUtilization': [{'Timestamp': '2024-01-01T00:58:00+00:00', 'Value': 20.0}]}
+        }
+
+    monkeypatch.setattr(pi_incremental, 'get_performance_insights', fake_performance_insights)
+    checkpoints = checkpointStore(str(tmp_path / 'checkpoint.json'))
+    now = datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
+
+    appended = collect_incremental('db-1', checkpoints, jsonlSeriesStore(str(tmp_path / 'data')), now=now)
+
+    assert calls[0]['group_by'] == []
+    assert appended == {'db.load.avg': 1, 'CPUUtilization': 1}
+    assert checkpoints.get('db-1') == now - datetime.timedelta(minutes=2)
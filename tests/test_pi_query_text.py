@@ -0,0 +1,68 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from pi_query_text import aggregate_statement_load, queryTextCache
+
+def _result(instance, start, end, members):
+    return {
+        'DatabaseInfo': {'DBInstanceIdentifier': instance, 'TimeRange': {'StartTime': start, 'EndTime': end}},
+        'MetricsData': {'db.load.avg': {'Groups': {'db.sql': [{
+            'Id': query_id,
+            'Dimensions': {'db.sql.id': query_id, 'db.sql.statement': f'truncated {query_id}'},
+            'Value': value
+        } for query_id, value in members]}}}
+    }
+
+def _details(instance, query_id):
+    return {'ServiceType': 'RDS', 'Identifier': instance, 'Group': 'db.sql',
+            'GroupIdentifier': query_id, 'RequestedDimensions': ['db.sql.statement']}
+
+def _statement(text, status='AVAILABLE'):
+    return {'Dimensions': [{'Dimension': 'db.sql.statement', 'Value': text, 'Status': status}]}
+
+def _pi_client():
+    return boto3.client('pi', region_name='us-east-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+
+def test_statements_are_resolved_once_and_load_is_summed(tmp_path):
+    results = [
+        _result('db-1', '2024-01-01T00:00:00', '2024-01-01T01:00:00', [('Q1', 2.0), ('Q2', 1.0)]),
+        _result('db-1', '2024-01-01T01:00:00', '2024-01-01T03:00:00', [('Q1', 1.0)]),
+        _result('db-2', '2024-01-01T00:00:00', '2024-01-01T01:00:00', [('Q3', 0.5)]),
+    ]
+    pi = _pi_client()
+    # one worker : the stubbed responses are consumed in request order
+    cache = queryTextCache(str(tmp_path / 'texts.cache'), max_workers=1)
+
+    with Stubber(pi) as stubber:
+        stubber.add_response('get_dimension_key_details', _statement('select * from orders'), _details('db-1', 'Q1'))
+        stubber.add_response('get_dimension_key_details', _statement('select 1', 'PROCESSING'),
+                             _details('db-1', 'Q2'))
+        stubber.add_response('get_dimension_key_details', _statement('select * from orders'), _details('db-2', 'Q3'))
+        statements = aggregate_statement_load(results, cache, pi_client=pi)
+        stubber.assert_no_pending_responses()
+
+    assert statements == [
+        {'Statement': 'select * from orders', 'DBLoadSeconds': 16200.0,
+         'Instances': {'db-1': 14400.0, 'db-2': 1800.0}, 'QueryIDs': ['Q1', 'Q3']},
+        {'Statement': 'truncated Q2', 'DBLoadSeconds': 3600.0, 'Instances': {'db-1': 3600.0}, 'QueryIDs': ['Q2']},
+    ]
+
+    # next run, from the file : only the statement PI was still processing is asked for
+    with Stubber(pi) as stubber:
+        stubber.add_response('get_dimension_key_details', _statement('select 1'), _details('db-1', 'Q2'))
+        reloaded = queryTextCache(str(tmp_path / 'texts.cache'), max_workers=1)
+        assert aggregate_statement_load(results, reloaded, pi_client=pi)[1]['Statement'] == 'select 1'
+        stubber.assert_no_pending_responses()
+    assert reloaded.stats()['hits'] == 2
+
+def test_lookup_errors_are_raised_when_nothing_resolves(tmp_path):
+    pi = _pi_client()
+    cache = queryTextCache(str(tmp_path / 'texts.cache'), max_workers=1)
+
+    with Stubber(pi) as stubber:
+        stubber.add_client_error('get_dimension_key_details', 'NotAuthorizedException', http_status_code=403,
+                                 expected_params=_details('db-1', 'Q1'))
+        with pytest.raises(ClientError):
+            cache.resolve([('db-1', 'Q1')], pi)
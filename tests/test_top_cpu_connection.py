@@ -0,0 +1,26 @@
+import boto3
+from botocore.stub import Stubber
+
+from top_cpu_connection import cluster_cache, get_aurora_metrics
+
+def test_cluster_cache_is_shared_by_clients_of_the_same_account_and_region():
+    cluster_cache.invalidate()
+    cluster = {'DBClusterIdentifier': 'aurora-1', 'DBClusterMembers': []}
+    session = boto3.Session(aws_access_key_id='AKIAEXAMPLE', aws_secret_access_key='secret')
+    first, second = (session.client('rds', region_name='us-east-1') for _ in range(2))
+    other_region = session.client('rds', region_name='eu-west-1')
+    cloudwatch = session.client('cloudwatch', region_name='us-east-1')
+
+    with Stubber(first) as stubber, Stubber(other_region) as other_stubber:
+        stubber.add_response('describe_db_clusters', {'DBClusters': [cluster]}, {'DBClusterIdentifier': 'aurora-1'})
+        other_stubber.add_response('describe_db_clusters', {'DBClusters': [cluster]},
+                                   {'DBClusterIdentifier': 'aurora-1'})
+
+        for rds in (first, second, other_region):
+            assert get_aurora_metrics('aurora-1', cloudwatch=cloudwatch, rds=rds) == {}
+        stubber.assert_no_pending_responses()
+        other_stubber.assert_no_pending_responses()
+
+    assert sorted(cluster_cache._data) == [('AKIAEXAMPLE', 'eu-west-1', 'aurora-1'),
+                                           ('AKIAEXAMPLE', 'us-east-1', 'aurora-1')]
+    cluster_cache.invalidate()
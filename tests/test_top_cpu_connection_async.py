@@ -0,0 +1,34 @@
+import asyncio
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+pytest.importorskip('aiobotocore')
+
+from top_cpu_connection import cluster_cache
+from top_cpu_connection_async import get_aurora_metrics
+
+def test_concurrent_calls_share_one_cluster_lookup(async_stub, stub_pool):
+    cluster_cache.invalidate()
+    cluster = {'DBClusterIdentifier': 'aurora-1', 'DBClusterMembers': [{'DBInstanceIdentifier': 'aurora-1-a'}]}
+    session = boto3.Session(aws_access_key_id='AKIAEXAMPLE', aws_secret_access_key='secret')
+    rds, cloudwatch = session.client('rds', region_name='us-east-1'), session.client('cloudwatch', region_name='us-east-1')
+
+    async def collect():
+        pool = stub_pool({'rds': async_stub(rds), 'cloudwatch': async_stub(cloudwatch)})
+        return await asyncio.gather(*(get_aurora_metrics('aurora-1', pool=pool) for _ in range(4)))
+
+    with Stubber(rds) as rds_stubber, Stubber(cloudwatch) as cloudwatch_stubber:
+        # a second describe_db_clusters would find no response left
+        rds_stubber.add_response('describe_db_clusters', {'DBClusters': [cluster]}, {'DBClusterIdentifier': 'aurora-1'})
+        for _ in range(4):
+            cloudwatch_stubber.add_response('get_metric_data', {'MetricDataResults': [
+                {'Id': 'm0', 'Timestamps': [], 'Values': [12.0], 'StatusCode': 'Complete'},
+                {'Id': 'm1', 'Timestamps': [], 'Values': [7.0], 'StatusCode': 'Complete'}]})
+
+        results = asyncio.run(collect())
+        rds_stubber.assert_no_pending_responses()
+
+    assert len(results) == 4 and results[0] == results[3]
+    cluster_cache.invalidate()
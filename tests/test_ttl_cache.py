@@ -0,0 +1,43 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lib.ttlCache import ttlCache
+
+def test_concurrent_misses_run_one_loader():
+    cache = ttlCache(ttl=60)
+    calls = []
+    lock = threading.Lock()
+
+    def loader():
+        with lock:
+            calls.append(1)
+        time.sleep(0.2)
+        return 'cluster'
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: cache.get_or_load('key', loader), range(16)))
+
+    assert results == ['cluster'] * 16
+    assert len(calls) == 1
+
+def test_loader_error_is_shared_and_not_cached():
+    cache = ttlCache(ttl=60)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError('throttled')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(cache.get_or_load, 'key', failing)
+        started.wait()
+        second = executor.submit(cache.get_or_load, 'key', lambda: 'unused')
+        for future in (first, second):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    assert cache.get_or_load('key', lambda: 'loaded') == 'loaded'
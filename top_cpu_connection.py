@@ -1,76 +1,169 @@
-import boto3
 import datetime
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Tuple
 
-def get_aurora_metrics(cluster_identifier: str, period_hours: int = 24) -> Dict:
+from lib.awsRetry import client_call
+from lib.awsSession import client_account, get_client
+from lib.instrument import traced
+from lib.ttlCache import ttlCache
+
+# describe_db_clusters results, keyed by _cluster_cache_key
+cluster_cache = ttlCache(maxsize=1024, ttl=300)
+
+# CloudWatch metric name -> key used in the get_aurora_metrics result
+METRIC_KEYS = {
+    'CPUUtilization': 'max_cpu_utilization',
+    'DatabaseConnections': 'max_connections',
+}
+
+# GetMetricData accepts at most 500 MetricDataQueries per request
+MAX_METRIC_DATA_QUERIES = 500
+
+def _metric_data_queries(pairs: List[Tuple[str, str]], offset: int, period: int) -> List[Dict]:
+    # Query ids must start with a lowercase letter, so map them back by position
+    return [{
+        'Id': f'm{offset + idx}',
+        'MetricStat': {
+            'Metric': {
+                'Namespace': 'AWS/RDS',
+                'MetricName': metric,
+                'Dimensions': [{'Name': 'DBInstanceIdentifier', 'Value': instance_id}]
+            },
+            'Period': period,
+            'Stat': 'Maximum'
+        },
+        'ReturnData': True
+    } for idx, (instance_id, metric) in enumerate(pairs[offset:offset + MAX_METRIC_DATA_QUERIES])]
+
+def _add_metric_data_results(series: Dict, pairs: List[Tuple[str, str]], response: Dict):
+    for result in response['MetricDataResults']:
+        instance_id, metric = pairs[int(result['Id'][1:])]
+        if result.get('StatusCode') == 'InternalError':
+            print(f"Error retrieving {metric} for instance {instance_id}: {result.get('Messages')}")
+        target = series[instance_id][metric]
+        target['Timestamps'].extend(result.get('Timestamps', []))
+        target['Values'].extend(result.get('Values', []))
+
+def _drop_failed_batch(series: Dict, batch: List[Tuple[str, str]], error: Exception):
+    failed = sorted({instance_id for instance_id, _ in batch})
+    print(f"Error retrieving metrics for instances {failed}: {str(error)}")
+    for instance_id in failed:
+        series.pop(instance_id, None)
+
+def _cluster_cache_key(rds, cluster_identifier: str) -> Tuple:
+    # (credentials, region, cluster) : shared by every client of the same account and region
+    return client_account(rds), rds.meta.region_name, cluster_identifier
+
+def _cluster_instance_ids(response: Dict, cluster_identifier: str) -> List[str]:
+    if not response['DBClusters']:
+        raise ValueError(f"No cluster found with identifier {cluster_identifier}")
+    return [instance['DBInstanceIdentifier'] for instance in response['DBClusters'][0]['DBClusterMembers']]
+
+def _max_metrics(series: Dict) -> Dict:
+    # Extract maximum values
+    return {
+        instance_id: {
+            key: max(instance_series[metric]['Values'], default=0)
+            for metric, key in METRIC_KEYS.items()
+        } for instance_id, instance_series in series.items()
+    }
+
+@traced('collect_seconds', collector='get_metric_series')
+def get_metric_series(cloudwatch, instance_ids: List[str], metric_names: List[str],
+                      start_time: datetime.datetime, end_time: datetime.datetime,
+                      period: int = 300, raise_errors: bool = False) -> Dict:
+    """
+    Fetch the Maximum series of several AWS/RDS metrics for many instances with GetMetricData.
+    
+    Every instance x metric pair becomes one query, and queries are packed
+    MAX_METRIC_DATA_QUERIES at a time, so a 15-instance cluster costs a single
+    request instead of 30 get_metric_statistics calls.
+    
+    Args:
+        cloudwatch: boto3 CloudWatch client
+        instance_ids (List[str]): DB instance identifiers
+        metric_names (List[str]): AWS/RDS metric names
+        start_time (datetime): Start of the window
+        end_time (datetime): End of the window
+        period (int): Period in seconds (default: 300, 5-minute periods)
+        raise_errors (bool): Re-raise request errors instead of skipping the batch
+        
+    Returns:
+        Dict of {instance_id: {metric_name: {'Timestamps': [...], 'Values': [...]}}}
+    """
+    pairs = [(instance_id, metric) for instance_id in instance_ids for metric in metric_names]
+    series = {instance_id: {metric: {'Timestamps': [], 'Values': []} for metric in metric_names}
+              for instance_id in instance_ids}
+    
+    for offset in range(0, len(pairs), MAX_METRIC_DATA_QUERIES):
+        queries = _metric_data_queries(pairs, offset, period)
+        
+        try:
+            kwargs = {}
+            while True:
+                response = client_call(
+                    cloudwatch,
+                    'get_metric_data',
+                    MetricDataQueries=queries,
+                    StartTime=start_time,
+                    EndTime=end_time,
+                    ScanBy='TimestampAscending',
+                    **kwargs
+                )
+                _add_metric_data_results(series, pairs, response)
+                
+                # Large windows come back as PartialData with a NextToken
+                if not response.get('NextToken'):
+                    break
+                kwargs['NextToken'] = response['NextToken']
+        except Exception as e:
+            if raise_errors:
+                raise
+            _drop_failed_batch(series, pairs[offset:offset + MAX_METRIC_DATA_QUERIES], e)
+    
+    return series
+
+@traced('collect_seconds', collector='get_aurora_metrics')
+def get_aurora_metrics(cluster_identifier: str, period_hours: int = 24,
+                       cloudwatch=None, rds=None, raise_errors: bool = False,
+                       use_cache: bool = True) -> Dict:
     """
     Retrieve maximum CPU utilization and connection metrics for an Aurora MySQL cluster.
     
     Args:
         cluster_identifier (str): The Aurora cluster identifier
         period_hours (int): Number of hours to look back for metrics (default: 24)
+        cloudwatch: Optional CloudWatch client (default: shared lib.awsSession client)
+        rds: Optional RDS client (default: shared lib.awsSession client)
+        raise_errors (bool): Re-raise metric request errors instead of skipping instances
+        use_cache (bool): Reuse the cluster topology for cluster_cache.ttl seconds
         
     Returns:
         Dict containing max CPU utilization and max connections
     """
-    cloudwatch = boto3.client('cloudwatch')
-    rds = boto3.client('rds')
+    cloudwatch = cloudwatch or get_client('cloudwatch')
+    rds = rds or get_client('rds')
     
     # Get cluster information to determine instance class
     try:
-        response = rds.describe_db_clusters(DBClusterIdentifier=cluster_identifier)
-        if not response['DBClusters']:
-            raise ValueError(f"No cluster found with identifier {cluster_identifier}")
-            
+        if use_cache:
+            response = cluster_cache.get_or_load(
+                _cluster_cache_key(rds, cluster_identifier),
+                lambda: client_call(rds, 'describe_db_clusters', DBClusterIdentifier=cluster_identifier)
+            )
+        else:
+            response = client_call(rds, 'describe_db_clusters', DBClusterIdentifier=cluster_identifier)
         # Get all instance identifiers in the cluster
-        instance_ids = [instance['DBInstanceIdentifier'] 
-                       for instance in response['DBClusters'][0]['DBClusterMembers']]
+        instance_ids = _cluster_instance_ids(response, cluster_identifier)
     except Exception as e:
-        raise Exception(f"Error retrieving cluster information: {str(e)}")
+        raise Exception(f"Error retrieving cluster information: {str(e)}") from e
 
     end_time = datetime.datetime.utcnow()
     start_time = end_time - datetime.timedelta(hours=period_hours)
     
-    metrics = {}
-    
-    for instance_id in instance_ids:
-        try:
-            # Get CPU utilization
-            cpu_response = cloudwatch.get_metric_statistics(
-                Namespace='AWS/RDS',
-                MetricName='CPUUtilization',
-                Dimensions=[{'Name': 'DBInstanceIdentifier', 'Value': instance_id}],
-                StartTime=start_time,
-                EndTime=end_time,
-                Period=300,  # 5-minute periods
-                Statistics=['Maximum']
-            )
-            
-            # Get database connections
-            conn_response = cloudwatch.get_metric_statistics(
-                Namespace='AWS/RDS',
-                MetricName='DatabaseConnections',
-                Dimensions=[{'Name': 'DBInstanceIdentifier', 'Value': instance_id}],
-                StartTime=start_time,
-                EndTime=end_time,
-                Period=300,  # 5-minute periods
-                Statistics=['Maximum']
-            )
-            
-            # Extract maximum values
-            max_cpu = max([datapoint['Maximum'] for datapoint in cpu_response['Datapoints']], default=0)
-            max_connections = max([datapoint['Maximum'] for datapoint in conn_response['Datapoints']], default=0)
-            
-            metrics[instance_id] = {
-                'max_cpu_utilization': max_cpu,
-                'max_connections': max_connections
-            }
-            
-        except Exception as e:
-            print(f"Error retrieving metrics for instance {instance_id}: {str(e)}")
-            continue
-    
-    return metrics
+    series = get_metric_series(cloudwatch, instance_ids, list(METRIC_KEYS), start_time, end_time,
+                               raise_errors=raise_errors)
+
+    return _max_metrics(series)
 
 def main():
     # Example usage
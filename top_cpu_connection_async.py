@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+from typing import Dict, List, Optional
+
+from lib.awsAsync import client_scope
+from lib.awsRetry import async_client_call
+from top_cpu_connection import (
+    METRIC_KEYS, MAX_METRIC_DATA_QUERIES, cluster_cache, _cluster_cache_key,
+    _metric_data_queries, _add_metric_data_results, _drop_failed_batch, _cluster_instance_ids, _max_metrics
+)
+
+async def get_metric_series(cloudwatch, instance_ids: List[str], metric_names: List[str],
+                            start_time: datetime.datetime, end_time: datetime.datetime,
+                            period: int = 300, raise_errors: bool = False) -> Dict:
+    """
+    Async get_metric_series: every GetMetricData batch is requested concurrently.
+
+    Args:
+        cloudwatch: aiobotocore CloudWatch client
+        instance_ids (List[str]): DB instance identifiers
+        metric_names (List[str]): AWS/RDS metric names
+        start_time (datetime): Start of the window
+        end_time (datetime): End of the window
+        period (int): Period in seconds (default: 300, 5-minute periods)
+        raise_errors (bool): Re-raise request errors instead of skipping the batch
+
+    Returns:
+        Dict of {instance_id: {metric_name: {'Timestamps': [...], 'Values': [...]}}}
+    """
+    pairs = [(instance_id, metric) for instance_id in instance_ids for metric in metric_names]
+    series = {instance_id: {metric: {'Timestamps': [], 'Values': []} for metric in metric_names}
+              for instance_id in instance_ids}
+
+    async def fetch_batch(offset):
+        queries = _metric_data_queries(pairs, offset, period)
+        responses = []
+        kwargs = {}
+        while True:
+            response = await async_client_call(
+                cloudwatch,
+                'get_metric_data',
+                MetricDataQueries=queries,
+                StartTime=start_time,
+                EndTime=end_time,
+                ScanBy='TimestampAscending',
+                **kwargs
+            )
+            responses.append(response)
+            if not response.get('NextToken'):
+                return responses
+            kwargs['NextToken'] = response['NextToken']
+
+    offsets = list(range(0, len(pairs), MAX_METRIC_DATA_QUERIES))
+    batches = await asyncio.gather(*(fetch_batch(offset) for offset in offsets), return_exceptions=True)
+
+    # Applied in batch order, so an instance split across two batches is dropped consistently
+    for offset, responses in zip(offsets, batches):
+        if isinstance(responses, Exception):
+            if raise_errors:
+                raise responses
+            _drop_failed_batch(series, pairs[offset:offset + MAX_METRIC_DATA_QUERIES], responses)
+            continue
+        for response in responses:
+            _add_metric_data_results(series, pairs, response)
+
+    return series
+
+async def get_aurora_metrics(cluster_identifier: str, period_hours: int = 24,
+                             cloudwatch=None, rds=None, raise_errors: bool = False,
+                             use_cache: bool = True, pool=None) -> Dict:
+    """
+    Async get_aurora_metrics, same arguments and result.
+
+    Args:
+        cluster_identifier (str): The Aurora cluster identifier
+        period_hours (int): Number of hours to look back for metrics (default: 24)
+        cloudwatch: Optional aiobotocore CloudWatch client (default: from pool)
+        rds: Optional aiobotocore RDS client (default: from pool)
+        raise_errors (bool): Re-raise metric request errors instead of skipping instances
+        use_cache (bool): Reuse the cluster topology for cluster_cache.ttl seconds
+        pool: Optional lib.awsAsync.asyncClientPool (default: a pool for this call only)
+
+    Returns:
+        Dict containing max CPU utilization and max connections
+    """
+    async with client_scope(pool) as pool:
+        cloudwatch = cloudwatch or await pool.get_client('cloudwatch')
+        rds = rds or await pool.get_client('rds')
+
+        try:
+            if use_cache:
+                # concurrent calls for one cluster share a single describe_db_clusters
+                response = await cluster_cache.get_or_load_async(
+                    _cluster_cache_key(rds, cluster_identifier),
+                    lambda: async_client_call(rds, 'describe_db_clusters', DBClusterIdentifier=cluster_identifier)
+                )
+            else:
+                response = await async_client_call(rds, 'describe_db_clusters', DBClusterIdentifier=cluster_identifier)
+            instance_ids = _cluster_instance_ids(response, cluster_identifier)
+        except Exception as e:
+            raise Exception(f"Error retrieving cluster information: {str(e)}") from e
+
+        end_time = datetime.datetime.utcnow()
+        start_time = end_time - datetime.timedelta(hours=period_hours)
+
+        series = await get_metric_series(cloudwatch, instance_ids, list(METRIC_KEYS), start_time, end_time,
+                                         raise_errors=raise_errors)
+
+    return _max_metrics(series)
+
+async def get_fleet_metrics(cluster_identifiers: List[str], period_hours: int = 24,
+                            profile: Optional[str] = None, region: Optional[str] = None,
+                            max_concurrency: int = 32, pool=None) -> Dict:
+    """
+    Run get_aurora_metrics for many clusters concurrently on one event loop and client pool.
+
+    Args:
+        cluster_identifiers (List[str]): Aurora cluster identifiers
+        period_hours (int): Number of hours to look back for metrics (default: 24)
+        profile (str): AWS profile of the clients (default: default profile)
+        region (str): Region of the clients (default: profile region)
+        max_concurrency (int): Clusters queried at once
+        pool: Optional lib.awsAsync.asyncClientPool
+
+    Returns:
+        Dict of {cluster_identifier: metrics} or {cluster_identifier: {'Error': message}}
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with client_scope(pool) as pool:
+        cloudwatch = await pool.get_client('cloudwatch', profile, region)
+        rds = await pool.get_client('rds', profile, region)
+
+        async def scan(cluster_identifier):
+            async with semaphore:
+                try:
+                    return await get_aurora_metrics(cluster_identifier, period_hours, cloudwatch, rds,
+                                                    raise_errors=True)
+                except Exception as e:
+                    return {'Error': str(e)}
+
+        results = await asyncio.gather(*(scan(cluster_identifier) for cluster_identifier in cluster_identifiers))
+
+    return dict(zip(cluster_identifiers, results))
+
+def main():
+    # Example usage
+    CLUSTER_IDENTIFIERS = ['your-aurora-cluster-identifier']
+
+    results = asyncio.run(get_fleet_metrics(CLUSTER_IDENTIFIERS))
+    for cluster_identifier, metrics in results.items():
+        print(f"\nMetrics for Aurora Cluster: {cluster_identifier}")
+        print("-" * 50)
+        if 'Error' in metrics:
+            print(f"Error: {metrics['Error']}")
+            continue
+        for instance_id, instance_metrics in metrics.items():
+            print(f"\nInstance: {instance_id}")
+            print(f"Max CPU Utilization: {instance_metrics['max_cpu_utilization']:.2f}%")
+            print(f"Max Connections: {int(instance_metrics['max_connections'])}")
+
+if __name__ == '__main__':
+    main()